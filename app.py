@@ -1,26 +1,148 @@
-from flask import Flask, render_template, request
+from flask import Flask, render_template, request, jsonify, g, Response
 import pandas as pd
-from thyroid.predictor import ModelResolver
-from thyroid.utils import load_object 
+from thyroid.predictor import ModelResolver, ThyroidPredictor
+from thyroid.entity.config_entity import PredictionServerConfig
+from thyroid.serving.micro_batcher import MicroBatcher
+from thyroid.serving.model_manager import ModelManager
+from thyroid.serving.prediction_cache import PredictionCache
+from thyroid.serving.shadow import ShadowScorer
+from thyroid.serving.drift_monitor import DriftMonitor
+from thyroid.serving.metrics import MetricsRegistry, StageTimer, BATCH_SIZE_BUCKETS
 from thyroid.logger import logging
 from thyroid.exception import ThyroidException
 import os, sys
+import time
 
 app = Flask(__name__)
+server_config = PredictionServerConfig()
 
-# path for latest transformer , model and target encoder
+# loading the latest transformer, model and target encoder, newer versions are picked up in the background
 model_resolver = ModelResolver()
-transformer_path = model_resolver.get_latest_transformer_path()
-logging.info(f"Transformer path: {transformer_path}")
-model_path = model_resolver.get_latest_model_path()
-logging.info(f"model_path: {model_path} ")
-target_encoder_path = model_resolver.get_latest_target_encoder_path()
+model_manager = ModelManager(model_resolver=model_resolver, poll_interval=server_config.model_reload_interval)
+model_manager.load_latest()
 
+# metrics exported on /metrics in the Prometheus text format, merged over the gunicorn workers
+metrics = MetricsRegistry(multiprocess_dir=server_config.metrics_multiprocess_dir,
+                          sync_interval=server_config.metrics_sync_interval)
+request_duration = metrics.histogram("thyroid_request_duration_seconds", "Request latency",
+                                     ["endpoint", "model_version"])
+stage_duration = metrics.histogram("thyroid_stage_duration_seconds", "Latency of each stage of the inference path",
+                                   ["endpoint", "stage", "model_version"])
+requests_total = metrics.counter("thyroid_requests_total", "Requests handled",
+                                 ["endpoint", "status", "model_version"])
+request_errors = metrics.counter("thyroid_request_errors_total", "Requests answered with an error status",
+                                 ["endpoint", "status", "model_version"])
+batch_size = metrics.histogram("thyroid_batch_size_records", "Records scored in one call of the model",
+                               ["source", "model_version"], buckets=BATCH_SIZE_BUCKETS)
+shadow_latency = metrics.histogram("thyroid_shadow_record_latency_seconds", "Prediction latency per record of the served and the shadow model",
+                                   ["role", "model_version"])
 
-# loading the transformer, model and target encoder
-transformer = load_object(file_path=transformer_path)
-model = load_object(file_path=model_path)
-target_encoder = load_object(file_path=target_encoder_path)
+# optional candidate version scored off the request path, its predictions are only recorded
+shadow_scorer = None
+if server_config.shadow_model_version is not None:
+    try:
+        shadow_predictor = ThyroidPredictor.from_model_dir(
+            model_dir=os.path.join(model_resolver.model_registery, server_config.shadow_model_version),
+            model_resolver=model_resolver)
+        shadow_predictor.set_num_threads(1)
+        shadow_predictor.warm_up()
+        shadow_scorer = ShadowScorer(predictor=shadow_predictor, max_queue_size=server_config.shadow_queue_size,
+                                     sample_rate=server_config.shadow_sample_rate,
+                                     observe=lambda role, version, seconds: shadow_latency.observe(seconds, role, version))
+    except Exception as e:
+        logging.info(f"Shadow model version [{server_config.shadow_model_version}] could not be loaded: {e}")
+
+# histograms of the live inputs per time window, compared with the training split of the served version
+drift_monitor = None
+if server_config.drift_monitoring:
+    drift_monitor = DriftMonitor(model_registry=model_resolver.model_registery,
+                                 window_seconds=server_config.drift_window_seconds,
+                                 n_windows=server_config.drift_windows,
+                                 max_queue_size=server_config.drift_queue_size,
+                                 sample_rate=server_config.drift_sample_rate,
+                                 psi_threshold=server_config.drift_psi_threshold,
+                                 min_records=server_config.drift_min_records)
+
+def served_model_version() -> str:
+    return model_manager.model_version or "none"
+
+def stage_observer(endpoint:str):
+    return lambda stage, seconds: stage_duration.observe(seconds, endpoint, stage, served_model_version())
+
+def score(predictor:ThyroidPredictor, input_df:pd.DataFrame, source:str):
+    # every scored request or micro batch also goes to the shadow model, if any
+    batch_size.observe(len(input_df), source, predictor.model_version)
+    start = time.perf_counter()
+    predictions = predictor.predict(input_df, observe=stage_observer(source))
+    if shadow_scorer is not None:
+        shadow_scorer.submit(input_df, predictions, time.perf_counter() - start, predictor.model_version)
+    return predictions
+
+def score_micro_batch(input_df:pd.DataFrame):
+    # the version is read from the predictor that scores the batch, it may have been swapped while queued
+    predictor = model_manager.predictor
+    return predictor.model_version, score(predictor, input_df, "micro_batch")
+
+# optional coalescing of concurrent single record predictions
+micro_batcher = None
+if server_config.micro_batching:
+    micro_batcher = MicroBatcher(predict_fn=score_micro_batch,
+                                max_batch_size=server_config.micro_batch_max_size,
+                                max_wait_ms=server_config.micro_batch_window_ms)
+
+# cache of single record predictions
+prediction_cache = None
+if server_config.prediction_cache_size > 0:
+    prediction_cache = PredictionCache(max_size=server_config.prediction_cache_size,
+                                       ttl_seconds=server_config.prediction_cache_ttl)
+
+def collect_serving_metrics():
+    version = served_model_version()
+    samples = [("thyroid_model_info", "gauge", "Model version served by this worker",
+                [({"model_version": version, "pid": os.getpid()}, 1)])]
+    if prediction_cache is not None:
+        stats = prediction_cache.stats()
+        for name in ["hits", "misses", "evictions", "expirations", "invalidations"]:
+            samples.append((f"thyroid_prediction_cache_{name}_total", "counter", f"Prediction cache {name}",
+                            [({"model_version": version}, stats[name])]))
+        samples.append(("thyroid_prediction_cache_size", "gauge", "Entries in the prediction cache",
+                        [({"model_version": version}, stats["size"])]))
+    if shadow_scorer is not None:
+        stats = shadow_scorer.stats()
+        labels = {"model_version": version, "shadow_model_version": stats["shadow_model_version"]}
+        for name in ["submitted", "dropped", "errors", "records", "disagreements"]:
+            samples.append((f"thyroid_shadow_{name}_total", "counter", f"Shadow scoring {name}", [(labels, stats[name])]))
+        samples.append(("thyroid_shadow_queue_size", "gauge", "Requests waiting for the shadow model", [(labels, stats["queued"])]))
+    if drift_monitor is not None:
+        stats = drift_monitor.stats()
+        for name in ["dropped", "records", "unmonitored"]:
+            samples.append((f"thyroid_drift_{name}_total", "counter", f"Drift monitoring {name}",
+                            [({"model_version": version}, stats[name])]))
+        # PSI of the last closed window, the open window is still filling up
+        if stats["windows"]:
+            window = stats["windows"][0]
+            samples.append(("thyroid_feature_drift_psi", "gauge", "PSI of each feature in the last closed window",
+                            [({"model_version": window["model_version"], "feature": feature}, result["psi"])
+                             for feature, result in window["features"].items() if result["psi"] is not None]))
+    return samples
+
+metrics.register_collector(collect_serving_metrics)
+
+@app.before_request
+def start_model_reloader():
+    g.request_start = time.perf_counter()
+    model_manager.start()
+
+@app.after_request
+def record_request_metrics(response):
+    endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    version = served_model_version()
+    request_duration.observe(time.perf_counter() - g.get("request_start", time.perf_counter()), endpoint, version)
+    requests_total.inc(endpoint, str(response.status_code), version)
+    if response.status_code >= 400:
+        request_errors.inc(endpoint, str(response.status_code), version)
+    response.headers["X-Model-Version"] = version
+    return response
 
 @app.route("/", methods=['GET','POST'])
 def home():
@@ -29,6 +151,8 @@ def home():
 @app.route('/predict', methods=['POST','GET'])
 def predict():
     try:
+        timer = StageTimer(observe=stage_observer("/predict"))
+
         # Extract the form data
         age = int(request.form.get('age'))
         sex = request.form.get('sex')
@@ -52,35 +176,58 @@ def predict():
         FTI = float(request.form.get('FTI'))
         referral_source = request.form.get('referral_source')
 
-        # Create a Pandas DataFrame from the form data
-        data = pd.DataFrame({
-            'age': [age],
-            'sex': [sex],
-            'on_thyroxine': [on_thyroxine],
-            'query_on_thyroxine': [query_on_thyroxine],
-            'on_antithyroid_medication': [on_antithyroid_medication],
-            'sick': [sick],
-            'pregnant': [pregnant],
-            'thyroid_surgery': [thyroid_surgery],
-            'I131_treatment': [I131_treatment],
-            'query_hypothyroid': [query_hypothyroid],
-            "query_hyperthyroid":[query_hyperthyroid],
-            'lithium': [lithium],
-            'goitre': [goitre],
-            'tumor': [tumor],
-            'psych': [psych],
-            'hypopituitary': [hypopituitary],
-            'T3': [T3],
-            'TT4': [TT4],
-            'T4U': [T4U],
-            'FTI': [FTI],
-            'referral_source': [referral_source]
-        })
+        # Collect the form data
+        record = {
+            'age': age,
+            'sex': sex,
+            'on_thyroxine': on_thyroxine,
+            'query_on_thyroxine': query_on_thyroxine,
+            'on_antithyroid_medication': on_antithyroid_medication,
+            'sick': sick,
+            'pregnant': pregnant,
+            'thyroid_surgery': thyroid_surgery,
+            'I131_treatment': I131_treatment,
+            'query_hypothyroid': query_hypothyroid,
+            "query_hyperthyroid":query_hyperthyroid,
+            'lithium': lithium,
+            'goitre': goitre,
+            'tumor': tumor,
+            'psych': psych,
+            'hypopituitary': hypopituitary,
+            'T3': T3,
+            'TT4': TT4,
+            'T4U': T4U,
+            'FTI': FTI,
+            'referral_source': referral_source
+        }
+        timer.lap("parse_form")
         if request.method == 'POST':
-            input_arr = transformer.transform(data)
-            y_pred = model.predict(input_arr)
-            prediction = target_encoder.inverse_transform(y_pred)
-            return render_template('index.html', prediction=prediction)
+            # repeated feature vectors are answered from the cache of the served model version
+            predictor = model_manager.predictor
+            if drift_monitor is not None:
+                drift_monitor.submit([record], predictor.model_version)
+            cache_key = PredictionCache.make_key(record)
+            prediction = None
+            if prediction_cache is not None:
+                prediction = prediction_cache.get(predictor.model_version, cache_key)
+                timer.lap("cache_lookup")
+
+            if prediction is None:
+                # Create a Pandas DataFrame from the form data
+                data = pd.DataFrame({column: [value] for column, value in record.items()})
+                timer.lap("build_dataframe")
+                if micro_batcher is not None:
+                    model_version, prediction = micro_batcher.predict(data, timeout=server_config.micro_batch_timeout)
+                else:
+                    model_version, prediction = predictor.model_version, score(predictor, data, "/predict")
+                timer.lap("score")
+                if prediction_cache is not None:
+                    # cached under the version that scored the record, not the one read before queuing
+                    prediction_cache.put(model_version, cache_key, prediction)
+
+            response = render_template('index.html', prediction=prediction)
+            timer.lap("render_template")
+            return response
         else:
             return render_template('index.html', prediction="")
 
@@ -88,6 +235,71 @@ def predict():
     except Exception as e:
         raise ThyroidException(e, sys)
 
+@app.route('/predict/batch', methods=['POST'])
+def predict_batch():
+    try:
+        timer = StageTimer(observe=stage_observer("/predict/batch"))
+
+        # accepts either a list of records or {"records": [...]}
+        payload = request.get_json(silent=True)
+        records = payload.get("records") if isinstance(payload, dict) else payload
+        timer.lap("parse_json")
+
+        # the same predictor is used for the whole request even if a new version is swapped in
+        predictor = model_manager.predictor
+        input_df, errors = predictor.validate_records(records, max_records=server_config.max_batch_records)
+        timer.lap("validate")
+        if len(errors) > 0:
+            return jsonify({"errors": errors}), 400
+        if drift_monitor is not None:
+            drift_monitor.submit(input_df, predictor.model_version)
+
+        predictions = score(predictor, input_df, "/predict/batch")
+        timer.lap("score")
+        response = jsonify({
+            "model_version": predictor.model_version,
+            "count": len(predictions),
+            "predictions": predictions.tolist()
+        })
+        timer.lap("serialize")
+        return response
+
+    except Exception as e:
+        raise ThyroidException(e, sys)
+
+@app.route('/version', methods=['GET'])
+def version():
+    # reports the model version served by this worker, 503 until a model is loaded
+    status = model_manager.status()
+    return jsonify(status), (200 if status["ready"] else 503)
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    # metrics of every worker when they share a multiprocess directory, else of the worker which serves the scrape
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+@app.route('/shadow', methods=['GET'])
+def shadow():
+    # disagreement rate and latency difference of the shadow model in this worker
+    if shadow_scorer is None:
+        return jsonify({"enabled": False})
+    return jsonify(dict(enabled=True, serving_model_version=served_model_version(), **shadow_scorer.stats()))
+
+@app.route('/drift', methods=['GET'])
+def drift():
+    # PSI of every input feature per time window against the training split of the served version
+    if drift_monitor is None:
+        return jsonify({"enabled": False})
+    return jsonify(dict(enabled=True, serving_model_version=served_model_version(), **drift_monitor.stats()))
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    # hit, miss and eviction counters of this worker, used to size the cache
+    if prediction_cache is None:
+        return jsonify({"enabled": False})
+    return jsonify(dict(enabled=True, **prediction_cache.stats()))
+
 if __name__=="__main__":
+    model_manager.set_num_threads(server_config.predict_num_threads)
     app.run(host="0.0.0.0", port=8080)
 
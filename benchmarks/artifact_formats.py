@@ -0,0 +1,96 @@
+"""
+On-disk size and per-stage read time of the pipeline artifacts in each format.
+
+The records of hypothyroid.csv are repeated up to --records rows, split 80/20 like
+DataIngestion does and written as csv, parquet and arrow with thyroid.artifact_io. Each
+stage then reads the splits the way its component does:
+
+    validation      train and test, every column
+    transformation  train and test, every column
+    evaluation      test, the transformer's feature columns and, separately, the target
+
+    python benchmarks/artifact_formats.py --records 500000 --repeat 3
+"""
+import statistics
+import tempfile
+import argparse
+import json
+import time
+import os, sys
+
+import pandas as pd
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+from thyroid.artifact_io import ARTIFACT_FORMAT_EXTENSIONS, read_artifact, write_artifact
+from thyroid.config import TARGET_COLUMN, NUMERICAL_COLUMN, CATEGORICAL_COLUMN
+
+
+def make_dataset(data_file_path:str, n_records:int) -> pd.DataFrame:
+    # "?" is read as nan, the same values the ingestion hands to the next stages
+    df = pd.read_csv(data_file_path, na_values="?")
+    return df.iloc[np.arange(n_records) % len(df)].reset_index(drop=True)
+
+
+def timed(function, repeat:int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--data", default=os.path.join(ROOT_DIR, "hypothyroid.csv"))
+    parser.add_argument("--output", default=None, help="json file for the results")
+    args = parser.parse_args()
+
+    df = make_dataset(args.data, args.records)
+    n_test = int(len(df) * 0.2)
+    train_df, test_df = df.iloc[n_test:], df.iloc[:n_test]
+    feature_columns = [column for column in df.columns if column in NUMERICAL_COLUMN + CATEGORICAL_COLUMN]
+
+    results = {}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for file_format, extension in ARTIFACT_FORMAT_EXTENSIONS.items():
+            train_path = os.path.join(temp_dir, f"train{extension}")
+            test_path = os.path.join(temp_dir, f"test{extension}")
+
+            def write():
+                write_artifact(train_df, train_path)
+                write_artifact(test_df, test_path)
+
+            def read_all():
+                read_artifact(train_path)
+                read_artifact(test_path)
+
+            def read_evaluation():
+                read_artifact(test_path, columns=feature_columns)
+                read_artifact(test_path, columns=[TARGET_COLUMN])
+
+            results[file_format] = {
+                "ingestion_write_seconds": timed(write, args.repeat),
+                "size_mb": (os.path.getsize(train_path) + os.path.getsize(test_path)) / 1e6,
+                "validation_read_seconds": timed(read_all, args.repeat),
+                "transformation_read_seconds": timed(read_all, args.repeat),
+                "evaluation_read_seconds": timed(read_evaluation, args.repeat),
+            }
+
+    print(f"{'format':<8} {'size':>9} {'write':>8} {'validation':>11} {'transform':>10} {'evaluation':>11}")
+    for file_format, result in results.items():
+        print(f"{file_format:<8} {result['size_mb']:>7.1f}MB {result['ingestion_write_seconds']:>7.3f}s "
+              f"{result['validation_read_seconds']:>10.3f}s {result['transformation_read_seconds']:>9.3f}s "
+              f"{result['evaluation_read_seconds']:>10.3f}s")
+
+    if args.output:
+        with open(args.output, "w") as file_obj:
+            json.dump({"args": vars(args), "results": results}, file_obj, indent=2)
+
+
+if __name__ == "__main__":
+    main()
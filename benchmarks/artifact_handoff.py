@@ -0,0 +1,138 @@
+"""
+Disk reads and wall-clock time of a training pipeline run with and without the in-memory
+artifact handoff.
+
+The pipeline of main.py (ingestion from a mongomock collection filled with
+hypothyroid.csv, validation, transformation, training, evaluation against a copy of
+saved_models and pushing) runs in a scratch directory twice:
+
+    disk      every component gets its own ArtifactStore, each stage reads from disk
+    memory    one ArtifactStore shared by the run, as main.py does
+
+Evaluation may reject the candidate, the benchmark pushes it anyway so both runs do the
+same work.
+
+    python benchmarks/artifact_handoff.py --records 20000
+"""
+import tempfile
+import argparse
+import shutil
+import json
+import time
+import os, sys
+
+import pandas as pd
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+from thyroid.artifact_store import ArtifactStore
+from thyroid.config import CATEGORICAL_COLUMN, TARGET_COLUMN
+from thyroid.entity import config_entity
+from thyroid.utils import load_object
+
+
+def make_collection(data_file_path:str, n_records:int, columns:list):
+    import mongomock
+
+    # the columns and the complete categoricals the registry transformers were fitted on
+    df = pd.read_csv(data_file_path, na_values="?")[columns].dropna(subset=CATEGORICAL_COLUMN)
+    df = df.iloc[np.arange(n_records) % len(df)]
+    collection = mongomock.MongoClient()["thyroid-deases"]["thyroid"]
+    collection.insert_many(df.astype(object).where(df.notna(), None).to_dict("records"))
+    return collection, df
+
+
+def run_pipeline(collection, shared:bool) -> dict:
+    from thyroid.components.data_ingestion import DataIngestion
+    from thyroid.components.data_validation import DataValidation
+    from thyroid.components.data_transformation import DataTransformation
+    from thyroid.components.model_trainer import ModelTrainer
+    from thyroid.components.model_evaluation import ModelEvaluation
+    from thyroid.components.model_pusher import ModelPusher
+
+    stores = []
+    def store():
+        if shared and stores:
+            return stores[0]
+        stores.append(ArtifactStore())
+        return stores[-1]
+
+    seconds = {}
+    def timed(stage:str, function):
+        start = time.perf_counter()
+        try:
+            return function()
+        finally:
+            seconds[stage] = time.perf_counter() - start
+
+    training_pipeline_config = config_entity.TrainingPipelineConfig()
+    data_ingestion_artifact = timed("ingestion", lambda: DataIngestion(
+        config_entity.DataIngestionConfig(training_pipeline_config), collection=collection,
+        artifact_store=store()).initiate_data_ingestion())
+    timed("validation", lambda: DataValidation(
+        config_entity.DataValidationConfig(training_pipeline_config), data_ingestion_artifact,
+        artifact_store=store()).initiate_data_validation())
+    data_transformation_artifact = timed("transformation", lambda: DataTransformation(
+        config_entity.DataTransformationConfig(training_pipeline_config), data_ingestion_artifact,
+        artifact_store=store()).initiate_data_transformation())
+    model_trainer_artifact = timed("training", lambda: ModelTrainer(
+        config_entity.ModelTrainerConfig(training_pipeline_config), data_transformation_artifact,
+        artifact_store=store()).initiate_model_trainer())
+    try:
+        timed("evaluation", lambda: ModelEvaluation(
+            config_entity.ModelEvaluationConfig(training_pipeline_config), data_ingestion_artifact,
+            data_transformation_artifact, model_trainer_artifact, artifact_store=store()).initiate_model_evaluation())
+    except Exception as e:
+        print(f"evaluation rejected the candidate, pushing anyway: {str(e)[-80:]}")
+    timed("pushing", lambda: ModelPusher(
+        config_entity.ModelPusherConfig(training_pipeline_config), data_transformation_artifact,
+        model_trainer_artifact, artifact_store=store(), data_ingestion_artifact=data_ingestion_artifact).initiate_model_pusher())
+
+    return {
+        "stage_seconds": seconds,
+        "total_seconds": sum(seconds.values()),
+        "disk_reads": sum(s.disk_reads for s in stores),
+        "disk_read_seconds": sum(s.disk_read_seconds for s in stores),
+        "memory_hits": sum(s.memory_hits for s in stores),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=20000)
+    parser.add_argument("--data", default=os.path.join(ROOT_DIR, "hypothyroid.csv"))
+    parser.add_argument("--registry", default=os.path.join(ROOT_DIR, "saved_models"))
+    parser.add_argument("--output", default=None, help="json file for the results")
+    args = parser.parse_args()
+
+    transformer_path = os.path.join(args.registry, "0", "transformer", config_entity.TRANSFORMER_OBJECT_FILE_NAME)
+    columns = list(load_object(transformer_path).feature_names_in_) + [TARGET_COLUMN]
+    collection, df = make_collection(args.data, args.records, columns)
+
+    results = {}
+    cwd = os.getcwd()
+    for name, shared in (("disk", False), ("memory", True)):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            shutil.copytree(args.registry, os.path.join(temp_dir, "saved_models"))
+            df.to_csv(os.path.join(temp_dir, "hypothyroid_cleaned.csv"), index=False)
+            os.chdir(temp_dir)
+            try:
+                results[name] = run_pipeline(collection, shared=shared)
+            finally:
+                os.chdir(cwd)
+        # the artifact directories are named by the second, keep the runs a second apart
+        time.sleep(1)
+
+    for name, result in results.items():
+        stages = " ".join(f"{stage}={value:.2f}s" for stage, value in result["stage_seconds"].items())
+        print(f"{name:<7} disk_reads={result['disk_reads']:<3} read={result['disk_read_seconds']:.3f}s "
+              f"total={result['total_seconds']:.2f}s  {stages}")
+
+    if args.output:
+        with open(args.output, "w") as file_obj:
+            json.dump({"args": vars(args), "results": results}, file_obj, indent=2)
+
+
+if __name__ == "__main__":
+    main()
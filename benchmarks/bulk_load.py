@@ -0,0 +1,105 @@
+"""
+Throughput and peak memory of loading a CSV export into a local stand-in collection.
+
+hypothyroid.csv is repeated up to --records rows into a temporary file, which is loaded
+into an empty stand-in collection twice, each run under tracemalloc:
+
+    legacy   read_csv -> json.loads(df.T.to_json()) -> one insert_many (previous data_dump.py)
+    bulk     thyroid.bulk_loader.BulkLoader, chunked read, unordered batches, --workers threads
+
+mongomock inserts in python under the GIL, so the insert side gains nothing from the
+workers here, against a mongod they overlap the round trips. mongomock also checks the
+unique index on the row keys by scanning the collection on every insert, so the default
+--stand-in null discards the documents and measures reading the file and building the
+documents only; --stand-in mongomock is meant for a few thousand records.
+
+    python benchmarks/bulk_load.py --records 100000 --workers 4
+"""
+import tracemalloc
+import tempfile
+import argparse
+import json
+import time
+import os, sys
+
+import pandas as pd
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+from thyroid.bulk_loader import BulkLoader
+
+
+class NullCollection:
+    name = "null"
+
+    def create_index(self, keys, **kwargs):
+        return keys
+
+    def insert_many(self, documents:list, ordered:bool = True):
+        from pymongo.results import InsertManyResult
+        return InsertManyResult([document.get("_id") for document in documents], acknowledged=True)
+
+
+def make_collection(stand_in:str):
+    if stand_in == "null":
+        return NullCollection()
+    import mongomock
+    return mongomock.MongoClient()["db"]["thyroid"]
+
+
+def legacy_load(collection, file_path:str) -> int:
+    df = pd.read_csv(file_path, low_memory=False)
+    df.reset_index(drop=True, inplace=True)
+    json_record = list(json.loads(df.T.to_json()).values())
+    collection.insert_many(json_record)
+    return len(json_record)
+
+
+def bulk_load(collection, file_path:str, chunk_size:int, batch_size:int, n_workers:int) -> int:
+    loader = BulkLoader(collection=collection, chunk_size=chunk_size, batch_size=batch_size, n_workers=n_workers)
+    return loader.load(file_path)["rows"]
+
+
+def measure(function, *args) -> dict:
+    tracemalloc.start()
+    start = time.perf_counter()
+    rows = function(*args)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": elapsed, "peak_mb": peak / 1e6, "rows": rows, "rows_per_second": rows / elapsed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=100000)
+    parser.add_argument("--chunk-size", type=int, default=50000)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--stand-in", choices=["mongomock", "null"], default="null")
+    parser.add_argument("--data", default=os.path.join(ROOT_DIR, "hypothyroid.csv"))
+    parser.add_argument("--output", default=None, help="json file for the results")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        file_path = os.path.join(temp_dir, "export.csv")
+        df = pd.read_csv(args.data, low_memory=False)
+        df.iloc[np.arange(args.records) % len(df)].to_csv(file_path, index=False)
+
+        results["legacy"] = measure(legacy_load, make_collection(args.stand_in), file_path)
+        results["bulk"] = measure(bulk_load, make_collection(args.stand_in), file_path,
+                                  args.chunk_size, args.batch_size, args.workers)
+
+    for name, result in results.items():
+        print(f"{name:<7} rows={result['rows']:<8} {result['rows_per_second']:>9.0f} rows/sec "
+              f"peak={result['peak_mb']:>8.1f}MB time={result['seconds']:>6.2f}s")
+
+    if args.output:
+        with open(args.output, "w") as file_obj:
+            json.dump({"args": vars(args), "results": results}, file_obj, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Peak memory and time of data validation with whole dataframes and in chunks.
+
+hypothyroid.csv is repeated up to --records rows into a base csv and into train and test
+Parquet splits in a scratch directory, then DataValidation runs under tracemalloc twice:
+
+    whole     every dataset read as one dataframe (DataValidationConfig.chunk_size None)
+    chunked   every dataset streamed --chunk-size rows at a time
+
+Both runs build the reference profile from scratch. The reports have the same keys; drift
+statistics can differ in the last digits when the base dataset is larger than a chunk,
+its quantile sketch is then merged from the chunks.
+
+    python benchmarks/chunked_validation.py --records 500000 --chunk-size 50000
+"""
+import tracemalloc
+import tempfile
+import argparse
+import json
+import time
+import os, sys
+
+import pandas as pd
+import numpy as np
+import yaml
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+from thyroid.config import NUMERICAL_COLUMN
+from thyroid.artifact_io import write_artifact
+from thyroid.entity import config_entity, artifact_entity
+
+
+def run_validation(temp_dir:str, chunk_size) -> dict:
+    from thyroid.components.data_validation import DataValidation
+
+    data_validation_config = config_entity.DataValidationConfig(config_entity.TrainingPipelineConfig(), chunk_size=chunk_size)
+    data_validation_config.base_file_path = os.path.join(temp_dir, "base.csv")
+    data_validation_config.reference_profile_path = os.path.join(temp_dir, f"reference_profile_{chunk_size}.json")
+    data_ingestion_artifact = artifact_entity.DataIngestionArtifact(
+        feature_store_file_path=os.path.join(temp_dir, "train.parquet"),
+        train_file_path=os.path.join(temp_dir, "train.parquet"), test_file_path=os.path.join(temp_dir, "test.parquet"))
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    artifact = DataValidation(data_validation_config, data_ingestion_artifact).initiate_data_validation()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    with open(artifact.report_file_path) as file_obj:
+        report = yaml.safe_load(file_obj)
+    return {"seconds": elapsed, "peak_mb": peak / 1e6, "report": report}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=500000)
+    parser.add_argument("--chunk-size", type=int, default=50000)
+    parser.add_argument("--data", default=os.path.join(ROOT_DIR, "hypothyroid.csv"))
+    parser.add_argument("--output", default=None, help="json file for the results")
+    args = parser.parse_args()
+
+    results = {}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        df = pd.read_csv(args.data, low_memory=False)
+        df = df.iloc[np.arange(args.records) % len(df)]
+        df.to_csv(os.path.join(temp_dir, "base.csv"), index=False)
+        df = df.replace({'?':np.NAN}).astype({column: np.float64 for column in NUMERICAL_COLUMN})
+        train_size = int(len(df) * 0.8)
+        write_artifact(df.iloc[:train_size], os.path.join(temp_dir, "train.parquet"))
+        write_artifact(df.iloc[train_size:], os.path.join(temp_dir, "test.parquet"))
+        del df
+
+        os.chdir(temp_dir)
+        try:
+            results["whole"] = run_validation(temp_dir, chunk_size=None)
+            # the artifact directories are named by the second, keep the runs a second apart
+            time.sleep(1)
+            results["chunked"] = run_validation(temp_dir, chunk_size=args.chunk_size)
+        finally:
+            os.chdir(cwd)
+
+    same_keys = sorted(results["whole"]["report"]) == sorted(results["chunked"]["report"])
+    for name, result in results.items():
+        print(f"{name:<8} peak={result['peak_mb']:>8.1f}MB time={result['seconds']:>6.2f}s")
+    print(f"same report keys: {same_keys}")
+
+    if args.output:
+        with open(args.output, "w") as file_obj:
+            json.dump({"args": vars(args), "same_report_keys": same_keys,
+                       "results": {name: {key: value for key, value in result.items() if key != "report"}
+                                   for name, result in results.items()}}, file_obj, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Time of the drift checks of one validation run as the base dataset grows.
+
+hypothyroid.csv is repeated up to each of --base-records rows into a temporary base file,
+the current dataset is --records rows of it. For every base size:
+
+    legacy    read and clean the base file, ks_2samp per numerical column (previous
+              DataValidation.data_drift)
+    profile   build the reference profile once (first run), then every later run loads the
+              profile and tests all columns in one pass (thyroid.drift.drift_report)
+
+    python benchmarks/drift.py --base-records 3000 30000 300000
+"""
+import tempfile
+import argparse
+import json
+import time
+import os, sys
+
+import pandas as pd
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+from thyroid.config import NUMERICAL_COLUMN, CATEGORICAL_COLUMN
+from thyroid import drift
+
+
+def legacy_drift(base_file_path:str, current_df:pd.DataFrame) -> dict:
+    from scipy.stats import ks_2samp
+
+    base_df = pd.read_csv(base_file_path)
+    base_df.replace({'?':np.NAN}, inplace=True)
+    report = {}
+    for column in NUMERICAL_COLUMN:
+        base_data = pd.to_numeric(base_df[column], errors="coerce").dropna()
+        current_data = pd.to_numeric(current_df[column], errors="coerce").dropna()
+        report[column] = float(ks_2samp(base_data, current_data).pvalue)
+    return report
+
+
+def profile_drift(profile_path:str, current_df:pd.DataFrame) -> dict:
+    return drift.drift_report(drift.load_reference_profile(profile_path), current_df)
+
+
+def build_profile(base_file_path:str, profile_path:str, sample_size:int):
+    base_df = pd.read_csv(base_file_path)
+    base_df.replace({'?':np.NAN}, inplace=True)
+    profile = drift.build_reference_profile(base_df, NUMERICAL_COLUMN, CATEGORICAL_COLUMN, sample_size=sample_size)
+    drift.save_reference_profile(profile, profile_path)
+
+
+def timed(function, *args) -> float:
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-records", type=int, nargs="+", default=[3000, 30000, 300000])
+    parser.add_argument("--records", type=int, default=3000)
+    parser.add_argument("--sample-size", type=int, default=10000)
+    parser.add_argument("--data", default=os.path.join(ROOT_DIR, "hypothyroid.csv"))
+    parser.add_argument("--output", default=None, help="json file for the results")
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.data, low_memory=False)
+    current_df = df.sample(n=args.records, replace=len(df) < args.records, random_state=0).replace({'?':np.NAN})
+
+    results = {}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        base_file_path = os.path.join(temp_dir, "base.csv")
+        profile_path = os.path.join(temp_dir, "reference_profile.json")
+        for n_records in args.base_records:
+            df.iloc[np.arange(n_records) % len(df)].to_csv(base_file_path, index=False)
+            results[n_records] = {
+                "legacy_seconds": timed(legacy_drift, base_file_path, current_df),
+                "build_profile_seconds": timed(build_profile, base_file_path, profile_path, args.sample_size),
+                "profile_seconds": timed(profile_drift, profile_path, current_df),
+                "profile_kb": os.path.getsize(profile_path) / 1e3,
+            }
+
+    for n_records, result in results.items():
+        print(f"base={n_records:<8} legacy={result['legacy_seconds']:.3f}s "
+              f"profile={result['profile_seconds']:.3f}s (build once {result['build_profile_seconds']:.3f}s, "
+              f"{result['profile_kb']:.0f}KB)")
+
+    if args.output:
+        with open(args.output, "w") as file_obj:
+            json.dump({"args": vars(args), "results": results}, file_obj, indent=2)
+
+
+if __name__ == "__main__":
+    main()
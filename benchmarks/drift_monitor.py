@@ -0,0 +1,92 @@
+"""
+Cost per request and memory of the online drift monitor.
+
+A reference profile is built from hypothyroid.csv into a scratch registry version, then
+--requests single record requests sampled from the same file are fed to a DriftMonitor:
+
+    submit    time the request thread spends handing a record to the monitor
+    observe   time the background thread spends adding it to the window histograms
+    memory    traced memory held by the monitor after every --requests / 5 requests,
+              flat when the cost does not grow with the traffic
+
+The clock of observe advances one second per request, so the windows keep rolling.
+
+    python benchmarks/drift_monitor.py --requests 20000 --window-seconds 60
+"""
+import tracemalloc
+import tempfile
+import argparse
+import json
+import time
+import os, sys
+
+import pandas as pd
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+from thyroid.config import NUMERICAL_COLUMN, CATEGORICAL_COLUMN
+from thyroid.entity.config_entity import REFERENCE_PROFILE_FILE_NAME
+from thyroid.serving.drift_monitor import DriftMonitor
+from thyroid import drift
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--window-seconds", type=float, default=60)
+    parser.add_argument("--data", default=os.path.join(ROOT_DIR, "hypothyroid.csv"))
+    parser.add_argument("--output", default=None, help="json file for the results")
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.data, na_values="?")
+    records = df.sample(n=args.requests, replace=True, random_state=0).to_dict("records")
+
+    with tempfile.TemporaryDirectory() as registry_dir:
+        os.makedirs(os.path.join(registry_dir, "0"))
+        profile = drift.build_reference_profile(df, NUMERICAL_COLUMN, CATEGORICAL_COLUMN, sample_size=1000)
+        drift.save_reference_profile(profile, os.path.join(registry_dir, "0", REFERENCE_PROFILE_FILE_NAME))
+
+        monitor = DriftMonitor(model_registry=registry_dir, window_seconds=args.window_seconds,
+                               max_queue_size=args.requests)
+        start = time.perf_counter()
+        for record in records:
+            monitor.submit([record], "0")
+        submit_seconds = time.perf_counter() - start
+
+        monitor = DriftMonitor(model_registry=registry_dir, window_seconds=args.window_seconds)
+        monitor.observe([records[0]], "0", now=0.0)
+        start = time.perf_counter()
+        for index, record in enumerate(records):
+            monitor.observe([record], "0", now=float(index))
+        observe_seconds = time.perf_counter() - start
+        stats = monitor.stats()
+
+        # a second pass under tracemalloc, which slows every allocation down
+        monitor = DriftMonitor(model_registry=registry_dir, window_seconds=args.window_seconds)
+        monitor.observe([records[0]], "0", now=0.0)
+        tracemalloc.start()
+        memory_mb = []
+        for index, record in enumerate(records):
+            monitor.observe([record], "0", now=float(index))
+            if (index + 1) % max(args.requests // 5, 1) == 0:
+                memory_mb.append(tracemalloc.get_traced_memory()[0] / 1e6)
+        tracemalloc.stop()
+
+    results = {
+        "submit_us": submit_seconds / args.requests * 1e6,
+        "observe_us": observe_seconds / args.requests * 1e6,
+        "memory_mb": memory_mb,
+        "closed_windows": len(stats["windows"]),
+        "max_psi_last_window": stats["windows"][0]["max_psi"] if stats["windows"] else None,
+    }
+    print(f"submit={results['submit_us']:.1f}us/request observe={results['observe_us']:.1f}us/request "
+          f"windows kept={results['closed_windows']} memory={' '.join(f'{value:.3f}' for value in memory_mb)}MB")
+
+    if args.output:
+        with open(args.output, "w") as file_obj:
+            json.dump({"args": vars(args), "results": results}, file_obj, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Cold start time of the entry points of this repository.
+
+Every entry point is imported in a fresh interpreter several times and the wall time of
+the import is reported, together with the slowest modules from one `python -X importtime`
+run. Importing app.py includes loading the latest model, which is what a server pays at
+start. With --budget the run fails when the median import time of an entry point exceeds
+its budget in seconds.
+
+    python benchmarks/import_time.py --repeat 5 --output import_time.json
+    python benchmarks/import_time.py --budget benchmarks/import_budget.json
+"""
+import subprocess
+import statistics
+import argparse
+import json
+import os, sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENTRY_POINTS = {
+    "app": "import app",
+    "main": "import main",
+    "batch_prediction": "import thyroid.pipeline.batch_prediction",
+}
+
+TIMER = "import time; start = time.perf_counter(); {statement}; print(time.perf_counter() - start)"
+
+
+def time_import(statement:str) -> float:
+    result = subprocess.run([sys.executable, "-c", TIMER.format(statement=statement)], cwd=ROOT_DIR,
+                            capture_output=True, text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def slowest_modules(statement:str, top:int = 10) -> list:
+    """
+    return [(module, cumulative seconds)] of the top level imports with the largest cumulative time
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", statement], cwd=ROOT_DIR,
+                            capture_output=True, text=True, check=True)
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # only modules imported directly by the entry point or its package, not their dependencies
+        if len(name) - len(name.lstrip()) <= 3:
+            modules.append((name.strip(), int(cumulative) / 1e6))
+    return sorted(modules, key=lambda module: module[1], reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entry-points", nargs="+", default=list(ENTRY_POINTS), choices=list(ENTRY_POINTS))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget", default=None, help="json file with the allowed median seconds per entry point")
+    parser.add_argument("--output", default=None, help="json file for the results")
+    args = parser.parse_args()
+
+    results = {}
+    for entry_point in args.entry_points:
+        statement = ENTRY_POINTS[entry_point]
+        # the first run warms the os page cache, it is not measured
+        time_import(statement)
+        timings = [time_import(statement) for _ in range(args.repeat)]
+        results[entry_point] = {
+            "median_s": statistics.median(timings),
+            "min_s": min(timings),
+            "max_s": max(timings),
+            "slowest_modules": slowest_modules(statement),
+        }
+        print(f"{entry_point:<18} median={results[entry_point]['median_s']:.3f}s "
+              f"min={results[entry_point]['min_s']:.3f}s max={results[entry_point]['max_s']:.3f}s")
+        for module, seconds in results[entry_point]["slowest_modules"][:5]:
+            print(f"    {module:<40} {seconds:.3f}s")
+
+    if args.output:
+        with open(args.output, "w") as file_obj:
+            json.dump(results, file_obj, indent=2)
+
+    if args.budget:
+        with open(args.budget) as file_obj:
+            budget = json.load(file_obj)
+        over_budget = [entry_point for entry_point, result in results.items()
+                       if entry_point in budget and result["median_s"] > budget[entry_point]]
+        for entry_point in over_budget:
+            print(f"{entry_point}: {results[entry_point]['median_s']:.3f}s is over the budget of {budget[entry_point]:.3f}s")
+        if over_budget:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Time, peak memory and error of the imputation strategies as the number of rows grows.
+
+The feature matrix DataTransformation builds from hypothyroid.csv (the columns and complete
+categoricals the registry transformers were fitted on) is repeated up to each of --rows
+rows, with the measured values jittered by a few percent so the copies are not duplicates.
+Every row keeps the missing values of its source row, and --hide of the measured values
+that are present are hidden as well. Each strategy of thyroid/imputation.py then imputes
+the matrix under tracemalloc:
+
+    seconds, peak_mb   time and peak traced memory of the imputation
+    mae                mean absolute error on the hidden values
+
+knn (all pairs) is skipped above --knn-max-rows, its time grows with the square of the rows.
+
+    python benchmarks/imputation.py --rows 10000 100000 1000000
+"""
+import tracemalloc
+import argparse
+import json
+import time
+import os, sys
+
+import pandas as pd
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+from thyroid.config import CATEGORICAL_COLUMN, NUMERICAL_COLUMN, TARGET_COLUMN
+from thyroid.components.data_transformation import DataTransformation
+from thyroid.imputation import IMPUTATION_STRATEGIES, impute
+from thyroid.entity import config_entity
+from thyroid.utils import load_object
+
+
+def make_matrix(data_file_path:str, registry_dir:str, n_rows:int, hide:float, seed:int = 0):
+    transformer_path = os.path.join(registry_dir, "0", "transformer", config_entity.TRANSFORMER_OBJECT_FILE_NAME)
+    columns = list(load_object(transformer_path).feature_names_in_)
+    df = pd.read_csv(data_file_path, na_values="?")[columns + [TARGET_COLUMN]].dropna(subset=CATEGORICAL_COLUMN)
+    X = DataTransformation.get_data_transformer_object().fit(df[columns]).transform(df[columns])
+    y = df[TARGET_COLUMN].to_numpy()
+
+    # the measured values are passed through as the last columns of the matrix
+    measured = np.arange(X.shape[1] - len([column for column in columns if column in NUMERICAL_COLUMN]), X.shape[1])
+    rng = np.random.default_rng(seed)
+    rows = np.arange(n_rows) % len(X)
+    X, y = X[rows], y[rows]
+    X[:, measured] *= rng.lognormal(0, 0.03, size=(n_rows, len(measured)))
+
+    hidden = np.zeros(X.shape, dtype=bool)
+    hidden[:, measured] = ~np.isnan(X[:, measured]) & (rng.random((n_rows, len(measured))) < hide)
+    truth = X[hidden]
+    X[hidden] = np.nan
+    return X, y, hidden, truth
+
+
+def measure(X:np.ndarray, y:np.ndarray, hidden:np.ndarray, truth:np.ndarray, strategy:str) -> dict:
+    tracemalloc.start()
+    start = time.perf_counter()
+    imputed = impute(X, y, strategy=strategy)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": elapsed, "peak_mb": peak / 1e6, "mae": float(np.abs(imputed[hidden] - truth).mean())}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--strategies", nargs="+", default=list(IMPUTATION_STRATEGIES), choices=IMPUTATION_STRATEGIES)
+    parser.add_argument("--hide", type=float, default=0.05)
+    parser.add_argument("--knn-max-rows", type=int, default=20000)
+    parser.add_argument("--data", default=os.path.join(ROOT_DIR, "hypothyroid.csv"))
+    parser.add_argument("--registry", default=os.path.join(ROOT_DIR, "saved_models"))
+    parser.add_argument("--output", default=None, help="json file for the results")
+    args = parser.parse_args()
+
+    results = {}
+    for n_rows in args.rows:
+        X, y, hidden, truth = make_matrix(args.data, args.registry, n_rows, args.hide)
+        results[n_rows] = {}
+        for strategy in args.strategies:
+            if strategy == "knn" and n_rows > args.knn_max_rows:
+                continue
+            result = results[n_rows][strategy] = measure(X, y, hidden, truth, strategy)
+            print(f"rows={n_rows:<8} {strategy:<13} time={result['seconds']:>8.2f}s "
+                  f"peak={result['peak_mb']:>8.1f}MB mae={result['mae']:.3f}", flush=True)
+
+    if args.output:
+        with open(args.output, "w") as file_obj:
+            json.dump({"args": vars(args), "results": results}, file_obj, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""
+Load test and latency benchmark for the prediction service.
+
+Traffic is either replayed from a JSON lines file, one request per line:
+
+    {"method": "POST", "path": "/predict", "form": {"age": 41, "sex": "F", ...}}
+    {"method": "POST", "path": "/predict/batch", "json": [{"age": 41, ...}, ...]}
+
+or sampled from hypothyroid.csv (--synthetic). It is sent either to the Flask app in
+this process (--target inprocess) or to a running server (--target http://host:port),
+once per concurrency level. Throughput and p50/p95/p99 latency are reported per
+endpoint and model version (X-Model-Version header) and saved as JSON. A previous
+result file can be passed as --baseline to fail the run on a latency regression.
+
+    python benchmarks/load_test.py --synthetic 2000 --concurrency 1 8 32 --output run.json
+    python benchmarks/load_test.py --traffic traffic.jsonl --target http://localhost:8080 --baseline run.json
+"""
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode, urlparse
+from datetime import datetime
+import http.client
+import subprocess
+import itertools
+import threading
+import argparse
+import platform
+import json
+import time
+import os, sys
+
+import pandas as pd
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+from thyroid.config import NUMERICAL_COLUMN, CATEGORICAL_COLUMN
+
+
+def load_traffic(file_path:str) -> list:
+    with open(file_path) as file_obj:
+        return [json.loads(line) for line in file_obj if line.strip()]
+
+
+def synthetic_traffic(file_path:str, n_requests:int, endpoint:str = "/predict", batch_size:int = 100, seed:int = 42) -> list:
+    df = pd.read_csv(file_path).replace("?", np.nan)
+    df = df[NUMERICAL_COLUMN + CATEGORICAL_COLUMN].dropna()
+    df["age"] = df["age"].astype(float).astype(int)
+    rng = np.random.default_rng(seed)
+    if endpoint == "/predict":
+        records = df.iloc[rng.integers(0, len(df), n_requests)].to_dict("records")
+        return [{"method": "POST", "path": "/predict", "form": record} for record in records]
+    return [{"method": "POST", "path": endpoint, "json": df.iloc[rng.integers(0, len(df), batch_size)].to_dict("records")}
+            for _ in range(n_requests)]
+
+
+class HttpTarget:
+    """
+    Sends requests over keep-alive connections, one per client thread
+    """
+    def __init__(self, url:str):
+        parsed = urlparse(url)
+        self.host, self.port = parsed.hostname, parsed.port or 80
+        self._local = threading.local()
+
+    def send(self, item:dict):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = http.client.HTTPConnection(self.host, self.port, timeout=60)
+        if "json" in item:
+            body, content_type = json.dumps(item["json"]), "application/json"
+        else:
+            body, content_type = urlencode(item.get("form", {})), "application/x-www-form-urlencoded"
+        try:
+            connection.request(item.get("method", "POST"), item["path"], body=body, headers={"Content-Type": content_type})
+            response = connection.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            self._local.connection = None
+            return 599, "none"
+        return response.status, response.getheader("X-Model-Version", "none")
+
+
+class InProcessTarget:
+    """
+    Calls the Flask app of this repository through its test client
+    """
+    def __init__(self):
+        os.chdir(ROOT_DIR)
+        import app
+        self.app = app.app
+        self._local = threading.local()
+
+    def send(self, item:dict):
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        kwargs = {"json": item["json"]} if "json" in item else {"data": item.get("form", {})}
+        try:
+            response = client.open(item["path"], method=item.get("method", "POST"), **kwargs)
+        except Exception:
+            return 500, "none"
+        return response.status_code, response.headers.get("X-Model-Version", "none")
+
+
+def run_level(target, traffic:list, concurrency:int, n_requests:int = None, duration:float = None) -> tuple:
+    """
+    Replays the traffic with the given number of concurrent clients until n_requests
+    were sent or duration seconds passed, traffic is cycled when it runs out
+    ===========================================================================================
+    return (list of (endpoint, model_version, status, latency), elapsed seconds)
+    """
+    items = itertools.cycle(traffic)
+    lock = threading.Lock()
+    sent = itertools.count()
+    deadline = time.perf_counter() + duration if duration else None
+
+    def client(_):
+        samples = []
+        while True:
+            if deadline is not None and time.perf_counter() >= deadline:
+                return samples
+            if n_requests is not None and next(sent) >= n_requests:
+                return samples
+            with lock:
+                item = next(items)
+            start = time.perf_counter()
+            status, model_version = target.send(item)
+            samples.append((item["path"], model_version, status, time.perf_counter() - start))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(client, range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return [sample for samples in results for sample in samples], elapsed
+
+
+def summarize(samples:list, elapsed:float, concurrency:int) -> list:
+    df = pd.DataFrame(samples, columns=["endpoint", "model_version", "status", "latency"])
+    summary = []
+    for (endpoint, model_version), group in df.groupby(["endpoint", "model_version"]):
+        latency_ms = group["latency"].to_numpy() * 1000
+        summary.append({
+            "concurrency": concurrency,
+            "endpoint": endpoint,
+            "model_version": model_version,
+            "requests": int(len(group)),
+            "errors": int((group["status"] >= 400).sum()),
+            "throughput_rps": float(len(group) / elapsed),
+            "mean_ms": float(latency_ms.mean()),
+            "p50_ms": float(np.percentile(latency_ms, 50)),
+            "p95_ms": float(np.percentile(latency_ms, 95)),
+            "p99_ms": float(np.percentile(latency_ms, 99)),
+        })
+    return summary
+
+
+def print_summary(summary:list):
+    for row in summary:
+        print(f"c={row['concurrency']:<4} {row['endpoint']:<16} v={row['model_version']:<5} "
+              f"n={row['requests']:<7} err={row['errors']:<5} rps={row['throughput_rps']:>9.1f} "
+              f"p50={row['p50_ms']:>8.2f}ms p95={row['p95_ms']:>8.2f}ms p99={row['p99_ms']:>8.2f}ms")
+
+
+def compare(results:list, baseline:list, max_regression:float) -> bool:
+    """
+    Compares p95 latency and throughput per (concurrency, endpoint) with a previous run
+    ===========================================================================================
+    return False if any p95 latency grew by more than max_regression percent
+    """
+    previous = {(row["concurrency"], row["endpoint"]): row for row in baseline}
+    passed = True
+    for row in results:
+        base = previous.get((row["concurrency"], row["endpoint"]))
+        if base is None:
+            continue
+        p95_change = (row["p95_ms"] / base["p95_ms"] - 1) * 100
+        rps_change = (row["throughput_rps"] / base["throughput_rps"] - 1) * 100
+        regressed = p95_change > max_regression
+        passed = passed and not regressed
+        print(f"c={row['concurrency']:<4} {row['endpoint']:<16} p95 {p95_change:+7.1f}% rps {rps_change:+7.1f}%"
+              f"{'  REGRESSION' if regressed else ''}")
+    return passed
+
+
+def run_metadata(args) -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT_DIR, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        "started_at": datetime.now().isoformat(),
+        "git_commit": commit,
+        "host": platform.node(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "args": vars(args),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", default="inprocess", help="'inprocess' or the url of a running server")
+    parser.add_argument("--traffic", default=None, help="json lines file with recorded requests")
+    parser.add_argument("--synthetic", type=int, default=1000, help="number of requests sampled from --data")
+    parser.add_argument("--endpoint", default="/predict", help="endpoint of synthetic requests")
+    parser.add_argument("--batch-size", type=int, default=100, help="records per synthetic /predict/batch request")
+    parser.add_argument("--data", default=os.path.join(ROOT_DIR, "hypothyroid.csv"))
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=None, help="requests per concurrency level, default one pass over the traffic")
+    parser.add_argument("--duration", type=float, default=None, help="seconds per concurrency level instead of --requests")
+    parser.add_argument("--warmup", type=int, default=20, help="requests sent before measuring")
+    parser.add_argument("--output", default=None, help="json file for the results")
+    parser.add_argument("--write-traffic", default=None, help="save the generated traffic as json lines for later replay")
+    parser.add_argument("--baseline", default=None, help="previous result file to compare with")
+    parser.add_argument("--max-regression", type=float, default=10.0, help="allowed p95 latency growth in percent")
+    args = parser.parse_args()
+
+    if args.traffic:
+        traffic = load_traffic(args.traffic)
+    else:
+        traffic = synthetic_traffic(args.data, args.synthetic, endpoint=args.endpoint, batch_size=args.batch_size)
+    if args.write_traffic:
+        with open(args.write_traffic, "w") as file_obj:
+            for item in traffic:
+                file_obj.write(json.dumps(item) + "\n")
+
+    target = InProcessTarget() if args.target == "inprocess" else HttpTarget(args.target)
+    n_requests = args.requests if args.requests is not None or args.duration else len(traffic)
+
+    results = []
+    for concurrency in args.concurrency:
+        run_level(target, traffic, concurrency=concurrency, n_requests=args.warmup)
+        samples, elapsed = run_level(target, traffic, concurrency=concurrency, n_requests=n_requests, duration=args.duration)
+        summary = summarize(samples, elapsed, concurrency)
+        print_summary(summary)
+        results.extend(summary)
+
+    if args.output:
+        with open(args.output, "w") as file_obj:
+            json.dump({"meta": run_metadata(args), "results": results}, file_obj, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file_obj:
+            baseline = json.load(file_obj)["results"]
+        if not compare(results, baseline, args.max_regression):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
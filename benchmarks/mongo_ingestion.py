@@ -0,0 +1,119 @@
+"""
+Peak memory and time of exporting the Mongo collection to the feature store.
+
+A local stand-in collection is filled with the records of hypothyroid.csv, stored the way
+data_dump.py stores them, repeated up to --records documents. The export is then run
+twice under tracemalloc:
+
+    materialized  list(find()) -> DataFrame -> replace("?", nan) -> to_csv (previous implementation)
+    streaming     utils.iter_collection_chunks -> to_csv per batch -> read_csv
+
+The default stand-in keeps every document encoded and decodes it when the cursor reaches
+it, like a pymongo cursor decoding one batch of BSON at a time. mongomock (--stand-in
+mongomock) builds the whole result list on the first read of a cursor, which hides the
+difference between the two exports.
+
+    python benchmarks/mongo_ingestion.py --records 200000 --batch-size 10000
+"""
+import tracemalloc
+import tempfile
+import argparse
+import json
+import time
+import os, sys
+
+import pandas as pd
+import numpy as np
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+from thyroid import utils
+
+
+class StreamingCollection:
+    """
+    Collection holding encoded documents, find() decodes them one at a time
+    """
+    def __init__(self):
+        self._documents = []
+
+    def insert_many(self, documents:list):
+        for document in documents:
+            self._documents.append(json.dumps(document).encode())
+
+    def find(self, filter:dict = None, projection:dict = None, batch_size:int = 0):
+        include_id = not (projection or {}).get("_id", 1) == 0
+        for index, raw in enumerate(self._documents):
+            document = json.loads(raw)
+            if include_id:
+                document = dict(_id=index, **document)
+            yield document
+
+
+def fill_collection(collection, data_file_path:str, n_records:int):
+    df = pd.read_csv(data_file_path)
+    records = list(json.loads(df.T.to_json()).values())
+    for start in range(0, n_records, len(records)):
+        collection.insert_many([dict(record) for record in records[:n_records - start]])
+
+
+def export_materialized(collection, file_path:str) -> pd.DataFrame:
+    df = pd.DataFrame(list(collection.find()))
+    df.drop("_id", axis=1, inplace=True)
+    df.replace(to_replace="?", value=np.NAN, inplace=True)
+    df.to_csv(file_path, index=False, header=True)
+    return df
+
+
+def export_streaming(collection, file_path:str, batch_size:int) -> pd.DataFrame:
+    n_rows = 0
+    with open(file_path, "w", newline="") as file_obj:
+        for chunk in utils.iter_collection_chunks(batch_size=batch_size, collection=collection):
+            chunk.to_csv(file_obj, index=False, header=n_rows == 0)
+            n_rows += len(chunk)
+    return pd.read_csv(file_path)
+
+
+def measure(function, *args) -> dict:
+    tracemalloc.start()
+    start = time.perf_counter()
+    df = function(*args)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": elapsed, "peak_mb": peak / 1e6, "rows": int(len(df))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=100000)
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--data", default=os.path.join(ROOT_DIR, "hypothyroid.csv"))
+    parser.add_argument("--output", default=None, help="json file for the results")
+    parser.add_argument("--stand-in", choices=["streaming", "mongomock"], default="streaming")
+    args = parser.parse_args()
+
+    if args.stand_in == "mongomock":
+        import mongomock
+        collection = mongomock.MongoClient()["thyroid-deases"]["thyroid"]
+    else:
+        collection = StreamingCollection()
+    fill_collection(collection, args.data, args.records)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        file_path = os.path.join(temp_dir, "thyroid.csv")
+        results["materialized"] = measure(export_materialized, collection, file_path)
+        results["streaming"] = measure(export_streaming, collection, file_path, args.batch_size)
+
+    for name, result in results.items():
+        print(f"{name:<13} rows={result['rows']:<8} peak={result['peak_mb']:>8.1f}MB time={result['seconds']:>6.2f}s")
+    print(f"peak memory reduced {results['materialized']['peak_mb'] / results['streaming']['peak_mb']:.1f}x")
+
+    if args.output:
+        with open(args.output, "w") as file_obj:
+            json.dump({"args": vars(args), "results": results}, file_obj, indent=2)
+
+
+if __name__ == "__main__":
+    main()
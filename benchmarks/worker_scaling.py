@@ -0,0 +1,72 @@
+"""
+Throughput of the gunicorn serving mode for a growing number of worker processes.
+
+For every worker count a gunicorn server is started with gunicorn.conf.py, warmed up
+and then driven by concurrent clients posting single records to /predict for a fixed
+duration. The prediction cache is disabled so every request is scored.
+
+    python benchmarks/worker_scaling.py --workers 1 2 4 8 --clients 32 --duration 20
+"""
+import http.client
+import subprocess
+import argparse
+import json
+import time
+import os, sys
+
+from load_test import ROOT_DIR, synthetic_traffic, HttpTarget, run_level, summarize
+
+
+def wait_until_ready(port:int, timeout:float = 120.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=2)
+            connection.request("GET", "/version")
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.5)
+    raise Exception(f"Server on port {port} did not become ready")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--predict-threads", type=int, default=1)
+    parser.add_argument("--data", default=os.path.join(ROOT_DIR, "hypothyroid.csv"))
+    parser.add_argument("--output", default=None, help="optional json file for the results")
+    args = parser.parse_args()
+
+    traffic = synthetic_traffic(args.data, n_requests=1000)
+    results = []
+    for n_workers in args.workers:
+        env = dict(os.environ, WEB_CONCURRENCY=str(n_workers), PORT=str(args.port),
+                   PREDICT_NUM_THREADS=str(args.predict_threads), PREDICT_CACHE_SIZE="0")
+        server = subprocess.Popen(["gunicorn", "-c", "gunicorn.conf.py", "app:app"], cwd=ROOT_DIR, env=env,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_until_ready(args.port)
+            target = HttpTarget(f"http://127.0.0.1:{args.port}")
+            run_level(target, traffic, concurrency=args.clients, duration=min(3.0, args.duration))
+            samples, elapsed = run_level(target, traffic, concurrency=args.clients, duration=args.duration)
+            result = dict(workers=n_workers, **summarize(samples, elapsed, args.clients)[0])
+        finally:
+            server.terminate()
+            server.wait()
+        results.append(result)
+        print(f"workers={result['workers']:<3} rps={result['throughput_rps']:>9.1f} "
+              f"p50={result['p50_ms']:>7.2f}ms p95={result['p95_ms']:>7.2f}ms p99={result['p99_ms']:>7.2f}ms "
+              f"errors={result['errors']}")
+
+    if args.output:
+        with open(args.output, "w") as file_obj:
+            json.dump(results, file_obj, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,32 @@
-import pymongo 
-import pandas as pd 
-import json 
-from thyroid.config import mongo_client
+import argparse
+import os
+from thyroid.config import get_mongo_client
+from thyroid.bulk_loader import BulkLoader
 
 DATA_FILE_PATH = "/config/workspace/hypothyroid_cleaned.csv"
 DATABASE_NAME = 'thyroid-deases'
 COLLECTION_NAME = 'thyroid'
 
 if __name__ =="__main__":
-    df = pd.read_csv(DATA_FILE_PATH)
-    print(f"Data loaded Successfully")
+    parser = argparse.ArgumentParser(description="Loads a CSV export into the mongo collection, loading the same file again inserts nothing")
+    parser.add_argument("--file", default=DATA_FILE_PATH)
+    parser.add_argument("--database", default=DATABASE_NAME)
+    parser.add_argument("--collection", default=COLLECTION_NAME)
+    parser.add_argument("--chunk-size", type=int, default=50000, help="rows read from the file at a time")
+    parser.add_argument("--batch-size", type=int, default=5000, help="documents per insert_many")
+    parser.add_argument("--workers", type=int, default=min(8, (os.cpu_count() or 1) * 2))
+    parser.add_argument("--stand-in", choices=["mongomock"], default=None,
+                        help="load into an in-process stand-in instead of MONGO_DB_URL, e.g. to try the loader")
+    args = parser.parse_args()
 
-    # converting dataframe to json so that we can dump the records in mongo db
-    df.reset_index(drop=True, inplace=True)
-
-    json_record = list(json.loads(df.T.to_json()).values())
-    #df.T.json() transposing the dataframe and converting to json format
-    #json.loads() function converts the json string to python dictonary
-    #values method of dictonary is called which return a list of all the values in the dictonary
-    #list function is used to convert the returned values to list
-
-    mongo_client[DATABASE_NAME][COLLECTION_NAME].insert_many(json_record)
-    print("Data Dumped Successfully")
+    if args.stand_in == "mongomock":
+        import mongomock
+        client = mongomock.MongoClient()
+    else:
+        client = get_mongo_client()
 
+    loader = BulkLoader(collection=client[args.database][args.collection], chunk_size=args.chunk_size,
+                        batch_size=args.batch_size, n_workers=args.workers)
+    report = loader.load(args.file)
+    print(f"Data Dumped Successfully: {report['rows']} rows, {report['inserted']} inserted, "
+          f"{report['duplicates']} already loaded, {report['rows_per_second']:.0f} rows/sec")
@@ -0,0 +1,47 @@
+# production serving: the transformer, model and target encoder are loaded once in the
+# master process (preload_app) and shared copy on write with the forked workers
+import os, gc, glob, tempfile
+from multiprocessing import cpu_count
+
+# OpenMP reads this once on first use, it has to be set before xgboost runs anything
+predict_num_threads = int(os.getenv("PREDICT_NUM_THREADS", 1))
+os.environ.setdefault("OMP_NUM_THREADS", str(predict_num_threads))
+
+# every worker writes its metrics here and /metrics merges them, the counts of an earlier
+# server are removed so counters start from zero with the server
+metrics_dir = os.environ.setdefault("METRICS_MULTIPROC_DIR", tempfile.mkdtemp(prefix="thyroid-metrics-"))
+os.makedirs(metrics_dir, exist_ok=True)
+for file_path in glob.glob(os.path.join(metrics_dir, "*.json")):
+    os.remove(file_path)
+
+bind = f"0.0.0.0:{os.getenv('PORT', 8080)}"
+workers = int(os.getenv("WEB_CONCURRENCY", max(1, cpu_count() // predict_num_threads)))
+worker_class = "gthread"
+threads = int(os.getenv("WEB_THREADS", 4))
+timeout = int(os.getenv("WEB_TIMEOUT", 60))
+preload_app = True
+
+
+def when_ready(server):
+    # move everything loaded so far out of the garbage collector's reach, otherwise
+    # collections in the workers touch every object and copy the shared pages
+    gc.freeze()
+    server.log.info(f"Starting {workers} workers with {threads} threads "
+                    f"and {predict_num_threads} prediction threads each")
+
+
+def post_fork(server, worker):
+    from threadpoolctl import threadpool_limits
+    import app
+
+    threadpool_limits(limits=predict_num_threads)
+    app.model_manager.set_num_threads(predict_num_threads)
+    app.metrics.start_sync()
+
+
+def child_exit(server, worker):
+    # the snapshots of an exited worker are dropped, a restarted worker starts its counts from zero
+    from thyroid.serving.metrics import remove_process_snapshots
+
+    removed = remove_process_snapshots(metrics_dir, worker.pid)
+    server.log.info(f"Removed {removed} metrics snapshots of worker {worker.pid}")
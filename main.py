@@ -1,55 +1,26 @@
+import argparse
 import os, sys
 from thyroid.logger import logging
 from thyroid.exception import ThyroidException
-from thyroid.entity import config_entity, artifact_entity
-from thyroid.utils import get_collection_as_dataframe
-from thyroid.components.data_ingestion import DataIngestion
-from thyroid.components.data_validation import DataValidation
-from thyroid.components.data_transformation import DataTransformation
-from thyroid.components.model_trainer import ModelTrainer
-from thyroid.components.model_evaluation import ModelEvaluation
-from thyroid.components.model_pusher import ModelPusher
+from thyroid.pipeline.training_pipeline import TrainingPipeline
 
 print(__name__)
 if __name__ == "__main__":
+     parser = argparse.ArgumentParser(description="Runs the training pipeline")
+     parser.add_argument("--full-refresh", action="store_true",
+                         help="re-export the whole collection instead of only the documents added since the last run")
+     parser.add_argument("--no-cache", action="store_true",
+                         help="run every stage, even when its artifact for the same inputs is cached")
+     parser.add_argument("--validation-chunk-size", type=int, default=None,
+                         help="validate the datasets this many rows at a time instead of as whole dataframes")
+     args = parser.parse_args()
      try:
-          training_pipeline_config = config_entity.TrainingPipelineConfig()
-
-          # data ingestion 
-          data_ingestion_config = config_entity.DataIngestionConfig(training_pipeline_config=training_pipeline_config)
-          data_ingestion = DataIngestion(data_ingestion_config=data_ingestion_config)
-          data_ingestion_artifact = data_ingestion.initiate_data_ingestion()
-
-          # data Validation 
-          data_validation_config = config_entity.DataValidationConfig(training_pipeline_config=training_pipeline_config)
-          data_validation = DataValidation(data_validation_config=data_validation_config,data_ingestion_artifact=data_ingestion_artifact)
-          data_validation_artifact = data_validation.initiate_data_validation()
-
-          # data transformation
-          data_transformation_config = config_entity.DataTransformationConfig(training_pipeline_config=training_pipeline_config)
-          data_transformation = DataTransformation(data_transformation_config=data_transformation_config, 
-          data_ingestion_artifact=data_ingestion_artifact)
-          data_transformation_artifact = data_transformation.initiate_data_transformation()
-
-          # model trainer
-          model_trainer_config = config_entity.ModelTrainerConfig(training_pipeline_config=training_pipeline_config)
-          model_trainer = ModelTrainer(model_trainer_config=model_trainer_config, data_transformation_artifact=data_transformation_artifact)
-          model_trainer_artifact = model_trainer.initiate_model_trainer()
-     
-          # model evaluation 
-          model_eval_config = config_entity.ModelEvaluationConfig(training_pipeline_config=training_pipeline_config)
-          model_eval = ModelEvaluation(model_eval_config=model_eval_config, 
-               data_ingestion_artifact = data_ingestion_artifact, 
-               data_transformation_artifact = data_transformation_artifact, 
-               model_trainer_artifact = model_trainer_artifact)
-          model_eval_artifact = model_eval.initiate_model_evaluation()
-
-          # model pusher
-          model_pusher_config = config_entity.ModelPusherConfig(training_pipeline_config)
-          model_pusher = ModelPusher(model_pusher_config=model_pusher_config, 
-                                     data_transformation_artifact=data_transformation_artifact, 
-                                     model_trainer_artifact=model_trainer_artifact)
-          model_pusher_artifact = model_pusher.initiate_model_pusher()
+          # ingestion, validation, transformation, training, evaluation and pushing, stages
+          # without a dependency between them run in parallel, unchanged stages are skipped
+          training_pipeline = TrainingPipeline(full_refresh=args.full_refresh, use_cache=not args.no_cache,
+                                               validation_chunk_size=args.validation_chunk_size)
+          summary = training_pipeline.run()
+          for stage in summary["stages"]:
+               print(f"{stage['stage']:<20} {stage['status']:<8} {stage['seconds']}s")
      except Exception as e:
           raise ThyroidException(e, sys)
-          
\ No newline at end of file
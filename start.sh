@@ -1,2 +1,6 @@
 #!bin/sh
-python3 app.py
\ No newline at end of file
+if [ "$SERVING_MODE" = "dev" ]; then
+    python3 app.py
+else
+    gunicorn -c gunicorn.conf.py app:app
+fi
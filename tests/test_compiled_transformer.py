@@ -0,0 +1,54 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+
+from thyroid.serving.compiled_transformer import CompiledTransformer, compile_transformer
+from thyroid.utils import load_object
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TRANSFORMER_PATH = os.path.join(ROOT_DIR, "saved_models", "2", "transformer", "transformer.pkl")
+
+
+@pytest.fixture(scope="module")
+def transformer():
+    return load_object(file_path=TRANSFORMER_PATH)
+
+
+@pytest.fixture(scope="module")
+def dataset(transformer):
+    df = pd.read_csv(os.path.join(ROOT_DIR, "hypothyroid.csv")).replace({"?": np.nan})
+    df = df[list(transformer.feature_names_in_)]
+    numerical_columns = ["age", "T3", "TT4", "T4U", "FTI"]
+    df[numerical_columns] = df[numerical_columns].astype(float)
+    return df
+
+
+@pytest.fixture(scope="module")
+def records(dataset, transformer):
+    # the ordinal encoder accepts no missing category, the numerical columns keep their missing values
+    categorical_columns = [column for column in transformer.feature_names_in_ if dataset[column].dtype == object]
+    df = dataset.dropna(subset=categorical_columns)
+    assert df[["T3", "TT4"]].isna().any().all()
+    return df
+
+
+def test_output_matches_the_pipeline_exactly(transformer, records):
+    compiled = compile_transformer(transformer)
+    expected = transformer.transform(records)
+    actual = compiled.transform(records)
+    assert actual.dtype == expected.dtype
+    assert np.array_equal(actual, expected, equal_nan=True)
+
+
+def test_description_round_trip(transformer, records):
+    compiled = CompiledTransformer.from_dict(compile_transformer(transformer).to_dict())
+    assert np.array_equal(compiled.transform(records), transformer.transform(records), equal_nan=True)
+
+
+def test_missing_category_is_rejected_like_the_pipeline(transformer, dataset):
+    df = dataset[dataset["sex"].isna()].head(5)
+    with pytest.raises(ValueError):
+        transformer.transform(df)
+    with pytest.raises(Exception, match="unknown categories"):
+        compile_transformer(transformer).transform(df)
@@ -0,0 +1,51 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+import yaml
+
+from thyroid.components.data_validation import DataValidation
+from thyroid.config import NUMERICAL_COLUMN
+from thyroid.entity import artifact_entity, config_entity
+
+BASE_FILE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "hypothyroid.csv")
+
+
+@pytest.fixture
+def data_validation(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    df = pd.read_csv(BASE_FILE_PATH).replace({"?": np.nan})
+    train_file_path, test_file_path = str(tmp_path / "train.csv"), str(tmp_path / "test.csv")
+    df.iloc[:2000].to_csv(train_file_path, index=False)
+    df.iloc[2000:].to_csv(test_file_path, index=False)
+
+    data_validation_config = config_entity.DataValidationConfig(training_pipeline_config=config_entity.TrainingPipelineConfig())
+    data_validation_config.base_file_path = BASE_FILE_PATH
+    return DataValidation(data_validation_config=data_validation_config,
+                          data_ingestion_artifact=artifact_entity.DataIngestionArtifact(
+                              feature_store_file_path=BASE_FILE_PATH, train_file_path=train_file_path, test_file_path=test_file_path))
+
+
+def test_report_keeps_the_baseline_structure(data_validation):
+    with open(data_validation.initiate_data_validation().report_file_path) as file_obj:
+        report = yaml.safe_load(file_obj)
+
+    assert report["missing_values_within_base_dataset"] == ["TBG"]
+    for dataset_name in ("train", "test"):
+        assert report[f"missing_values_within_{dataset_name}_dataset"] == ["TBG"]
+        drift_report = report[f"data_drift_within_{dataset_name}_dataset"]
+        assert set(drift_report) == {column for column in NUMERICAL_COLUMN if column != "TBG"}
+        for result in drift_report.values():
+            assert set(result) == {"pvalue", "same_distribution"}
+        # the statistics of every tested column are kept under their own key
+        statistics = report[f"drift_statistics_within_{dataset_name}_dataset"]
+        assert statistics["T3"]["pvalue"] == drift_report["T3"]["pvalue"]
+        assert "sex" in statistics
+
+
+def test_drop_missing_values(data_validation):
+    df = pd.DataFrame({"age": [1.0, 2.0, np.nan, 4.0], "TBG": [np.nan, np.nan, np.nan, 1.0]})
+    df = data_validation.drop_missing_values(df, report_key_name="missing_values")
+    assert list(df.columns) == ["age"]
+    assert data_validation.validation_error["missing_values"] == ["TBG"]
+    assert data_validation.drop_missing_values(pd.DataFrame({"TBG": [np.nan, np.nan]}), report_key_name="missing_values") is None
@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.stats import ks_2samp
+
+from thyroid.drift import DriftAccumulator, build_reference_profile
+
+NUMERICAL_COLUMNS = ["normal", "shifted", "rounded"]
+
+
+def make_dataset(rows:int, seed:int, shift:float = 0.0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "normal": rng.normal(size=rows),
+        "shifted": rng.normal(loc=shift, size=rows),
+        # ties between and within the datasets
+        "rounded": np.round(rng.normal(loc=shift, size=rows), 1),
+    })
+    df.loc[rng.choice(rows, size=rows // 20, replace=False), "normal"] = np.nan
+    return df
+
+
+@pytest.mark.parametrize("chunk_size", [None, 97])
+def test_ks_matches_scipy_asymptotic(chunk_size):
+    # the sketch holds the whole reference, so the statistic is exact
+    base_df, current_df = make_dataset(1500, seed=0), make_dataset(700, seed=1, shift=0.1)
+    profile = build_reference_profile(base_df, numerical_columns=NUMERICAL_COLUMNS, categorical_columns=[], sample_size=10000)
+
+    accumulator = DriftAccumulator(profile)
+    chunks = [current_df] if chunk_size is None else [current_df.iloc[start:start + chunk_size] for start in range(0, len(current_df), chunk_size)]
+    for chunk in chunks:
+        accumulator.add(chunk)
+    report = accumulator.report()
+
+    for column in NUMERICAL_COLUMNS:
+        expected = ks_2samp(base_df[column].dropna(), current_df[column].dropna(), method="asymp")
+        assert report[column]["test"] == "ks"
+        assert report[column]["statistic"] == pytest.approx(expected.statistic, abs=1e-12)
+        assert report[column]["pvalue"] == pytest.approx(expected.pvalue, rel=1e-9, abs=1e-300)
+        assert report[column]["same_distribution"] == (expected.pvalue > 0.05)
@@ -0,0 +1,44 @@
+from datetime import datetime, timedelta, timezone
+import pytest
+
+from thyroid.feature_store import FeatureStore
+
+mongomock = pytest.importorskip("mongomock")
+from bson import ObjectId
+
+
+def make_document(created_at:datetime, age:int) -> dict:
+    return {"_id": ObjectId.from_datetime(created_at), "age": age, "sex": "F", "_row_key": f"file:{age}"}
+
+
+@pytest.fixture
+def collection():
+    return mongomock.MongoClient()["thyroid-deases"]["thyroid"]
+
+
+def test_late_document_below_the_watermark_is_ingested_once(tmp_path, collection):
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    feature_store = FeatureStore(store_dir=str(tmp_path), overlap_seconds=300)
+    collection.insert_many([make_document(now - timedelta(seconds=30), 1), make_document(now, 2)])
+    assert feature_store.ingest(collection, batch_size=10) == 2
+
+    # created before the watermark, committed after the first ingestion
+    collection.insert_one(make_document(now - timedelta(seconds=10), 3))
+    assert feature_store.ingest(collection, batch_size=10) == 1
+    assert feature_store.ingest(collection, batch_size=10) == 0
+
+    df = feature_store.read()
+    assert sorted(df["age"]) == [1, 2, 3]
+    assert list(df.columns) == ["age", "sex"]
+    assert all(path.endswith(".parquet") for path in feature_store.part_file_paths())
+    assert feature_store.load_state()["watermark"]["value"] == str(ObjectId.from_datetime(now))
+
+
+def test_overlap_ids_are_trimmed_to_the_window(tmp_path, collection):
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    feature_store = FeatureStore(store_dir=str(tmp_path), overlap_seconds=60)
+    collection.insert_many([make_document(now - timedelta(seconds=600), 1), make_document(now, 2)])
+    assert feature_store.ingest(collection, batch_size=1) == 2
+
+    overlap_ids = feature_store.load_state()["overlap_ids"]
+    assert list(overlap_ids) == [str(ObjectId.from_datetime(now))]
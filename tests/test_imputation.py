@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+from sklearn.impute import KNNImputer
+
+from thyroid.imputation import impute, indexed_knn_impute
+
+
+def make_matrix(rows:int, seed:int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    X = rng.normal(size=(rows, 6))
+    # several missing value patterns, every row keeps an observed column
+    X[rng.random(size=X.shape) < 0.15] = np.nan
+    X[np.isnan(X).all(axis=1), 0] = 0.5
+    return X
+
+
+def knn_on_complete_donors(X:np.ndarray, n_neighbors:int) -> np.ndarray:
+    complete = ~np.isnan(X).any(axis=1)
+    return KNNImputer(n_neighbors=n_neighbors).fit(X[complete]).transform(X)
+
+
+@pytest.mark.parametrize("n_neighbors", [1, 3, 5])
+def test_knn_indexed_matches_knn_imputer_on_complete_donors(n_neighbors):
+    X = make_matrix(2000, seed=n_neighbors)
+    # a chunk size below the rows of a pattern queries it in several chunks
+    actual = indexed_knn_impute(X, n_neighbors=n_neighbors, chunk_size=50)
+    np.testing.assert_allclose(actual, knn_on_complete_donors(X, n_neighbors), rtol=1e-12, atol=1e-12)
+
+
+def test_duplicate_donors_are_taken_from_the_identical_group():
+    # categorical like columns, the donors are grouped before the tree is built
+    rng = np.random.default_rng(0)
+    X = np.column_stack([rng.integers(0, 3, size=3000), rng.integers(0, 2, size=3000), rng.normal(size=3000)]).astype(float)
+    receivers = rng.choice(3000, size=300, replace=False)
+    X[receivers, 2] = np.nan
+    actual = indexed_knn_impute(X, n_neighbors=3)
+
+    donors = X[~np.isnan(X[:, 2])]
+    for row in receivers:
+        group = donors[(donors[:, 0] == X[row, 0]) & (donors[:, 1] == X[row, 1])]
+        # every neighbour is at distance zero, the first members of the group are taken
+        assert actual[row, 2] == pytest.approx(group[:3, 2].mean(), abs=1e-12)
+
+
+def test_unknown_strategy_is_rejected():
+    with pytest.raises(Exception, match="Unknown imputation strategy"):
+        impute(make_matrix(10, seed=0), strategy="mean")
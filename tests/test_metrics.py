@@ -0,0 +1,54 @@
+import os
+
+from thyroid.serving.metrics import MetricsRegistry, remove_process_snapshots
+
+
+def make_registry(multiprocess_dir):
+    registry = MetricsRegistry(multiprocess_dir=str(multiprocess_dir))
+    requests_total = registry.counter("thyroid_requests_total", "Requests handled", ["endpoint"])
+    latency = registry.histogram("thyroid_request_duration_seconds", "Request latency", ["endpoint"], buckets=(0.1, 1.0))
+    return registry, requests_total, latency
+
+
+def test_render_merges_the_snapshots_of_every_worker(tmp_path):
+    first, first_requests, first_latency = make_registry(tmp_path)
+    second, second_requests, second_latency = make_registry(tmp_path)
+    first_requests.inc("/predict", amount=2)
+    first_latency.observe(0.05, "/predict")
+    second_requests.inc("/predict", amount=3)
+    second_latency.observe(0.5, "/predict")
+    second.write_snapshot()
+
+    lines = first.render().splitlines()
+    assert 'thyroid_requests_total{endpoint="/predict"} 5' in lines
+    assert 'thyroid_request_duration_seconds_bucket{endpoint="/predict",le="0.1"} 1' in lines
+    assert 'thyroid_request_duration_seconds_bucket{endpoint="/predict",le="1.0"} 2' in lines
+    assert 'thyroid_request_duration_seconds_count{endpoint="/predict"} 2' in lines
+    # rendering again does not count the same observations twice
+    assert first.render().splitlines() == lines
+
+
+def test_render_without_a_directory_exports_the_process_alone(tmp_path):
+    registry = MetricsRegistry()
+    registry.counter("thyroid_requests_total", "Requests handled", ["endpoint"]).inc("/predict")
+    registry.register_collector(lambda: [("thyroid_model_info", "gauge", "Model version", [({"model_version": "2"}, 1)])])
+    lines = registry.render().splitlines()
+    assert 'thyroid_requests_total{endpoint="/predict"} 1' in lines
+    assert 'thyroid_model_info{model_version="2"} 1' in lines
+
+
+def test_label_values_are_escaped():
+    registry = MetricsRegistry()
+    registry.counter("thyroid_requests_total", "Requests handled", ["endpoint"]).inc('a\\b"c\nd')
+    assert 'thyroid_requests_total{endpoint="a\\\\b\\"c\\nd"} 1' in registry.render().splitlines()
+
+
+def test_snapshots_of_an_exited_worker_are_removed(tmp_path):
+    registry, requests_total, _ = make_registry(tmp_path)
+    requests_total.inc("/predict")
+    registry.write_snapshot()
+    other_file_path = tmp_path / "1-00000000.json"
+    other_file_path.write_text("{}")
+
+    assert remove_process_snapshots(str(tmp_path), os.getpid()) == 1
+    assert os.listdir(tmp_path) == [other_file_path.name]
@@ -0,0 +1,58 @@
+import os
+import shutil
+import numpy as np
+import pandas as pd
+import pytest
+
+from thyroid.exception import ThyroidException
+from thyroid.serving.model_bundle import load_model_bundle, read_bundle_header
+from thyroid.utils import load_object
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REGISTRY_DIR = os.path.join(ROOT_DIR, "saved_models")
+
+
+def load_pickles(model_dir:str):
+    return tuple(load_object(file_path=os.path.join(model_dir, name, f"{name}.pkl"))
+                 for name in ("transformer", "model", "target_encoder"))
+
+
+@pytest.fixture(scope="module")
+def records():
+    transformer, _, _ = load_pickles(os.path.join(REGISTRY_DIR, "2"))
+    df = pd.read_csv(os.path.join(ROOT_DIR, "hypothyroid.csv")).replace({"?": np.nan})
+    df = df[list(transformer.feature_names_in_)]
+    numerical_columns = ["age", "T3", "TT4", "T4U", "FTI"]
+    df[numerical_columns] = df[numerical_columns].astype(float)
+    # the encoders accept no missing category
+    return df.dropna(subset=[column for column in df.columns if column not in numerical_columns])
+
+
+@pytest.mark.parametrize("version", ["0", "1", "2"])
+def test_bundle_predicts_like_the_pickles(version, records):
+    model_dir = os.path.join(REGISTRY_DIR, version)
+    transformer, model, target_encoder = load_pickles(model_dir)
+    bundle_transformer, bundle_model, bundle_target_encoder, header = load_model_bundle(
+        os.path.join(model_dir, "model.bundle"), verify=True)
+    assert header["model_version"] == version
+
+    expected_input = transformer.transform(records)
+    actual_input = bundle_transformer.transform(records)
+    assert np.array_equal(actual_input, expected_input, equal_nan=True)
+    assert np.array_equal(bundle_target_encoder.inverse_transform(bundle_model.predict(actual_input)),
+                          target_encoder.inverse_transform(model.predict(expected_input)))
+    np.testing.assert_allclose(bundle_model.predict_proba(actual_input), model.predict_proba(expected_input), rtol=1e-6)
+
+
+def test_corrupted_booster_is_detected(tmp_path):
+    bundle_path = str(tmp_path / "model.bundle")
+    shutil.copy(os.path.join(REGISTRY_DIR, "2", "model.bundle"), bundle_path)
+    section = read_bundle_header(bundle_path)["sections"]["booster"]
+    with open(bundle_path, "r+b") as file_obj:
+        file_obj.seek(section["offset"] + section["length"] // 2)
+        byte = file_obj.read(1)
+        file_obj.seek(-1, os.SEEK_CUR)
+        file_obj.write(bytes([byte[0] ^ 0xFF]))
+
+    with pytest.raises(ThyroidException, match="corrupted"):
+        load_model_bundle(bundle_path, verify=True)
@@ -0,0 +1,67 @@
+import os
+import shutil
+import pytest
+
+from thyroid.components.model_evaluation import ModelEvaluation
+from thyroid.config import TARGET_COLUMN
+from thyroid.entity import artifact_entity, config_entity
+from thyroid.exception import ThyroidException
+from thyroid.predictor import ModelResolver, ThyroidPredictor
+
+REGISTRY_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "saved_models")
+
+
+@pytest.fixture
+def model_evaluation(tmp_path, monkeypatch):
+    # a copy of the registry, its three versions share a transformer
+    shutil.copytree(REGISTRY_DIR, tmp_path / "saved_models")
+    monkeypatch.chdir(tmp_path)
+    predictor = ThyroidPredictor.from_model_resolver(ModelResolver())
+    test_df = predictor.compiled_transformer.sample_frame()
+    test_df[TARGET_COLUMN] = predictor.target_encoder.classes_[0]
+    test_file_path = str(tmp_path / "test.csv")
+    test_df.to_csv(test_file_path, index=False)
+
+    candidate_dir = tmp_path / "saved_models" / "2"
+    model_eval_config = config_entity.ModelEvaluationConfig(training_pipeline_config=config_entity.TrainingPipelineConfig())
+    return ModelEvaluation(
+        model_eval_config=model_eval_config,
+        data_ingestion_artifact=artifact_entity.DataIngestionArtifact(
+            feature_store_file_path=test_file_path, train_file_path=test_file_path, test_file_path=test_file_path),
+        data_transformation_artifact=artifact_entity.DataTransformationArtifact(
+            transform_object_path=str(candidate_dir / "transformer" / "transformer.pkl"),
+            transformed_train_path=None, transformed_test_path=None,
+            target_encoder_path=str(candidate_dir / "target_encoder" / "target_encoder.pkl")),
+        model_trainer_artifact=artifact_entity.ModelTrainerArtifact(
+            model_path=str(candidate_dir / "model" / "model.pkl"), f1_train_score=None, f1_test_score=None))
+
+
+def test_test_data_is_transformed_once_per_distinct_transformer(model_evaluation, monkeypatch):
+    transformer_paths = []
+    transform_test_data = model_evaluation.transform_test_data
+
+    def counting_transform_test_data(transformer_path):
+        transformer_paths.append(transformer_path)
+        return transform_test_data(transformer_path)
+
+    monkeypatch.setattr(model_evaluation, "transform_test_data", counting_transform_test_data)
+    contenders = model_evaluation.get_contenders()
+    assert len(contenders) == 4
+    assert len({contender["transformer_sha256"] for contender in contenders}) == 1
+
+    # the candidate is a copy of the latest version, so it is not accepted
+    with pytest.raises(ThyroidException):
+        model_evaluation.initiate_model_evaluation()
+    assert len(transformer_paths) == 1
+    assert os.path.exists(model_evaluation.model_eval_config.leaderboard_file_path)
+
+
+def test_models_keep_their_thread_setting(model_evaluation):
+    contender = model_evaluation.get_contenders()[0]
+    model = model_evaluation.artifact_store.load_object(file_path=contender["model_path"])
+    n_jobs = model.get_params()["n_jobs"]
+    input_arr = model_evaluation.transform_test_data(contender["transformer_path"])
+    y_true = model_evaluation.artifact_store.read_dataframe(
+        model_evaluation.data_ingestion_artifact.test_file_path, columns=[TARGET_COLUMN])[TARGET_COLUMN]
+    model_evaluation.score_contender(contender, input_arr, y_true)
+    assert model.get_params()["n_jobs"] == n_jobs
@@ -0,0 +1,41 @@
+import os
+import shutil
+import pytest
+
+from thyroid.predictor import ModelResolver
+from thyroid.registry import RegistryManifest
+from thyroid.serving.model_manager import ModelManager
+
+REGISTRY_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "saved_models")
+
+
+@pytest.fixture
+def registry_dir(tmp_path):
+    registry_dir = str(tmp_path / "saved_models")
+    shutil.copytree(REGISTRY_DIR, registry_dir)
+    return registry_dir
+
+
+def test_new_version_is_swapped_in_and_requests_keep_theirs(registry_dir):
+    model_manager = ModelManager(model_resolver=ModelResolver(model_registery=registry_dir), poll_interval=0)
+    assert model_manager.load_latest()
+    assert model_manager.model_version == "2"
+    in_flight = model_manager.predictor
+    assert not model_manager.load_latest()
+
+    shutil.copytree(os.path.join(registry_dir, "2"), os.path.join(registry_dir, "3"))
+    RegistryManifest(registry_dir=registry_dir).register(version=3)
+    assert model_manager.load_latest()
+    assert model_manager.model_version == "3"
+    assert in_flight.model_version == "2"
+
+
+def test_broken_version_keeps_the_current_one(registry_dir):
+    model_manager = ModelManager(model_resolver=ModelResolver(model_registery=registry_dir), poll_interval=0)
+    model_manager.load_latest()
+
+    os.makedirs(os.path.join(registry_dir, "3"))
+    RegistryManifest(registry_dir=registry_dir).register(version=3)
+    assert not model_manager.load_latest()
+    assert model_manager.model_version == "2"
+    assert model_manager.status()["last_error"] is not None
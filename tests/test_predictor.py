@@ -0,0 +1,41 @@
+import os
+import pytest
+
+from thyroid.predictor import ModelResolver, ThyroidPredictor
+
+REGISTRY_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "saved_models")
+
+
+@pytest.fixture(scope="module")
+def predictor():
+    return ThyroidPredictor.from_model_resolver(ModelResolver(model_registery=REGISTRY_DIR))
+
+
+@pytest.fixture
+def record(predictor):
+    return predictor.compiled_transformer.sample_frame().iloc[0].to_dict()
+
+
+def test_valid_records_are_accepted(predictor, record):
+    df, errors = predictor.validate_records([record, dict(record)])
+    assert errors == []
+    assert len(predictor.predict(df)) == 2
+
+
+def test_unknown_category_is_reported_per_record(predictor, record):
+    df, errors = predictor.validate_records([record, dict(record, sex="X")])
+    assert df is None
+    assert errors == [{"index": 1, "column": "sex", "error": "unknown category [X]"}]
+
+
+def test_bool_is_not_a_number(predictor, record):
+    df, errors = predictor.validate_records([dict(record, T3=True)])
+    assert df is None
+    assert errors == [{"index": 0, "column": "T3", "error": "expected a number"}]
+
+
+def test_predict_proba_labels_match_predict(predictor):
+    df = predictor.compiled_transformer.sample_frame()
+    labels, probabilities = predictor.predict_proba(df)
+    assert list(labels) == list(predictor.predict(df))
+    assert probabilities.shape == (len(df), len(predictor.target_encoder.classes_))
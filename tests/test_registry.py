@@ -0,0 +1,78 @@
+import os
+import shutil
+import pytest
+
+from thyroid.predictor import ModelResolver
+from thyroid.registry import (STAGING_DIR_PREFIX, ObjectStore, RegistryManifest, create_staging_dir,
+                             publish_staging_dir, scan_versions)
+
+REGISTRY_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "saved_models")
+
+
+@pytest.fixture
+def registry_dir(tmp_path):
+    registry_dir = str(tmp_path / "saved_models")
+    shutil.copytree(REGISTRY_DIR, registry_dir)
+    return registry_dir
+
+
+def test_rebuilt_manifest_matches_the_directory_scan(registry_dir):
+    os.remove(os.path.join(registry_dir, "manifest.json"))
+    # entries which are not versions are skipped
+    os.makedirs(os.path.join(registry_dir, "not-a-version"))
+
+    manifest = RegistryManifest(registry_dir=registry_dir).rebuild()
+    assert sorted(map(int, manifest["versions"])) == scan_versions(registry_dir) == [0, 1, 2]
+    assert manifest["latest"] == 2
+    assert ModelResolver(model_registery=registry_dir).get_latest_dir_path() == os.path.join(registry_dir, "2")
+
+
+def test_verify_reports_changed_artifacts(registry_dir):
+    registry_manifest = RegistryManifest(registry_dir=registry_dir)
+    registry_manifest.rebuild()
+    assert registry_manifest.verify() == []
+
+    bundle_path = os.path.join(registry_dir, "1", "model.bundle")
+    with open(bundle_path, "ab") as file_obj:
+        file_obj.write(b"\0")
+    assert registry_manifest.verify() == [bundle_path]
+
+
+def publish_copy(registry_dir:str, source_version:int, version:int) -> int:
+    # publishes the files of an existing version the way ModelPusher does
+    object_store = ObjectStore(registry_dir=registry_dir)
+    staging_dir = create_staging_dir(registry_dir)
+    source_dir = os.path.join(registry_dir, str(source_version))
+    artifacts = {}
+    for dir_path, _, file_names in os.walk(source_dir):
+        for file_name in file_names:
+            relative_path = os.path.relpath(os.path.join(dir_path, file_name), source_dir)
+            artifacts[relative_path] = object_store.link(os.path.join(dir_path, file_name), os.path.join(staging_dir, relative_path))
+    saved_version = publish_staging_dir(registry_dir, staging_dir, version=version)
+    RegistryManifest(registry_dir=registry_dir).register(version=saved_version, artifacts=artifacts)
+    return saved_version
+
+
+def test_publish_stores_identical_artifacts_once(registry_dir):
+    resolver = ModelResolver(model_registery=registry_dir)
+    assert publish_copy(registry_dir, source_version=2, version=3) == 3
+    # the number taken meanwhile moves the next publish to the following one
+    assert publish_copy(registry_dir, source_version=2, version=3) == 4
+    assert resolver.get_latest_dir_path() == os.path.join(registry_dir, "4")
+    assert not any(name.startswith(STAGING_DIR_PREFIX) for name in os.listdir(registry_dir))
+
+    model_paths = [os.path.join(registry_dir, version, "model", "model.pkl") for version in ("3", "4")]
+    assert os.path.samefile(*model_paths)
+    assert RegistryManifest(registry_dir=registry_dir).verify() == []
+
+
+def test_rollback_serves_the_previous_version(registry_dir):
+    resolver = ModelResolver(model_registery=registry_dir)
+    publish_copy(registry_dir, source_version=2, version=3)
+    assert resolver.get_latest_dir_path() == os.path.join(registry_dir, "3")
+
+    # rolling back removes the version and reindexes the registry
+    shutil.rmtree(os.path.join(registry_dir, "3"))
+    assert resolver.get_latest_dir_path() == os.path.join(registry_dir, "2")
+    assert RegistryManifest(registry_dir=registry_dir).rebuild()["latest"] == 2
+    assert resolver.get_latest_dir_path() == os.path.join(registry_dir, "2")
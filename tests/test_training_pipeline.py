@@ -0,0 +1,65 @@
+from types import SimpleNamespace
+import pytest
+import yaml
+
+from thyroid.components.data_validation import DataValidation
+from thyroid.entity import artifact_entity
+from thyroid.exception import ThyroidException
+from thyroid.pipeline.training_pipeline import Stage, TrainingPipeline, imported_package_modules
+
+
+def make_pipeline(stages, monkeypatch) -> TrainingPipeline:
+    pipeline = TrainingPipeline()
+    monkeypatch.setattr(pipeline, "get_stages", lambda: stages)
+    return pipeline
+
+
+@pytest.fixture
+def input_file_path(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    input_file_path = tmp_path / "input.csv"
+    input_file_path.write_text("age\n41\n")
+    return input_file_path
+
+
+def make_stage(name, runs, input_file_path, depends_on=(), fail=False) -> Stage:
+    def run(artifacts):
+        runs.append(name)
+        if fail:
+            raise Exception(f"{name} failed")
+        return artifact_entity.DataValidationArtifact(report_file_path=str(input_file_path))
+
+    return Stage(name=name, run=run, depends_on=list(depends_on), config=SimpleNamespace(threshold=0.25),
+                 component=DataValidation, input_paths=lambda artifacts: [str(input_file_path)])
+
+
+def test_unchanged_stage_is_taken_from_the_cache(input_file_path, monkeypatch):
+    runs = []
+    stages = [make_stage("first", runs, input_file_path), make_stage("second", runs, input_file_path, depends_on=["first"])]
+    assert [stage["status"] for stage in make_pipeline(stages, monkeypatch).run()["stages"]] == ["ran", "ran"]
+    assert [stage["status"] for stage in make_pipeline(stages, monkeypatch).run()["stages"]] == ["cached", "cached"]
+    assert runs == ["first", "second"]
+
+    # a changed input file changes the fingerprint
+    input_file_path.write_text("age\n42\n")
+    assert [stage["status"] for stage in make_pipeline(stages, monkeypatch).run()["stages"]] == ["ran", "ran"]
+
+
+def test_stages_behind_a_failure_are_skipped(input_file_path, monkeypatch):
+    runs = []
+    stages = [make_stage("first", runs, input_file_path, fail=True),
+              make_stage("second", runs, input_file_path, depends_on=["first"]),
+              make_stage("independent", runs, input_file_path)]
+    pipeline = make_pipeline(stages, monkeypatch)
+    with pytest.raises(ThyroidException, match="first failed"):
+        pipeline.run()
+    assert sorted(runs) == ["first", "independent"]
+    with open(pipeline.run_summary_file_path) as file_obj:
+        summary = yaml.safe_load(file_obj)
+    assert [stage["status"] for stage in summary["stages"]] == ["failed", "skipped", "ran"]
+
+
+def test_fingerprint_covers_the_imported_modules():
+    assert "thyroid.drift" in imported_package_modules("thyroid.components.data_validation")
+    assert "thyroid.imputation" in imported_package_modules("thyroid.components.data_transformation")
+    assert "thyroid.registry" in imported_package_modules("thyroid.components.model_pusher")
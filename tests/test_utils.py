@@ -0,0 +1,17 @@
+import pytest
+
+from thyroid import utils
+from thyroid.bulk_loader import BulkLoader
+
+mongomock = pytest.importorskip("mongomock")
+
+
+def test_exported_frame_has_no_row_key(tmp_path):
+    file_path = tmp_path / "thyroid.csv"
+    file_path.write_text("age,sex,T3,Class\n41,F,2.5,negative\n23,M,?,negative\n")
+    collection = mongomock.MongoClient()["thyroid-deases"]["thyroid"]
+    BulkLoader(collection, chunk_size=1, batch_size=1, n_workers=1).load(str(file_path))
+
+    df = utils.get_collection_as_dataframe("thyroid-deases", "thyroid", batch_size=1, collection=collection)
+    assert list(df.columns) == ["age", "sex", "T3", "Class"]
+    assert df["T3"].isna().tolist() == [False, True]
@@ -0,0 +1,243 @@
+"""
+Reading and writing of the tabular pipeline artifacts (feature store, train and test splits).
+
+The format follows the file extension: .parquet (default), .arrow / .feather (Arrow IPC,
+uncompressed so a memory mapped read does not copy the data) or .csv. Columns known to
+thyroid/config.py get an explicit type, numerical columns float64 and categorical columns
+and the target strings, so no stage re-infers them. Readers can project columns, only the
+requested columns are read from a columnar file.
+"""
+from thyroid.config import TARGET_COLUMN, NUMERICAL_COLUMN, CATEGORICAL_COLUMN
+from thyroid.exception import ThyroidException
+from typing import Dict, Iterator, List, Optional
+import pandas as pd
+import numpy as np
+import os, sys
+
+ARTIFACT_FORMAT_EXTENSIONS = {"parquet": ".parquet", "arrow": ".arrow", "csv": ".csv"}
+
+
+def artifact_format(file_path:str) -> str:
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension in (".parquet", ".pq"):
+        return "parquet"
+    if extension in (".arrow", ".feather"):
+        return "arrow"
+    if extension == ".csv":
+        return "csv"
+    raise Exception(f"Unknown artifact format of [{file_path}]")
+
+
+def artifact_file_name(file_name:str, file_format:str) -> str:
+    # thyroid.csv -> thyroid.parquet
+    return os.path.splitext(file_name)[0] + ARTIFACT_FORMAT_EXTENSIONS[file_format]
+
+
+def column_dtypes(columns:List[str]) -> Dict[str, str]:
+    """
+    Explicit pandas dtype of every column listed in thyroid/config.py
+    """
+    dtypes = {}
+    for column in columns:
+        if column in NUMERICAL_COLUMN:
+            dtypes[column] = "float64"
+        elif column in CATEGORICAL_COLUMN or column == TARGET_COLUMN:
+            dtypes[column] = "str"
+    return dtypes
+
+
+def arrow_schema(df:pd.DataFrame):
+    import pyarrow as pa
+
+    # config columns are typed explicitly, the type of any other column is inferred once here
+    inferred = pa.Schema.from_pandas(df, preserve_index=False)
+    dtypes = column_dtypes(list(df.columns))
+    fields = []
+    for field in inferred:
+        if dtypes.get(field.name) == "float64":
+            field = pa.field(field.name, pa.float64())
+        elif dtypes.get(field.name) == "str":
+            field = pa.field(field.name, pa.string())
+        fields.append(field)
+    return pa.schema(fields)
+
+
+def _to_pandas(table) -> pd.DataFrame:
+    # arrow returns missing strings as None, the pipeline expects nan like read_csv gives,
+    # the null bitmap of the column tells where they are without looking at every value
+    df = table.to_pandas()
+    for index, column in enumerate(table.column_names):
+        if df[column].dtype == object and table.column(index).null_count > 0:
+            values = df[column].to_numpy()
+            values[table.column(index).is_null().to_numpy(zero_copy_only=False)] = np.nan
+            df[column] = values
+    return df
+
+
+def write_artifact(df:pd.DataFrame, file_path:str):
+    """
+    Description: This function writes a dataframe artifact in the format of its extension
+    =========================================================
+    df : dataframe to write, the index is not written
+    file_path : .parquet, .arrow or .csv file, replaced atomically
+    """
+    try:
+        file_format = artifact_format(file_path)
+        os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+        temp_file_path = f"{file_path}.{os.getpid()}.tmp"
+        if file_format == "csv":
+            df.to_csv(temp_file_path, index=False, header=True)
+        else:
+            import pyarrow as pa
+
+            # strings are written as strings even where a column holds nan
+            df = df.astype({column: object for column, dtype in column_dtypes(list(df.columns)).items() if dtype == "str"})
+            table = pa.Table.from_pandas(df, schema=arrow_schema(df), preserve_index=False)
+            if file_format == "parquet":
+                import pyarrow.parquet as pq
+                pq.write_table(table, temp_file_path, compression="snappy")
+            else:
+                import pyarrow.feather as feather
+                feather.write_feather(table, temp_file_path, compression="uncompressed")
+        os.replace(temp_file_path, file_path)
+    except Exception as e:
+        raise ThyroidException(e, sys)
+
+
+class ArtifactWriter:
+    """
+    Writes a dataframe artifact chunk by chunk in the format of its extension, a row group
+    (parquet) or record batch (arrow) per chunk, so only one chunk is in memory at a time.
+    The file appears under its name only on close(), after a failure nothing is left.
+
+        with ArtifactWriter(file_path) as writer:
+            for chunk in chunks:
+                writer.write(chunk)
+    """
+    def __init__(self, file_path:str):
+        try:
+            self.file_path = file_path
+            self.file_format = artifact_format(file_path)
+            self.temp_file_path = f"{file_path}.{os.getpid()}.tmp"
+            self.rows = 0
+            self._schema = None
+            self._writer = None
+            os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def write(self, df:pd.DataFrame):
+        try:
+            if self.file_format == "csv":
+                df.to_csv(self.temp_file_path, mode="w" if self.rows == 0 else "a", index=False, header=self.rows == 0)
+            else:
+                import pyarrow as pa
+
+                df = df.astype({column: object for column, dtype in column_dtypes(list(df.columns)).items() if dtype == "str"})
+                if self._schema is None:
+                    # every chunk is written with the schema of the first one, a column without
+                    # any value in it is taken to hold strings
+                    self._schema = pa.schema([pa.field(field.name, pa.string()) if pa.types.is_null(field.type) else field
+                                              for field in arrow_schema(df)])
+                    if self.file_format == "parquet":
+                        import pyarrow.parquet as pq
+                        self._writer = pq.ParquetWriter(self.temp_file_path, self._schema, compression="snappy")
+                    else:
+                        self._writer = pa.ipc.new_file(self.temp_file_path, self._schema)
+                table = pa.Table.from_pandas(df, schema=self._schema, preserve_index=False)
+                self._writer.write_table(table)
+            self.rows += len(df)
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def close(self):
+        # nothing written leaves no file
+        try:
+            if self._writer is not None:
+                self._writer.close()
+            if self.rows > 0:
+                os.replace(self.temp_file_path, self.file_path)
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def abort(self):
+        if self._writer is not None:
+            self._writer.close()
+        if os.path.exists(self.temp_file_path):
+            os.remove(self.temp_file_path)
+
+    def __enter__(self) -> "ArtifactWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def read_artifact(file_path:str, columns:Optional[List[str]] = None, memory_map:bool = True) -> pd.DataFrame:
+    """
+    Description: This function reads a dataframe artifact written by write_artifact
+    =========================================================
+    file_path : .parquet, .arrow or .csv file
+    columns : columns to read, all columns when None
+    memory_map : map a columnar file instead of reading it into memory
+    ========================================================
+    return Pandas dataframe with the columns in the requested order
+    """
+    try:
+        file_format = artifact_format(file_path)
+        if file_format == "csv":
+            # csv has no schema, the config types are passed and the rest is inferred
+            header = pd.read_csv(file_path, nrows=0).columns
+            dtypes = column_dtypes([column for column in header if columns is None or column in columns])
+            df = pd.read_csv(file_path, usecols=columns, dtype=dtypes)
+        elif file_format == "parquet":
+            import pyarrow.parquet as pq
+            df = _to_pandas(pq.read_table(file_path, columns=columns, memory_map=memory_map))
+        else:
+            import pyarrow.feather as feather
+            df = _to_pandas(feather.read_table(file_path, columns=columns, memory_map=memory_map))
+        if columns is not None:
+            df = df[list(columns)]
+        return df
+    except Exception as e:
+        raise ThyroidException(e, sys)
+
+
+def iter_artifact_chunks(file_path:str, chunk_size:int, columns:Optional[List[str]] = None) -> Iterator[pd.DataFrame]:
+    """
+    Description: This function reads a dataframe artifact chunk by chunk
+    =========================================================
+    file_path : .parquet, .arrow or .csv file
+    chunk_size : rows per chunk, only one chunk is in memory at a time
+    columns : columns to read, all columns when None
+    ========================================================
+    return iterator of Pandas dataframes typed like read_artifact
+    """
+    try:
+        file_format = artifact_format(file_path)
+        if file_format == "csv":
+            header = pd.read_csv(file_path, nrows=0).columns
+            dtypes = column_dtypes([column for column in header if columns is None or column in columns])
+            for df in pd.read_csv(file_path, usecols=columns, dtype=dtypes, chunksize=chunk_size):
+                yield df if columns is None else df[list(columns)]
+        elif file_format == "parquet":
+            import pyarrow.parquet as pq
+            import pyarrow as pa
+            parquet_file = pq.ParquetFile(file_path, memory_map=True)
+            for batch in parquet_file.iter_batches(batch_size=chunk_size, columns=columns):
+                yield _to_pandas(pa.Table.from_batches([batch]))
+        else:
+            import pyarrow as pa
+            # record batches of a memory mapped ipc file are sliced without a copy
+            reader = pa.ipc.open_file(pa.memory_map(file_path))
+            for index in range(reader.num_record_batches):
+                batch = reader.get_batch(index)
+                if columns is not None:
+                    batch = batch.select(columns)
+                for offset in range(0, batch.num_rows, chunk_size):
+                    yield _to_pandas(pa.Table.from_batches([batch.slice(offset, chunk_size)]))
+    except Exception as e:
+        raise ThyroidException(e, sys)
@@ -0,0 +1,118 @@
+"""
+In-memory handoff of the artifacts of one training pipeline run.
+
+Every artifact is still written to the artifact directory, the store additionally keeps
+the object it was written from (or first read into) keyed by its absolute path, so a
+later stage gets the dataframe, array or fitted object without reading the file again.
+An entry is dropped when the file changed on disk since it was stored. Dataframes and
+arrays are handed out as copies, the stages modify them in place; fitted objects are
+shared and must not be modified.
+"""
+from thyroid.artifact_io import read_artifact, write_artifact
+from thyroid.exception import ThyroidException
+from thyroid.logger import logging
+from thyroid import utils
+from typing import Callable, Dict, List, Optional, Tuple
+import pandas as pd
+import numpy as np
+import threading
+import time
+import os, sys
+
+
+class ArtifactStore:
+
+    def __init__(self):
+        try:
+            # absolute path -> (file signature, object)
+            self._entries:Dict[str, Tuple[tuple, object]] = {}
+            self._lock = threading.Lock()
+            self.disk_reads = 0
+            self.disk_read_seconds = 0.0
+            self.memory_hits = 0
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    @staticmethod
+    def _signature(file_path:str) -> tuple:
+        file_stat = os.stat(file_path)
+        return (file_stat.st_mtime_ns, file_stat.st_size)
+
+    def put(self, file_path:str, obj:object):
+        """
+        Keeps the object a file was just written from
+        """
+        try:
+            with self._lock:
+                self._entries[os.path.abspath(file_path)] = (self._signature(file_path), obj)
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def _get(self, file_path:str, load:Callable[[], object], keep:bool = True) -> object:
+        key = os.path.abspath(file_path)
+        signature = self._signature(file_path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == signature:
+                self.memory_hits += 1
+                return entry[1]
+
+        start = time.perf_counter()
+        obj = load()
+        with self._lock:
+            self.disk_reads += 1
+            self.disk_read_seconds += time.perf_counter() - start
+            if keep:
+                self._entries[key] = (signature, obj)
+        return obj
+
+    def read_dataframe(self, file_path:str, columns:Optional[List[str]] = None) -> pd.DataFrame:
+        try:
+            if columns is None:
+                return self._get(file_path, lambda: read_artifact(file_path)).copy()
+            # a projection is served from a stored frame, otherwise only the columns are read
+            df = self._get(file_path, lambda: read_artifact(file_path, columns=columns), keep=False)
+            return df[list(columns)].copy()
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def write_dataframe(self, df:pd.DataFrame, file_path:str):
+        try:
+            write_artifact(df, file_path)
+            self.put(file_path, df.copy())
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def load_numpy_array_data(self, file_path:str) -> np.ndarray:
+        try:
+            return self._get(file_path, lambda: utils.load_numpy_array_data(file_path=file_path)).copy()
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def save_numpy_array_data(self, file_path:str, array:np.ndarray):
+        try:
+            utils.save_numpy_array_data(file_path=file_path, array=array)
+            self.put(file_path, array.copy())
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def load_object(self, file_path:str) -> object:
+        try:
+            return self._get(file_path, lambda: utils.load_object(file_path=file_path))
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def save_object(self, file_path:str, obj:object):
+        try:
+            utils.save_object(file_path=file_path, obj=obj)
+            self.put(file_path, obj)
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"disk_reads": self.disk_reads, "memory_hits": self.memory_hits,
+                    "disk_read_seconds": round(self.disk_read_seconds, 3), "entries": len(self._entries)}
+
+    def log_stats(self):
+        logging.info(f"Artifact store: {self.stats()}")
@@ -0,0 +1,136 @@
+"""
+Bulk loading of a CSV export into the Mongo collection.
+
+The file is read in chunks, each chunk is turned into documents column by column (no
+transpose and JSON round trip) and inserted as unordered batches by a pool of workers
+while the next chunk is read. Every row gets a deterministic key in ROW_KEY_FIELD, the
+sha256 of the file content and the row number, under a unique index:
+
+    _row_key   "<first 16 bytes of the sha256 in hex>:<row number>"
+
+so loading the same file again inserts nothing new, rows already in the collection are
+rejected as duplicate keys (error 11000) and counted, not raised. The _id is left to the
+driver, an ObjectId of the insert time, which is what the watermark based ingestion
+follows: a file is picked up by the next incremental run whatever its modification time.
+
+"?" is read as missing and stored as null, which the ingestion decodes the same way, so a
+column has the same type in every chunk.
+"""
+from thyroid.exception import ThyroidException
+from thyroid.logger import logging
+from thyroid.utils import MISSING_VALUE_MARKER, ROW_KEY_FIELD
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Dict, List
+import pandas as pd
+import numpy as np
+import hashlib
+import time
+import os, sys
+
+DUPLICATE_KEY_ERROR_CODE = 11000
+
+
+def file_key(file_path:str) -> str:
+    """
+    Prefix of every row key of the file, the hash of its content
+    """
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as file_obj:
+        for block in iter(lambda: file_obj.read(1024 * 1024), b""):
+            sha256.update(block)
+    return sha256.hexdigest()[:32]
+
+
+def chunk_to_documents(df:pd.DataFrame, key:str, first_row:int) -> List[dict]:
+    """
+    Documents of a chunk with the values json.loads(df.T.to_json()) gives:
+    python ints, floats and strings, and None for missing values
+    """
+    names = list(df.columns)
+    columns = []
+    for name in names:
+        series = df[name]
+        missing = series.isna().to_numpy()
+        if missing.any():
+            values = series.to_numpy(dtype=object)
+            values[missing] = None
+            # numpy scalars left in the object array are converted by tolist
+            columns.append([value.item() if isinstance(value, np.generic) else value for value in values])
+        else:
+            columns.append(series.tolist())
+
+    documents = []
+    for row, values in enumerate(zip(*columns), start=first_row):
+        document = dict(zip(names, values))
+        document[ROW_KEY_FIELD] = f"{key}:{row}"
+        documents.append(document)
+    return documents
+
+
+def insert_batch(collection, documents:List[dict]) -> Dict[str, int]:
+    """
+    Unordered insert of a batch, duplicate keys from an earlier load are counted
+    """
+    import pymongo.errors
+
+    try:
+        result = collection.insert_many(documents, ordered=False)
+        return {"inserted": len(result.inserted_ids), "duplicates": 0}
+    except pymongo.errors.BulkWriteError as e:
+        write_errors = e.details.get("writeErrors", [])
+        other_errors = [error for error in write_errors if error.get("code") != DUPLICATE_KEY_ERROR_CODE]
+        if other_errors:
+            raise
+        return {"inserted": e.details.get("nInserted", 0), "duplicates": len(write_errors)}
+
+
+class BulkLoader:
+
+    def __init__(self, collection, chunk_size:int = 50000, batch_size:int = 5000, n_workers:int = 4):
+        try:
+            self.collection = collection
+            # rows read from the file at a time and documents sent per insert_many
+            self.chunk_size = chunk_size
+            self.batch_size = batch_size
+            self.n_workers = n_workers
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def load(self, file_path:str) -> Dict[str, float]:
+        """
+        Loads a CSV file and returns the number of rows read, inserted and already present
+        and the rows per second
+        """
+        try:
+            start = time.perf_counter()
+            key = file_key(file_path)
+            # sparse, documents inserted by other writers have no row key
+            self.collection.create_index(ROW_KEY_FIELD, unique=True, sparse=True)
+            logging.info(f"Loading [{file_path}] into [{self.collection.name}] with {self.n_workers} workers")
+
+            counts = {"rows": 0, "inserted": 0, "duplicates": 0}
+            pending:List[Future] = []
+
+            def collect(limit:int):
+                # keeps at most limit batches in flight, bounding the documents in memory
+                while len(pending) > limit:
+                    result = pending.pop(0).result()
+                    counts["inserted"] += result["inserted"]
+                    counts["duplicates"] += result["duplicates"]
+
+            with ThreadPoolExecutor(max_workers=self.n_workers) as executor:
+                for chunk in pd.read_csv(file_path, chunksize=self.chunk_size, na_values=[MISSING_VALUE_MARKER]):
+                    documents = chunk_to_documents(chunk, key=key, first_row=counts["rows"])
+                    counts["rows"] += len(chunk)
+                    for batch_start in range(0, len(documents), self.batch_size):
+                        pending.append(executor.submit(insert_batch, self.collection,
+                                                       documents[batch_start:batch_start + self.batch_size]))
+                    collect(limit=2 * self.n_workers)
+                collect(limit=0)
+
+            seconds = time.perf_counter() - start
+            report = dict(counts, seconds=round(seconds, 3), rows_per_second=round(counts["rows"] / seconds, 1) if seconds else 0.0)
+            logging.info(f"Bulk load report: {report}")
+            return report
+        except Exception as e:
+            raise ThyroidException(e, sys)
@@ -2,37 +2,46 @@ from thyroid.logger import logging
 from thyroid.exception import ThyroidException
 import pandas as pd 
 import numpy as np 
-from sklearn.model_selection import train_test_split
 from thyroid.entity import config_entity, artifact_entity
-from thyroid import utils
+from thyroid.feature_store import FeatureStore
+from thyroid.artifact_store import ArtifactStore
+from typing import Optional
+from thyroid.config import get_mongo_client
 import os, sys
 
 class DataIngestion:
-    def __init__(self,data_ingestion_config:config_entity.DataIngestionConfig):
+    def __init__(self,data_ingestion_config:config_entity.DataIngestionConfig, collection=None,
+                artifact_store:Optional[ArtifactStore]=None):
         try:
             logging.info(f"{'>'*30} Data Ingestion Initiated {'<'*30}")
             self.data_ingestion_config = data_ingestion_config 
+            # collection to read instead of the configured mongo client, e.g. a mongomock collection
+            self.collection = collection
+            # artifacts of the run kept in memory by earlier stages, a private store reads from disk
+            self.artifact_store = artifact_store or ArtifactStore()
         except Exception as e:
             raise ThyroidException(e, sys)
 
     def initiate_data_ingestion(self)-> artifact_entity.DataIngestionArtifact:
         try:
-            logging.info(f"Exporting the collection as dataframe")
-            
-            df:pd.DataFrame = utils.get_collection_as_dataframe(database_name=self.data_ingestion_config.database_name, 
-                                                                collection_name=self.data_ingestion_config.collection_name)
+            from sklearn.model_selection import train_test_split
 
-            logging.info(f"Replacing the '?' with nan values")
-            df.replace(to_replace="?",value=np.NAN, inplace=True)
+            # pulling the documents added since the last run into the persistent feature store
+            logging.info(f"Updating the persistent feature store")
+            feature_store = FeatureStore(store_dir=self.data_ingestion_config.persistent_feature_store_dir,
+                                         watermark_field=self.data_ingestion_config.watermark_field,
+                                         overlap_seconds=self.data_ingestion_config.watermark_overlap_seconds,
+                                         artifact_format=self.data_ingestion_config.artifact_format)
+            collection = self.collection
+            if collection is None:
+                collection = get_mongo_client()[self.data_ingestion_config.database_name][self.data_ingestion_config.collection_name]
+            n_new_rows = feature_store.ingest(collection=collection, batch_size=self.data_ingestion_config.batch_size,
+                                              full_refresh=self.data_ingestion_config.full_refresh)
 
-            # creating feature store dir
-            logging.info(f"Creating feature store folder if not availabel")
-            feature_store_dir = os.path.dirname(self.data_ingestion_config.feature_store_file_path)
-            os.makedirs(feature_store_dir, exist_ok=True)
-
-            # saving the data to feature store
-            logging.info(f"Saving the data to feature store")
-            df.to_csv(path_or_buf=self.data_ingestion_config.feature_store_file_path, index=False, header=True)
+            # the run's feature store file is rebuilt from every committed part
+            logging.info(f"Exporting the feature store to [{self.data_ingestion_config.feature_store_file_path}]")
+            df:pd.DataFrame = feature_store.export(file_path=self.data_ingestion_config.feature_store_file_path)
+            logging.info(f"Saved {len(df)} rows to feature store, {n_new_rows} of them new")
 
             # splitting the dataset
             logging.info(f"Splitting the dataset")
@@ -45,8 +54,8 @@ class DataIngestion:
 
             # saving the train_df and test_df into dataset dir 
             logging.info(f"Saving the train_df and test_df into dataset dir")
-            train_df.to_csv(path_or_buf = self.data_ingestion_config.train_file_path, index=False, header=True)
-            test_df.to_csv(path_or_buf= self.data_ingestion_config.test_file_path, index=False, header=True)
+            self.artifact_store.write_dataframe(train_df, self.data_ingestion_config.train_file_path)
+            self.artifact_store.write_dataframe(test_df, self.data_ingestion_config.test_file_path)
 
             # preparing the artifacts
             data_ingestion_artifact = artifact_entity.DataIngestionArtifact(
@@ -1,37 +1,38 @@
-from thyroid import utils
+from thyroid.artifact_store import ArtifactStore
 from thyroid.entity import config_entity, artifact_entity
 from thyroid.exception import ThyroidException
 from thyroid.logger import logging
-from typing import Optional
+from typing import Optional, TYPE_CHECKING
 import os, sys
-from sklearn.pipeline import Pipeline 
 import pandas as pd 
 import numpy as np 
-from sklearn.preprocessing import LabelEncoder
 from thyroid.config import TARGET_COLUMN, CATEGORICAL_COLUMN
-from sklearn.impute import SimpleImputer
-from sklearn.compose import ColumnTransformer
-from imblearn.over_sampling import SMOTENC,RandomOverSampler,KMeansSMOTE
-from sklearn.impute import KNNImputer
-from sklearn.preprocessing import StandardScaler, OneHotEncoder
-from sklearn.compose import make_column_selector as selector
-from sklearn.preprocessing import FunctionTransformer
-from sklearn.preprocessing import OrdinalEncoder
-from sklearn.model_selection import train_test_split
+from thyroid.imputation import impute
+
+# sklearn and imblearn are imported where they are used, importing this module stays cheap
+if TYPE_CHECKING:
+    from sklearn.pipeline import Pipeline
 
 class DataTransformation:
     def __init__(self, data_transformation_config:config_entity.DataTransformationConfig,
-                        data_ingestion_artifact:artifact_entity.DataIngestionArtifact):
+                        data_ingestion_artifact:artifact_entity.DataIngestionArtifact,
+                        artifact_store:Optional[ArtifactStore]=None):
         try:
             logging.info(f"{'>'*30} Data Transformatin Initiated {'<'*30}")
             self.data_transformation_config = data_transformation_config
             self.data_ingestion_artifact = data_ingestion_artifact
+            # artifacts of the run kept in memory by earlier stages, a private store reads from disk
+            self.artifact_store = artifact_store or ArtifactStore()
         except Exception as e:
             raise ThyroidException(e, sys)
     
     @classmethod
-    def get_data_transformer_object(self) -> Pipeline:
+    def get_data_transformer_object(self) -> "Pipeline":
         try:
+            from sklearn.pipeline import Pipeline
+            from sklearn.compose import ColumnTransformer
+            from sklearn.preprocessing import OneHotEncoder, OrdinalEncoder
+
             # define pipeline with encoder
             encoder_pipeline = Pipeline(steps=[('encoder', OrdinalEncoder())])
 
@@ -53,6 +54,9 @@ class DataTransformation:
             raise ThyroidException(e, sys)
 
     def data_balancing(self, train_input:np.array, test_input:np.array, train_target:np.array, test_target:np.array):
+        from sklearn.model_selection import train_test_split
+        from imblearn.over_sampling import RandomOverSampler
+
         # concatenating input data
         input_data=np.vstack((train_input, test_input))
         
@@ -60,8 +64,9 @@ class DataTransformation:
         target_data=np.concatenate((train_target, test_target))
 
         # imputing the missing data
-        imputer=KNNImputer(n_neighbors=3, weights='uniform',missing_values=np.nan)
-        input_data = imputer.fit_transform(input_data)
+        config = self.data_transformation_config
+        input_data = impute(input_data, target_data, strategy=config.imputation_strategy, n_neighbors=config.imputation_neighbors,
+                            chunk_size=config.imputation_chunk_size, n_jobs=config.imputation_n_jobs)
 
         # balcing the dataset
         rdsmple = RandomOverSampler()
@@ -74,9 +79,11 @@ class DataTransformation:
 
     def initiate_data_transformation(self)->artifact_entity.DataTransformationArtifact:
         try:
+            from sklearn.preprocessing import LabelEncoder
+
             # reading training and test file
-            train_df = pd.read_csv(self.data_ingestion_artifact.train_file_path)
-            test_df = pd.read_csv(self.data_ingestion_artifact.test_file_path)
+            train_df = self.artifact_store.read_dataframe(self.data_ingestion_artifact.train_file_path)
+            test_df = self.artifact_store.read_dataframe(self.data_ingestion_artifact.test_file_path)
 
             # selecting input feature for train and test dataframe
             input_feature_train_df = train_df.drop(TARGET_COLUMN, axis=1)
@@ -128,16 +135,16 @@ class DataTransformation:
             test_arr = np.c_[input_feature_test_arr, target_feature_test_arr]
 
             #save numpy array
-            utils.save_numpy_array_data(file_path=self.data_transformation_config.transformed_train_path,
+            self.artifact_store.save_numpy_array_data(file_path=self.data_transformation_config.transformed_train_path,
                                         array=train_arr)
 
-            utils.save_numpy_array_data(file_path=self.data_transformation_config.transformed_test_path,
+            self.artifact_store.save_numpy_array_data(file_path=self.data_transformation_config.transformed_test_path,
                                         array=test_arr)
 
-            utils.save_object(file_path=self.data_transformation_config.transform_object_path,
+            self.artifact_store.save_object(file_path=self.data_transformation_config.transform_object_path,
                                     obj=transformation_pipeline)
 
-            utils.save_object(file_path=self.data_transformation_config.target_encoder_path,
+            self.artifact_store.save_object(file_path=self.data_transformation_config.target_encoder_path,
                                     obj=label_encoder)
 
             data_transformation_artifact = artifact_entity.DataTransformationArtifact(
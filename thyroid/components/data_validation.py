@@ -5,26 +5,77 @@ import os, sys
 import pandas as pd 
 import numpy as np 
 from thyroid.entity import config_entity, artifact_entity
-from scipy.stats import ks_2samp
-from thyroid.config import TARGET_COLUMN, NUMERICAL_COLUMN
+from thyroid.config import TARGET_COLUMN, NUMERICAL_COLUMN, CATEGORICAL_COLUMN
 import yaml
-from typing import Optional, List
-from thyroid import utils
+from typing import Iterator, Optional, List
+from thyroid import utils, drift
+from thyroid.artifact_store import ArtifactStore
+from thyroid.artifact_io import iter_artifact_chunks
 
 
 class DataValidation:
     def __init__(self, 
                 data_validation_config:config_entity.DataValidationConfig,
-                data_ingestion_artifact:artifact_entity.DataIngestionArtifact):
+                data_ingestion_artifact:artifact_entity.DataIngestionArtifact,
+                artifact_store:Optional[ArtifactStore]=None):
         try:
             logging.info(f"{'>'*30} Data Validation Initiated {'<'*30}")
             self.data_validation_config = data_validation_config
             self.data_ingestion_artifact =data_ingestion_artifact
+            # artifacts of the run kept in memory by earlier stages, a private store reads from disk
+            self.artifact_store = artifact_store or ArtifactStore()
             self.validation_error = dict() # this line of code create empty dictonary
         
         except Exception as e:
             raise ThyroidException(e, sys)
 
+    def read_chunks(self, file_path:str, base:bool = False) -> Iterator[pd.DataFrame]:
+        """
+        Chunks of a dataset, the whole dataset is one chunk unless a chunk size is configured.
+        The base dataset is a csv with '?' for missing values, the splits are artifacts.
+        """
+        chunk_size = self.data_validation_config.chunk_size
+        if base:
+            chunks = pd.read_csv(file_path, chunksize=chunk_size) if chunk_size else [pd.read_csv(file_path)]
+            for df in chunks:
+                df.replace({'?':np.NAN}, inplace=True)
+                yield df
+        elif chunk_size:
+            yield from iter_artifact_chunks(file_path, chunk_size=chunk_size)
+        else:
+            yield self.artifact_store.read_dataframe(file_path)
+
+    def scan_dataset(self, chunks:Iterator[pd.DataFrame], accumulator) -> dict:
+        """
+        This function streams a dataset once and keeps only counts, so the memory depends
+        on the chunk size and not on the dataset
+
+        chunks : dataframes of the dataset
+        accumulator : drift.ProfileBuilder or drift.DriftAccumulator, every chunk is added to it
+        ===========================================================================================
+        return rows, columns, null count per column and the non numeric values per numerical column
+        """
+        try:
+            rows, columns, null_counts, dtype_anomalies = 0, None, None, {}
+            for df in chunks:
+                if columns is None:
+                    columns = list(df.columns)
+                    null_counts = pd.Series(0, index=columns, dtype=np.int64)
+                rows += len(df)
+                null_counts = null_counts.add(df.isna().sum(), fill_value=0)
+
+                # values present in a numerical column which are not numbers
+                for column in NUMERICAL_COLUMN:
+                    if column in df.columns and not pd.api.types.is_numeric_dtype(df[column]):
+                        values = df[column]
+                        anomalies = int((values.notna() & pd.to_numeric(values, errors="coerce").isna()).sum())
+                        if anomalies > 0:
+                            dtype_anomalies[column] = dtype_anomalies.get(column, 0) + anomalies
+                accumulator.add(df)
+            return {"rows": rows, "columns": columns or [], "null_counts": null_counts, "dtype_anomalies": dtype_anomalies}
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
     def drop_missing_values(self, df:pd.DataFrame, report_key_name:str)->Optional[pd.DataFrame]:
         """
         This function will drop columns which contains missing value more than specified threshold
@@ -35,17 +86,10 @@ class DataValidation:
         return pandas dataframe if atleast a single column is available after missing column drop else None
         """
         try:
-            threshold = self.data_validation_config.missing_threshold 
-            null_report = df.isna().sum()/df.shape[0]
+            drop_column_name = self.missing_value_columns(summary={"rows": df.shape[0], "null_counts": df.isna().sum()},
+                                                          report_key_name=report_key_name)
 
-            # selecting column which contains the null
-            logging.info(f"Selecting the column name which contaion null above the threshold of {threshold}")
-            drop_column_name = null_report[null_report>threshold].index
-
-            logging.info(f"Columns to drop: {list(drop_column_name)}")
-            self.validation_error[report_key_name]=list(drop_column_name)
-
-            df.drop(list(drop_column_name), axis=1, inplace=True)
+            df.drop(drop_column_name, axis=1, inplace=True)
             logging.info(f"Columns dropped")
 
             # return none if no column left
@@ -56,12 +100,39 @@ class DataValidation:
         except Exception as e:
             raise ThyroidException(e, sys)
 
-    def is_required_column_exist(self, base_df:pd.DataFrame, current_df:pd.DataFrame, report_key_name:str) ->bool:
+    def missing_value_columns(self, summary:dict, report_key_name:str) -> List[str]:
+        """
+        This function selects the columns which contain missing values above the threshold,
+        from the counts of a dataset streamed in chunks, drop_missing_values uses it on a dataframe
+
+        summary : counts of the dataset from scan_dataset
+        threshold : percentage criteria to drop columns
+        ===========================================================================================
+        return names of the columns to drop
+        """
         try:
-            # get the column name in base and current dataframe
-            base_columns = base_df.columns
-            current_columns = current_df.columns
+            threshold = self.data_validation_config.missing_threshold
+            null_report = summary["null_counts"]/summary["rows"] if summary["null_counts"] is not None else pd.Series(dtype=np.float64)
+
+            # selecting column which contains the null
+            logging.info(f"Selecting the column name which contaion null above the threshold of {threshold}")
+            drop_column_name = list(null_report[null_report>threshold].index)
+
+            logging.info(f"Columns to drop: {drop_column_name}")
+            self.validation_error[report_key_name]=drop_column_name
+            return drop_column_name
 
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def record_dtype_anomalies(self, summary:dict, report_key_name:str):
+        # reported only when a numerical column holds values which are not numbers
+        if len(summary["dtype_anomalies"]) > 0:
+            logging.info(f"Non numeric values in numerical columns: {summary['dtype_anomalies']}")
+            self.validation_error[report_key_name] = summary["dtype_anomalies"]
+
+    def is_required_column_exist(self, base_columns:List[str], current_columns:List[str], report_key_name:str) ->bool:
+        try:
             # initializing an empty list to store missing columns
             missing_column = []
 
@@ -82,74 +153,100 @@ class DataValidation:
         except Exception as e:
             raise ThyroidException(e, sys)
 
-    def data_drift(self, base_df:pd.DataFrame, current_df:pd.DataFrame,column_list:List, report_key_name:str):
+    def get_reference_profile(self) -> dict:
+        """
+        Sketches of the cleaned base dataset, read from the profile file while the base file
+        is unchanged, so the base dataset is read and cleaned once and not on every run.
+        In chunked mode the sketches are merged chunk by chunk.
+        """
         try:
-            # initializing an empty dictonary to store the data drift
-            drift_report = dict()
+            config = self.data_validation_config
+            base_stat = os.stat(config.base_file_path)
+            signature = {"base_file_path": os.path.abspath(config.base_file_path), "size": base_stat.st_size,
+                         "mtime_ns": base_stat.st_mtime_ns, "missing_threshold": config.missing_threshold,
+                         "sample_size": config.reference_sample_size, "bins": config.drift_bins,
+                         "chunk_size": config.chunk_size}
 
-            base_columns = base_df[column_list]
-            current_columns = current_df[column_list]
+            profile = drift.load_reference_profile(config.reference_profile_path)
+            if profile is not None and profile.get("signature") == signature:
+                logging.info(f"Using the reference profile: [{config.reference_profile_path}]")
+                self.validation_error["missing_values_within_base_dataset"] = profile["dropped_columns"]
+                self.record_dtype_anomalies(summary=profile, report_key_name="dtype_anomalies_within_base_dataset")
+                return profile
 
-            for base_column in base_columns:
-                # get the data for corresponding column in which current dataframe
-                base_data, current_data = base_df[base_column], current_df[base_column]
-
-                # null hypothesis is that both columns are drawn from same distribution 
-                same_distribution = ks_2samp(data1=base_data, data2=current_data)
-
-                logging.info(f"Checking null hypothesis")
-                # checking if null hypothesis is rejected or accepted 
-                if same_distribution.pvalue > 0.05:
-                    # we are accepting the null hypothesis 
-                    drift_report[base_column] ={
-                        "pvalue":float(same_distribution.pvalue),
-                        "same_distribution":True
-                    }
-                else:
-                    drift_report[base_column] ={
-                        "pvalue":float(same_distribution),
-                        "same_distribution":False
-                    }
-            
-            # add the drift report to validation error directory
-            self.validation_error[report_key_name] = drift_report
+            logging.info(f"Reading the base dataset")
+            builder = drift.ProfileBuilder(numerical_columns=NUMERICAL_COLUMN, categorical_columns=CATEGORICAL_COLUMN,
+                                           sample_size=config.reference_sample_size, n_bins=config.drift_bins)
+            summary = self.scan_dataset(self.read_chunks(config.base_file_path, base=True), accumulator=builder)
+
+            logging.info(f"Dropping null values columns from the base dataset")
+            drop_columns = self.missing_value_columns(summary=summary, report_key_name="missing_values_within_base_dataset")
+            if len(drop_columns) == len(summary["columns"]):
+                raise Exception(f"No column left in the base dataset after dropping the columns with missing values")
+            self.record_dtype_anomalies(summary=summary, report_key_name="dtype_anomalies_within_base_dataset")
+
+            logging.info(f"Building the reference profile of the base dataset")
+            profile = builder.profile(drop_columns=drop_columns)
+            profile["signature"] = signature
+            profile["dropped_columns"] = drop_columns
+            profile["dtype_anomalies"] = summary["dtype_anomalies"]
+            drift.save_reference_profile(profile, config.reference_profile_path)
+            return profile
+        except Exception as e:
+            raise ThyroidException(e, sys)
 
+    def data_drift(self, accumulator:drift.DriftAccumulator, columns:List[str], report_key_name:str, statistics_key_name:str):
+        try:
+            # null hypothesis is that both columns are drawn from same distribution, every
+            # profiled column is tested against the sketch of the base dataset in one pass:
+            # KS for numerical columns, chi-square for categorical columns, PSI for both
+            logging.info(f"Checking null hypothesis")
+            statistics = accumulator.report(pvalue_threshold=self.data_validation_config.drift_pvalue_threshold, columns=columns)
+
+            # add the drift report to validation error directory, the numerical columns with
+            # their pvalue as before, every test statistic under its own key
+            self.validation_error[report_key_name] = {
+                column: {"pvalue": statistics[column]["pvalue"], "same_distribution": statistics[column]["same_distribution"]}
+                for column in NUMERICAL_COLUMN if column in statistics}
+            self.validation_error[statistics_key_name] = statistics
+
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def validate_dataset(self, file_path:str, reference_profile:dict, dataset_name:str):
+        """
+        Validates one split in a single pass: missing values, missing columns, dtype anomalies and drift
+        """
+        try:
+            accumulator = drift.DriftAccumulator(reference_profile)
+            summary = self.scan_dataset(self.read_chunks(file_path), accumulator=accumulator)
+
+            logging.info(f"Drop null values column {dataset_name} df")
+            drop_columns = self.missing_value_columns(summary=summary, report_key_name=f"missing_values_within_{dataset_name}_dataset")
+            self.record_dtype_anomalies(summary=summary, report_key_name=f"dtype_anomalies_within_{dataset_name}_dataset")
+            current_columns = [column for column in summary["columns"] if column not in drop_columns]
+            if len(current_columns) == 0:
+                raise Exception(f"No column left in the {dataset_name} dataset after dropping the columns with missing values")
+
+            logging.info(f"Checking is all required columns are present in {dataset_name} df")
+            columns_status = self.is_required_column_exist(base_columns=reference_profile["columns"], current_columns=current_columns,
+                                                           report_key_name=f"missing_columns_within_{dataset_name}_dataset")
+            if columns_status:
+                logging.info(f"As all columns are availabel in {dataset_name} df hence detecting data drift")
+                self.data_drift(accumulator=accumulator, columns=current_columns, report_key_name=f"data_drift_within_{dataset_name}_dataset",
+                                statistics_key_name=f"drift_statistics_within_{dataset_name}_dataset")
         except Exception as e:
             raise ThyroidException(e, sys)
 
     def initiate_data_validation(self) ->artifact_entity.DataValidationArtifact:
         try:
-            logging.info(f"Reading the dataframe")
-            base_df = pd.read_csv(self.data_validation_config.base_file_path)
-            logging.info(f"Replacing '?' values in df")
-            base_df.replace({'?':np.NAN}, inplace=True)
-
-            logging.info(f"Dropping null values columns from the base_df")
-            base_df = self.drop_missing_values(df=base_df, report_key_name="missing_values_within_base_dataset")
-
-            logging.info(f"Reading the train dataframe")
-            train_df = pd.read_csv(self.data_ingestion_artifact.train_file_path)
-            logging.info(f"Reading the test dataframe")
-            test_df = pd.read_csv(self.data_ingestion_artifact.test_file_path)
-
-            logging.info(f"Drop null values column train df")
-            train_df = self.drop_missing_values(df=train_df, report_key_name="missing_values_within_train_dataset")
-            logging.info(f"Drop null values column test df")
-            test_df = self.drop_missing_values(df=test_df, report_key_name="missing_values_within_test_dataset")
-
-            exclude_columns = [TARGET_COLUMN]
-
-            logging.info(f"Checking is all required columns are present in train df")
-            train_df_columns_status = self.is_required_column_exist(base_df=base_df, current_df=train_df, report_key_name="missing_columns_within_train_dataset")
-            logging.info(f"Checking is all required columns are present in train df")
-            test_df_columns_status = self.is_required_column_exist(base_df=base_df, current_df=test_df, report_key_name="missing_columns_within_test_dataset")
-
-            if train_df_columns_status:
-                logging.info(f"As all columns are availabel in train df hence detecting data drift")
-                self.data_drift(base_df=base_df, current_df=train_df, column_list=NUMERICAL_COLUMN, report_key_name="data_drift_within_train_dataset")
-            if test_df_columns_status:
-                logging.info(f"As all columns are availabel in test df hence detecting data drift")
-                self.data_drift(base_df=base_df, current_df=test_df, column_list=NUMERICAL_COLUMN, report_key_name="data_drift_within_test_dataset")
+            reference_profile = self.get_reference_profile()
+
+            # the whole split or one chunk at a time, see DataValidationConfig.chunk_size
+            logging.info(f"Validating the train dataset")
+            self.validate_dataset(self.data_ingestion_artifact.train_file_path, reference_profile=reference_profile, dataset_name="train")
+            logging.info(f"Validating the test dataset")
+            self.validate_dataset(self.data_ingestion_artifact.test_file_path, reference_profile=reference_profile, dataset_name="test")
 
             #write the report
             logging.info("Write reprt in yaml file")
@@ -1,20 +1,29 @@
 from thyroid.predictor import ModelResolver
+from thyroid.registry import file_sha256
 from thyroid.entity import config_entity, artifact_entity
+from thyroid.entity.config_entity import TRANSFORMER_OBJECT_FILE_NAME, MODEL_FILE_NAME, TARGET_ENCODER_OBJECT_FILE_NAME
 from thyroid.logger import logging
 from thyroid.exception import ThyroidException
-from thyroid.utils import load_object
+from thyroid.utils import write_yaml_file
+from thyroid.artifact_store import ArtifactStore
 from thyroid.config import TARGET_COLUMN
-from sklearn.metrics import f1_score
-import pandas as pd 
-import os, sys 
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+import pandas as pd
+import numpy as np
+import time
+import os, sys
+
+CANDIDATE_NAME = "candidate"
 
 class ModelEvaluation:
-    
-    def __init__(self, 
+
+    def __init__(self,
             model_eval_config:config_entity.ModelEvaluationConfig,
             data_ingestion_artifact:artifact_entity.DataIngestionArtifact,
             data_transformation_artifact:artifact_entity.DataTransformationArtifact,
-            model_trainer_artifact:artifact_entity.ModelTrainerArtifact):
+            model_trainer_artifact:artifact_entity.ModelTrainerArtifact,
+            artifact_store:Optional[ArtifactStore]=None):
 
         try:
             logging.info(f"{'>'*30} Model Evaluation Initiated {'<'*30}")
@@ -22,13 +31,79 @@ class ModelEvaluation:
             self.data_ingestion_artifact = data_ingestion_artifact
             self.data_transformation_artifact = data_transformation_artifact
             self.model_trainer_artifact = model_trainer_artifact
+            # artifacts of the run kept in memory by earlier stages, a private store reads from disk
+            self.artifact_store = artifact_store or ArtifactStore()
             self.model_resolver=ModelResolver()
         except Exception as e:
             raise ThyroidException(e, sys)
-    
+
+    def get_contenders(self) -> List[dict]:
+        """
+        The candidate and the last num_previous_versions registry versions, each with the
+        paths of its objects and the content hash of its transformer
+        """
+        try:
+            resolver = self.model_resolver
+            contenders = [{
+                "name": CANDIDATE_NAME,
+                "transformer_path": self.data_transformation_artifact.transform_object_path,
+                "model_path": self.model_trainer_artifact.model_path,
+                "target_encoder_path": self.data_transformation_artifact.target_encoder_path,
+            }]
+            for dir_path in resolver.get_latest_dir_paths(limit=self.model_eval_config.num_previous_versions):
+                contenders.append({
+                    "name": os.path.basename(dir_path),
+                    "transformer_path": os.path.join(dir_path, resolver.transformer_dir_name, TRANSFORMER_OBJECT_FILE_NAME),
+                    "model_path": os.path.join(dir_path, resolver.model_dir_name, MODEL_FILE_NAME),
+                    "target_encoder_path": os.path.join(dir_path, resolver.target_encoder_dir_name, TARGET_ENCODER_OBJECT_FILE_NAME),
+                })
+
+            # registered versions already carry the hash in the manifest
+            manifest = resolver.registry_manifest.load() or {"versions": {}}
+            transformer_key = os.path.join(resolver.transformer_dir_name, TRANSFORMER_OBJECT_FILE_NAME)
+            for contender in contenders:
+                artifact = manifest["versions"].get(contender["name"], {}).get("artifacts", {}).get(transformer_key)
+                contender["transformer_sha256"] = artifact["sha256"] if artifact else file_sha256(contender["transformer_path"])
+            return contenders
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def transform_test_data(self, transformer_path:str) -> np.ndarray:
+        transformer = self.artifact_store.load_object(file_path=transformer_path)
+        # only the columns the transformer was fitted on are read
+        test_df = self.artifact_store.read_dataframe(self.data_ingestion_artifact.test_file_path, columns=list(transformer.feature_names_in_))
+        return transformer.transform(test_df)
+
+    def score_contender(self, contender:dict, input_arr:np.ndarray, y_true:pd.Series) -> dict:
+        from sklearn.metrics import f1_score
+
+        model = self.artifact_store.load_object(file_path=contender["model_path"])
+        target_encoder = self.artifact_store.load_object(file_path=contender["target_encoder_path"])
+        # the pool already runs a model per core, each one predicts on a single thread so the
+        # threads of the models together do not oversubscribe the cores. The model object may be
+        # the one the pusher saves, its own setting is put back afterwards
+        has_n_jobs = hasattr(model, "set_params") and "n_jobs" in model.get_params()
+        n_jobs = model.get_params()["n_jobs"] if has_n_jobs else None
+        if has_n_jobs:
+            model.set_params(n_jobs=1)
+        try:
+            start = time.perf_counter()
+            # scored on the class names, versions may have been fitted with different target encoders
+            y_pred = target_encoder.inverse_transform(model.predict(input_arr))
+            prediction_seconds = time.perf_counter() - start
+        finally:
+            if has_n_jobs:
+                model.set_params(n_jobs=n_jobs)
+        return {
+            "model": contender["name"],
+            "f1_score": float(f1_score(y_true=y_true, y_pred=y_pred, average='weighted')),
+            "transformer_sha256": contender["transformer_sha256"],
+            "prediction_seconds": round(prediction_seconds, 4),
+        }
+
     def initiate_model_evaluation(self)->artifact_entity.ModelEvaluationArtifact:
         try:
-            #if saved model folder has model the we will compare 
+            #if saved model folder has model the we will compare
             #which model is best trained or the model from saved model folder
 
             logging.info("if saved model folder has model the we will compare "
@@ -39,55 +114,47 @@ class ModelEvaluation:
                 improved_accuracy=None)
                 logging.info(f"Model evaluation artifact: {model_eval_artifact}")
                 return model_eval_artifact
-            
-            # finding location of transformer model and target encoder
-            logging.info(f"Finding location of transformer, model and target encoder")
-            transformer_path = self.model_resolver.get_latest_transformer_path()
-            model_path = self.model_resolver.get_latest_model_path()
-            target_encoder_path = self.model_resolver.get_latest_target_encoder_path()
-
-            logging.info(f"Previous trained object of transformer, model and target encoder")
-            # previous trained objects
-            transformer = load_object(file_path=transformer_path)
-            model = load_object(file_path=model_path)
-            target_encoder = load_object(file_path=target_encoder_path)
-
-            logging.info(f"Currently trained model object")
-            # currently trained model objects
-            current_transformer = load_object(file_path=self.data_transformation_artifact.transform_object_path)
-            current_model = load_object(file_path=self.model_trainer_artifact.model_path)
-            current_target_encoder = load_object(file_path=self.data_transformation_artifact.target_encoder_path)
-
-            test_df = pd.read_csv(self.data_ingestion_artifact.test_file_path)
-            target_df = test_df[TARGET_COLUMN]
-            y_true = target_encoder.transform(target_df)
-
-            # accuracy using previous trained model
-            input_feature_name = list(transformer.feature_names_in_)
-            logging.info(f"Input feature name: {list(transformer.feature_names_in_)}")
-            input_arr = transformer.transform(test_df[input_feature_name])
-            y_pred = model.predict(input_arr)
-            print(f"Prediction using previous model: {target_encoder.inverse_transform(y_pred[:5])}")
-            previous_model_score = f1_score(y_true=y_true, y_pred=y_pred, average='weighted')
-            logging.info(f"Accuracy using previous trained model: {previous_model_score}")
 
-            # accuracy using current trained model
-            input_feature_name = list(current_transformer.feature_names_in_)
-            input_arr = current_transformer.transform(test_df[input_feature_name])
-            y_pred = current_model.predict(input_arr)
-            y_true = current_target_encoder.transform(target_df)
-            print(f"Prediction using trained model: {current_target_encoder.inverse_transform(y_pred[:5])}")
-            current_model_score = f1_score(y_true=y_true, y_pred=y_pred, average='weighted')
+            contenders = self.get_contenders()
+            y_true = self.artifact_store.read_dataframe(self.data_ingestion_artifact.test_file_path, columns=[TARGET_COLUMN])[TARGET_COLUMN].astype(str)
+
+            # the test data is read and transformed once per distinct transformer, not once per model
+            transformer_paths:Dict[str, str] = {}
+            for contender in contenders:
+                transformer_paths.setdefault(contender["transformer_sha256"], contender["transformer_path"])
+            logging.info(f"Scoring {len(contenders)} models with {len(transformer_paths)} distinct transformers "
+                         f"on {self.model_eval_config.n_workers} workers")
+
+            with ThreadPoolExecutor(max_workers=self.model_eval_config.n_workers) as executor:
+                transform_futures = {sha256: executor.submit(self.transform_test_data, transformer_path)
+                                     for sha256, transformer_path in transformer_paths.items()}
+                input_arrs = {sha256: future.result() for sha256, future in transform_futures.items()}
+                score_futures = [executor.submit(self.score_contender, contender, input_arrs[contender["transformer_sha256"]], y_true)
+                                 for contender in contenders]
+                scores = [future.result() for future in score_futures]
+
+            leaderboard = sorted(scores, key=lambda score: score["f1_score"], reverse=True)
+            for rank, score in enumerate(leaderboard, start=1):
+                score["rank"] = rank
+                logging.info(f"Rank {rank}: model [{score['model']}] f1 score {score['f1_score']}")
+            write_yaml_file(file_path=self.model_eval_config.leaderboard_file_path,
+                            data={"test_file_path": self.data_ingestion_artifact.test_file_path,
+                                  "test_records": int(len(y_true)), "leaderboard": leaderboard})
+
+            # the candidate is accepted when it beats the latest version
+            scores_by_model = {score["model"]: score["f1_score"] for score in scores}
+            current_model_score = scores_by_model[CANDIDATE_NAME]
+            previous_model_score = scores_by_model[os.path.basename(latest_dir_path)]
+            logging.info(f"Accuracy using previous trained model: {previous_model_score}")
             logging.info(f"Accuracy using current trained model: {current_model_score}")
             if current_model_score <= previous_model_score:
                 logging.info(f"Current trained model is not better than previous model")
                 raise Exception("Current trained model is not better than previous model")
-            
-            model_eval_artifact = artifact_entity.ModelEvaluationArtifact(is_model_accepted=True, 
-            improved_accuracy= current_model_score - previous_model_score)
+
+            model_eval_artifact = artifact_entity.ModelEvaluationArtifact(is_model_accepted=True,
+            improved_accuracy= current_model_score - previous_model_score,
+            leaderboard_file_path=self.model_eval_config.leaderboard_file_path)
             logging.info(f"Model eval artifact: {model_eval_artifact}")
             return model_eval_artifact
         except Exception as e:
             raise ThyroidException(e, sys)
-
-
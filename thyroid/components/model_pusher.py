@@ -1,52 +1,116 @@
 from thyroid.predictor import ModelResolver
-from thyroid.entity.config_entity import ModelPusherConfig
+from thyroid.entity.config_entity import ModelPusherConfig, MODEL_BUNDLE_FILE_NAME, TRANSFORMER_OBJECT_FILE_NAME, MODEL_FILE_NAME, TARGET_ENCODER_OBJECT_FILE_NAME, REFERENCE_PROFILE_FILE_NAME
+from thyroid.registry import ObjectStore, create_staging_dir, publish_staging_dir
+from thyroid.serving.model_bundle import write_model_bundle
 from thyroid.exception import ThyroidException
 from thyroid.logger import logging
-from thyroid.utils import load_object, save_object
-from thyroid.entity.artifact_entity import DataTransformationArtifact, ModelTrainerArtifact, ModelPusherArtifact
+from thyroid.artifact_store import ArtifactStore
+from typing import Optional
+from thyroid.entity.artifact_entity import DataIngestionArtifact, DataTransformationArtifact, ModelTrainerArtifact, ModelPusherArtifact
+from thyroid.config import NUMERICAL_COLUMN, CATEGORICAL_COLUMN
+from thyroid import drift
+import shutil
 import os, sys 
 
 class ModelPusher:
 
     def __init__(self, model_pusher_config:ModelPusherConfig,
                 data_transformation_artifact:DataTransformationArtifact,
-                model_trainer_artifact:ModelTrainerArtifact):
+                model_trainer_artifact:ModelTrainerArtifact,
+                artifact_store:Optional[ArtifactStore]=None,
+                data_ingestion_artifact:Optional[DataIngestionArtifact]=None):
         try:
-            logging.info(f"{'>'*30} Data Transformation {'<'*30}")
+            logging.info(f"{'>'*30} Model Pusher Initiated {'<'*30}")
             self.model_pusher_config = model_pusher_config 
             self.data_transformation_artifact = data_transformation_artifact
             self.model_trainer_artifact = model_trainer_artifact
+            # training split of the version, its profile is the reference of the online drift monitor
+            self.data_ingestion_artifact = data_ingestion_artifact
+            # artifacts of the run kept in memory by earlier stages, a private store reads from disk
+            self.artifact_store = artifact_store or ArtifactStore()
             self.model_resolver = ModelResolver(model_registery=self.model_pusher_config.saved_model_dir)
+            self.object_store = ObjectStore(registry_dir=self.model_pusher_config.saved_model_dir)
         except Exception as e:
             raise ThyroidException(e, sys)
 
+    def write_bundle(self, staging_dir:str, model_version:int):
+        # single file bundle of the same objects, served without unpickling
+        try:
+            transformer = self.artifact_store.load_object(file_path=self.data_transformation_artifact.transform_object_path)
+            model = self.artifact_store.load_object(file_path=self.model_trainer_artifact.model_path)
+            target_encoder = self.artifact_store.load_object(file_path=self.data_transformation_artifact.target_encoder_path)
+            write_model_bundle(file_path=os.path.join(staging_dir, MODEL_BUNDLE_FILE_NAME),
+                               transformer=transformer, model=model, target_encoder=target_encoder,
+                               model_version=str(model_version))
+        except Exception as e:
+            logging.info(f"Model bundle not written, the version is served from its pickles: {e}")
+
+    def write_reference_profile(self, staging_dir:str):
+        # profile of the training split the version was fitted on, served versions without one are not monitored
+        try:
+            if self.data_ingestion_artifact is None:
+                return
+            train_df = self.artifact_store.read_dataframe(self.data_ingestion_artifact.train_file_path)
+            profile = drift.build_reference_profile(train_df, numerical_columns=NUMERICAL_COLUMN, categorical_columns=CATEGORICAL_COLUMN,
+                                                    sample_size=self.model_pusher_config.reference_sample_size,
+                                                    n_bins=self.model_pusher_config.drift_bins)
+            drift.save_reference_profile(profile, os.path.join(staging_dir, REFERENCE_PROFILE_FILE_NAME))
+        except Exception as e:
+            logging.info(f"Reference profile not written, the version is served without drift monitoring: {e}")
+
     def initiate_model_pusher(self)->ModelPusherArtifact:
         try:
-            # load object
-            logging.info(f"Loading transformer model and target encoder")
-            transformer = load_object(file_path=self.data_transformation_artifact.transform_object_path)
-            model = load_object(file_path=self.model_trainer_artifact.model_path)
-            target_encoder = load_object(file_path=self.data_transformation_artifact.target_encoder_path)
-
-            # model pusher dir 
-            logging.info(f"Saving model into model pusher directory")
-            save_object(file_path=self.model_pusher_config.pusher_transformer_path, obj=transformer)
-            save_object(file_path=self.model_pusher_config.pusher_model_path, obj=model)
-            save_object(file_path=self.model_pusher_config.pusher_target_encoder_path, obj=target_encoder)
-
-            # saved model dir 
-            logging.info(f"Saving model in saved model dir")
-            transformer_path = self.model_resolver.get_latest_save_transformer_path()
-            model_path = self.model_resolver.get_latest_save_model_path()
-            target_encoder_path = self.model_resolver.get_latest_save_target_encoder_path()
-
-            save_object(file_path=transformer_path, obj=transformer)
-            save_object(file_path=model_path, obj=model)
-            save_object(file_path=target_encoder_path, obj=target_encoder)
+            # artifact files of the new version, relative to the version directory
+            resolver = self.model_resolver
+            artifact_files = {
+                os.path.join(resolver.transformer_dir_name, TRANSFORMER_OBJECT_FILE_NAME): self.data_transformation_artifact.transform_object_path,
+                os.path.join(resolver.model_dir_name, MODEL_FILE_NAME): self.model_trainer_artifact.model_path,
+                os.path.join(resolver.target_encoder_dir_name, TARGET_ENCODER_OBJECT_FILE_NAME): self.data_transformation_artifact.target_encoder_path,
+            }
+
+            # model pusher dir, the pickled bytes are copied as they are
+            logging.info(f"Copying model into model pusher directory")
+            os.makedirs(self.model_pusher_config.pusher_model_dir, exist_ok=True)
+            shutil.copyfile(self.data_transformation_artifact.transform_object_path, self.model_pusher_config.pusher_transformer_path)
+            shutil.copyfile(self.model_trainer_artifact.model_path, self.model_pusher_config.pusher_model_path)
+            shutil.copyfile(self.data_transformation_artifact.target_encoder_path, self.model_pusher_config.pusher_target_encoder_path)
+
+            # the new version is assembled in a staging directory nobody reads from,
+            # every file is stored once in the object store and hard linked into it
+            logging.info(f"Staging model in saved model dir")
+            staging_dir = create_staging_dir(self.model_pusher_config.saved_model_dir)
+            try:
+                artifacts = {}
+                for relative_path, file_path in artifact_files.items():
+                    artifacts[relative_path] = self.object_store.link(file_path, os.path.join(staging_dir, relative_path))
+
+                next_version = int(os.path.basename(resolver.get_latest_save_dir_path()))
+                self.write_bundle(staging_dir=staging_dir, model_version=next_version)
+                bundle_path = os.path.join(staging_dir, MODEL_BUNDLE_FILE_NAME)
+                if os.path.exists(bundle_path):
+                    artifacts[MODEL_BUNDLE_FILE_NAME] = self.object_store.link(bundle_path, bundle_path, move=True)
+                self.write_reference_profile(staging_dir=staging_dir)
+                profile_path = os.path.join(staging_dir, REFERENCE_PROFILE_FILE_NAME)
+                if os.path.exists(profile_path):
+                    artifacts[REFERENCE_PROFILE_FILE_NAME] = self.object_store.link(profile_path, profile_path, move=True)
+
+                # a single rename makes the complete version visible, when another pusher took
+                # next_version first the directory name, not the bundle header, is the version
+                saved_version = publish_staging_dir(self.model_pusher_config.saved_model_dir, staging_dir, version=next_version)
+            except Exception:
+                shutil.rmtree(staging_dir, ignore_errors=True)
+                raise
+            logging.info(f"Published model version [{saved_version}]")
+
+            # index the new version, the resolver reads the latest version from the manifest
+            resolver.registry_manifest.register(version=saved_version, artifacts=artifacts,
+                                                metrics={"f1_train_score": float(self.model_trainer_artifact.f1_train_score),
+                                                         "f1_test_score": float(self.model_trainer_artifact.f1_test_score)})
 
             model_pusher_artifact = ModelPusherArtifact(pusher_model_dir=self.model_pusher_config.pusher_model_dir, 
-                                                        saved_model_dir= self.model_pusher_config.saved_model_dir)
+                                                        saved_model_dir= self.model_pusher_config.saved_model_dir,
+                                                        saved_model_version=saved_version)
             logging.info(f"Model Pusher Artifact: {model_pusher_artifact}")
             return model_pusher_artifact
         except Exception as e:
-            raise ThyroidException(e, sys)
\ No newline at end of file
+            raise ThyroidException(e, sys)
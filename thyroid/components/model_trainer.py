@@ -2,24 +2,26 @@ from thyroid.entity import config_entity, artifact_entity
 from thyroid.exception import ThyroidException
 from thyroid.logger import logging
 from typing import Optional, List
-from thyroid import utils
-from sklearn.metrics import f1_score 
-from xgboost import XGBClassifier
+from thyroid.artifact_store import ArtifactStore
 import os, sys
 
 class ModelTrainer:
     def __init__(self, model_trainer_config:config_entity.ModelTrainerConfig,
-                        data_transformation_artifact:artifact_entity.DataTransformationArtifact):
+                        data_transformation_artifact:artifact_entity.DataTransformationArtifact,
+                        artifact_store:Optional[ArtifactStore]=None):
         try:
             logging.info(f"{'>'*30} Model Training Initiated {'<'*30}")
             self.model_trainer_config = model_trainer_config
             self.data_transformation_artifact = data_transformation_artifact
+            # artifacts of the run kept in memory by earlier stages, a private store reads from disk
+            self.artifact_store = artifact_store or ArtifactStore()
         
         except Exception as e:
             raise ThyroidException(e, sys)
 
     def train_model(self, x, y):
         try:
+            from xgboost import XGBClassifier
             xgb_clf = XGBClassifier(objective='multi:softmax', 
                             num_class=4,   
                          
@@ -31,9 +33,11 @@ class ModelTrainer:
 
     def initiate_model_trainer(self)->artifact_entity.ModelTrainerArtifact:
         try:
+            from sklearn.metrics import f1_score
+
             logging.info(f"Loading train and test array")
-            train_arr = utils.load_numpy_array_data(file_path=self.data_transformation_artifact.transformed_train_path)
-            test_arr = utils.load_numpy_array_data(file_path=self.data_transformation_artifact.transformed_test_path)
+            train_arr = self.artifact_store.load_numpy_array_data(file_path=self.data_transformation_artifact.transformed_train_path)
+            test_arr = self.artifact_store.load_numpy_array_data(file_path=self.data_transformation_artifact.transformed_test_path)
 
             logging.info(f"Splitting the input and target features from both train and test set")
             x_train, y_train = train_arr[:,:-1], train_arr[:,-1]
@@ -65,7 +69,7 @@ class ModelTrainer:
             
             # save the trained model
             logging.info(f"Saving the model object")
-            utils.save_object(file_path=self.model_trainer_config.model_path, obj=model)
+            self.artifact_store.save_object(file_path=self.model_trainer_config.model_path, obj=model)
 
             # preparing the artifact
             logging.info(f"Preparing the artifact")
@@ -1,6 +1,6 @@
 from dataclasses import dataclass
-import pymongo
 from datetime import datetime 
+import threading
 import os, sys 
 from dotenv import load_dotenv
 
@@ -12,7 +12,27 @@ class EnvironmentVariable():
 
 env_var = EnvironmentVariable()
 
-mongo_client = pymongo.MongoClient(env_var.mongo_db_url)
+_mongo_client = None
+_mongo_client_lock = threading.Lock()
+
+def get_mongo_client():
+    """
+    Mongo client shared by the process, created on first use so importing the
+    package does not import pymongo or open a connection pool
+    """
+    global _mongo_client
+    if _mongo_client is None:
+        with _mongo_client_lock:
+            if _mongo_client is None:
+                import pymongo
+                _mongo_client = pymongo.MongoClient(env_var.mongo_db_url)
+    return _mongo_client
+
+def __getattr__(name):
+    # keeps `from thyroid.config import mongo_client` working
+    if name == "mongo_client":
+        return get_mongo_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 TARGET_COLUMN = "Class"
 
@@ -0,0 +1,342 @@
+"""
+Reference profiles and drift tests.
+
+A reference profile is a compact summary of a dataset that is built once and kept as json:
+
+    numerical columns     count, missing, a quantile sketch (up to sample_size sorted order
+                          statistics, the whole column when it is smaller) and the decile
+                          bins with their share of the rows
+    categorical columns   count, missing and the frequency of every category
+
+Drift of a new dataset is measured against the profile only, so its cost does not grow with
+the reference dataset: a two sample Kolmogorov-Smirnov test and PSI for numerical columns,
+a chi-square test and PSI for categorical columns. The KS statistics of all columns come
+from counts of the new values between the points of the quantile sketch and their p-values
+from one vectorized call of the asymptotic distribution (scipy's ks_2samp with
+method="asymp").
+
+Both sides can be read chunk by chunk: ProfileBuilder and DriftAccumulator keep memory
+bounded by the sketch size, not by the rows, and give the same result as the whole
+dataframe when it fits in one chunk.
+"""
+from thyroid.exception import ThyroidException
+from typing import Dict, List, Optional, Sequence
+import pandas as pd
+import numpy as np
+import json
+import os, sys
+
+# proportion given to a bin or category that is empty on one side, keeps PSI finite
+PSI_EPSILON = 1e-4
+
+
+def weighted_sample(values:np.ndarray, weights:np.ndarray, size:int) -> np.ndarray:
+    """
+    size evenly spaced order statistics of sorted values where each value stands for weight rows
+    """
+    cumulative = np.cumsum(weights)
+    ranks = np.round(np.linspace(0, cumulative[-1] - 1, size))
+    return values[np.minimum(np.searchsorted(cumulative, ranks, side="right"), len(values) - 1)]
+
+
+def numerical_sketch(sample:np.ndarray, count:int, missing:int, n_bins:int = 10) -> dict:
+    edges = np.unique(np.quantile(sample, np.linspace(0, 1, n_bins + 1))) if len(sample) else np.array([])
+    return {
+        "count": int(count),
+        "missing": int(missing),
+        "sample": sample.tolist(),
+        "bin_edges": edges.tolist(),
+        "bin_shares": bin_shares(sample, edges).tolist() if len(sample) else [],
+    }
+
+
+def categorical_sketch(frequencies:pd.Series, count:int, missing:int) -> dict:
+    return {
+        "count": int(count),
+        "missing": int(missing),
+        "frequencies": {str(category): int(value) for category, value in frequencies.items()},
+    }
+
+
+class ProfileBuilder:
+    """
+    Builds a reference profile from chunks of a dataset.
+    The quantile sketch of a numerical column is kept as sorted values with the number of rows
+    each stands for, and compacted back to sample_size values whenever it holds more than
+    twice as many.
+    """
+    def __init__(self, numerical_columns:List[str], categorical_columns:List[str], sample_size:int = 10000, n_bins:int = 10):
+        self.numerical_columns = numerical_columns
+        self.categorical_columns = categorical_columns
+        self.sample_size = sample_size
+        self.n_bins = n_bins
+        self.columns:Optional[List[str]] = None
+        self.rows = 0
+        # column -> [sorted values, weight of each value]
+        self._samples:Dict[str, List[np.ndarray]] = {}
+        self._frequencies:Dict[str, pd.Series] = {}
+        self._counts:Dict[str, int] = {}
+        self._missing:Dict[str, int] = {}
+
+    def add(self, df:pd.DataFrame):
+        if self.columns is None:
+            self.columns = list(df.columns)
+        self.rows += len(df)
+        for column in self.numerical_columns:
+            if column not in df.columns:
+                continue
+            values = pd.to_numeric(df[column], errors="coerce")
+            present = np.sort(values.dropna().to_numpy(dtype=np.float64))
+            self._count(column, len(values), int(values.isna().sum()))
+            if len(present) == 0:
+                continue
+            weights = np.ones(len(present))
+            if len(present) > self.sample_size:
+                # evenly spaced order statistics keep the empirical cdf within 1/sample_size
+                weights = np.full(self.sample_size, len(present) / self.sample_size)
+                present = present[np.linspace(0, len(present) - 1, self.sample_size).round().astype(int)]
+            self._merge(column, present, weights)
+        for column in self.categorical_columns:
+            if column not in df.columns:
+                continue
+            values = df[column]
+            self._count(column, len(values), int(values.isna().sum()))
+            frequencies = values.dropna().astype(str).value_counts()
+            if column in self._frequencies:
+                frequencies = self._frequencies[column].add(frequencies, fill_value=0).astype(np.int64)
+                frequencies = frequencies.sort_values(ascending=False, kind="stable")
+            self._frequencies[column] = frequencies
+        return self
+
+    def _count(self, column:str, count:int, missing:int):
+        self._counts[column] = self._counts.get(column, 0) + count
+        self._missing[column] = self._missing.get(column, 0) + missing
+
+    def _merge(self, column:str, values:np.ndarray, weights:np.ndarray):
+        if column in self._samples:
+            previous_values, previous_weights = self._samples[column]
+            values = np.concatenate([previous_values, values])
+            weights = np.concatenate([previous_weights, weights])
+            order = np.argsort(values, kind="stable")
+            values, weights = values[order], weights[order]
+        if len(values) > 2 * self.sample_size:
+            total = weights.sum()
+            values = weighted_sample(values, weights, self.sample_size)
+            weights = np.full(self.sample_size, total / self.sample_size)
+        self._samples[column] = [values, weights]
+
+    def profile(self, drop_columns:Sequence[str] = ()) -> dict:
+        """
+        return the profile of the chunks added so far without the drop_columns
+        """
+        try:
+            numerical = {}
+            for column in self.numerical_columns:
+                if column not in self._counts or column in drop_columns:
+                    continue
+                sample = np.array([])
+                if column in self._samples:
+                    values, weights = self._samples[column]
+                    # rows of the whole column or of one chunk are kept as they are
+                    sample = values
+                    if len(values) > self.sample_size or np.any(weights != weights[0]):
+                        sample = weighted_sample(values, weights, self.sample_size)
+                numerical[column] = numerical_sketch(sample, self._counts[column], self._missing[column], n_bins=self.n_bins)
+            categorical = {column: categorical_sketch(self._frequencies[column], self._counts[column], self._missing[column])
+                           for column in self.categorical_columns if column in self._frequencies and column not in drop_columns}
+            return {
+                "columns": [column for column in (self.columns or []) if column not in drop_columns],
+                "rows": int(self.rows),
+                "numerical": numerical,
+                "categorical": categorical,
+            }
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+
+def build_reference_profile(df:pd.DataFrame, numerical_columns:List[str], categorical_columns:List[str],
+                            sample_size:int = 10000, n_bins:int = 10) -> dict:
+    """
+    Description: This function summarises a dataset into a reference profile
+    =========================================================
+    df : reference dataset
+    numerical_columns : columns sketched by their quantiles
+    categorical_columns : columns sketched by their category frequencies
+    ========================================================
+    return profile dictionary, json serializable
+    """
+    try:
+        builder = ProfileBuilder(numerical_columns, categorical_columns, sample_size=sample_size, n_bins=n_bins)
+        return builder.add(df).profile()
+    except Exception as e:
+        raise ThyroidException(e, sys)
+
+
+def save_reference_profile(profile:dict, file_path:str):
+    os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+    temp_file_path = f"{file_path}.{os.getpid()}.tmp"
+    with open(temp_file_path, "w") as file_obj:
+        json.dump(profile, file_obj)
+    os.replace(temp_file_path, file_path)
+
+
+def load_reference_profile(file_path:str) -> Optional[dict]:
+    if not os.path.exists(file_path):
+        return None
+    with open(file_path) as file_obj:
+        return json.load(file_obj)
+
+
+def bin_shares(values:np.ndarray, edges:np.ndarray) -> np.ndarray:
+    # share of the values in each bin between the edges, the outer bins are open ended
+    counts = np.bincount(np.searchsorted(edges[1:-1], values, side="right"), minlength=len(edges) - 1)
+    return counts / max(len(values), 1)
+
+
+def psi(reference_shares:np.ndarray, current_shares:np.ndarray) -> float:
+    reference_shares = np.clip(np.asarray(reference_shares, dtype=np.float64), PSI_EPSILON, None)
+    current_shares = np.clip(np.asarray(current_shares, dtype=np.float64), PSI_EPSILON, None)
+    return float(np.sum((current_shares - reference_shares) * np.log(current_shares / reference_shares)))
+
+
+class NumericalCounts:
+    """
+    Counts of a column against the distinct points of its quantile sketch: values equal to
+    each point, values strictly between two points and values per decile bin. The empirical
+    cdf of the column is a step function, between two points of the sketch its largest gap
+    to the sketch's cdf is at a point or at the last value before the next point, so the
+    counts give the exact KS statistic of the whole column.
+    """
+    def __init__(self, sketch:dict):
+        sample = np.asarray(sketch["sample"], dtype=np.float64)
+        self.sample_size = len(sample)
+        self.points = np.unique(sample)
+        self.reference_cdf = np.searchsorted(sample, self.points, side="right") / max(len(sample), 1)
+        self.edges = np.asarray(sketch["bin_edges"], dtype=np.float64)
+        self.reference_shares = np.asarray(sketch["bin_shares"], dtype=np.float64)
+        self.equal = np.zeros(len(self.points), dtype=np.int64)
+        self.between = np.zeros(len(self.points) + 1, dtype=np.int64)
+        self.bins = np.zeros(max(len(self.edges) - 1, 0), dtype=np.int64)
+        self.count = 0
+
+    def add(self, values:np.ndarray):
+        if len(values) == 0 or len(self.points) == 0:
+            return
+        positions = np.searchsorted(self.points, values, side="left")
+        equal = (positions < len(self.points)) & (self.points[np.minimum(positions, len(self.points) - 1)] == values)
+        self.equal += np.bincount(positions[equal], minlength=len(self.points))
+        self.between += np.bincount(positions[~equal], minlength=len(self.points) + 1)
+        self.bins += np.bincount(np.searchsorted(self.edges[1:-1], values, side="right"), minlength=len(self.bins))
+        self.count += len(values)
+
+    def statistic(self) -> float:
+        below = np.cumsum(self.between[:-1]) + np.concatenate([[0], np.cumsum(self.equal)[:-1]])
+        at_or_below = below + self.equal
+        gap = np.abs(self.reference_cdf - at_or_below / self.count)
+        # just before each point the sketch's cdf is still the one of the previous point
+        previous_cdf = np.concatenate([[0.0], self.reference_cdf[:-1]])
+        before = (below / self.count - previous_cdf)[self.between[:-1] > 0]
+        return float(max(gap.max(), before.max() if len(before) else 0.0))
+
+
+class DriftAccumulator:
+    """
+    Counts of a dataset read chunk by chunk, enough for the drift tests of every profiled
+    column: NumericalCounts for numerical columns and the category frequencies for
+    categorical columns. The memory is bounded by the profile, not by the rows.
+    """
+    def __init__(self, profile:dict):
+        self.profile = profile
+        self._numerical:Dict[str, NumericalCounts] = {}
+        self._categorical:Dict[str, pd.Series] = {}
+
+    def add(self, df:pd.DataFrame):
+        for column, sketch in self.profile["numerical"].items():
+            if column in df.columns:
+                if column not in self._numerical:
+                    self._numerical[column] = NumericalCounts(sketch)
+                self._numerical[column].add(pd.to_numeric(df[column], errors="coerce").dropna().to_numpy(dtype=np.float64))
+        for column in self.profile["categorical"]:
+            if column in df.columns:
+                frequencies = df[column].dropna().astype(str).value_counts()
+                previous = self._categorical.get(column)
+                self._categorical[column] = frequencies if previous is None else previous.add(frequencies, fill_value=0)
+        return self
+
+    def numerical_drift(self, columns:List[str]) -> Dict[str, dict]:
+        from scipy.stats import kstwo
+
+        statistics, effective_sizes, results = [], [], {}
+        for column in columns:
+            counts = self._numerical[column]
+            if counts.sample_size == 0 or counts.count == 0:
+                continue
+            statistics.append(counts.statistic())
+            effective_sizes.append(np.round(counts.sample_size * counts.count / (counts.sample_size + counts.count)))
+            results[column] = {"test": "ks", "psi": psi(counts.reference_shares, counts.bins / counts.count)}
+
+        # all p-values in one call
+        pvalues = np.clip(kstwo.sf(statistics, effective_sizes), 0, 1) if statistics else []
+        for column, statistic, pvalue in zip(list(results), statistics, pvalues):
+            results[column].update(statistic=statistic, pvalue=float(pvalue))
+        return results
+
+    def categorical_drift(self, columns:List[str]) -> Dict[str, dict]:
+        from scipy.stats import chi2
+
+        statistics, dofs, results = [], [], {}
+        for column in columns:
+            reference = pd.Series(self.profile["categorical"][column]["frequencies"], dtype=np.float64)
+            current = self._categorical[column].astype(np.float64)
+            if reference.sum() == 0 or current.sum() == 0:
+                continue
+            categories = reference.index.union(current.index)
+            reference_shares = reference.reindex(categories, fill_value=0).to_numpy() / reference.sum()
+            current_counts = current.reindex(categories, fill_value=0).to_numpy()
+
+            # a category the reference never saw is expected with a tiny share instead of zero
+            expected = np.clip(reference_shares, PSI_EPSILON, None)
+            expected = expected / expected.sum() * current_counts.sum()
+            statistics.append(float(np.sum((current_counts - expected) ** 2 / expected)))
+            dofs.append(max(len(categories) - 1, 1))
+            results[column] = {"test": "chi2", "psi": psi(reference_shares, current_counts / current_counts.sum())}
+
+        pvalues = chi2.sf(statistics, dofs) if statistics else []
+        for column, statistic, pvalue in zip(list(results), statistics, pvalues):
+            results[column].update(statistic=statistic, pvalue=float(pvalue))
+        return results
+
+    def report(self, pvalue_threshold:float = 0.05, columns:Optional[Sequence[str]] = None) -> Dict[str, dict]:
+        """
+        Description: This function tests the accumulated columns for drift
+        =========================================================
+        pvalue_threshold : same_distribution is true above it
+        columns : columns to test, every accumulated column when None
+        ========================================================
+        return column -> test, statistic, pvalue, psi and same_distribution
+        """
+        try:
+            numerical = [column for column in self._numerical if columns is None or column in columns]
+            categorical = [column for column in self._categorical if columns is None or column in columns]
+            report = dict(self.numerical_drift(numerical), **self.categorical_drift(categorical))
+            for result in report.values():
+                result["same_distribution"] = bool(result["pvalue"] > pvalue_threshold)
+            return report
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+
+def drift_report(profile:dict, df:pd.DataFrame, pvalue_threshold:float = 0.05) -> Dict[str, dict]:
+    """
+    Description: This function tests every profiled column of df for drift
+    =========================================================
+    profile : reference profile from build_reference_profile
+    df : current dataset
+    pvalue_threshold : same_distribution is true above it
+    ========================================================
+    return column -> test, statistic, pvalue, psi and same_distribution
+    """
+    try:
+        return DriftAccumulator(profile).add(df).report(pvalue_threshold=pvalue_threshold)
+    except Exception as e:
+        raise ThyroidException(e, sys)
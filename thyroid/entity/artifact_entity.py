@@ -1,4 +1,5 @@
 from dataclasses import dataclass
+from typing import Optional
 
 @dataclass
 class DataIngestionArtifact:
@@ -27,8 +28,10 @@ class ModelTrainerArtifact:
 class ModelEvaluationArtifact:
     is_model_accepted:bool
     improved_accuracy:float
+    leaderboard_file_path:Optional[str] = None
 
 @dataclass
 class ModelPusherArtifact:
     pusher_model_dir:str 
-    saved_model_dir:str
\ No newline at end of file
+    saved_model_dir:str
+    saved_model_version:Optional[int] = None
\ No newline at end of file
@@ -2,6 +2,8 @@ import os, sys
 from thyroid.logger import logging
 from thyroid.exception import ThyroidException
 from datetime import datetime 
+from typing import Optional
+from thyroid.artifact_io import artifact_file_name
 
 FILE_NAME = "thyroid.csv"
 TRAIN_FILE_NAME = "train.csv"
@@ -9,6 +11,8 @@ TEST_FILE_NAME = 'test.csv'
 TRANSFORMER_OBJECT_FILE_NAME = 'transformer.pkl'
 TARGET_ENCODER_OBJECT_FILE_NAME = 'target_encoder.pkl'
 MODEL_FILE_NAME = 'model.pkl'
+MODEL_BUNDLE_FILE_NAME = 'model.bundle'
+REFERENCE_PROFILE_FILE_NAME = 'reference_profile.json'
 
 class TrainingPipelineConfig:
     def __init__(self):
@@ -18,23 +22,37 @@ class TrainingPipelineConfig:
             raise ThyroidException(e, sys)
     
 class DataIngestionConfig:
-    def __init__(self, training_pipeline_config:TrainingPipelineConfig):
+    def __init__(self, training_pipeline_config:TrainingPipelineConfig, full_refresh:bool=False):
 
         try:
             self.database_name = 'thyroid-deases'
             self.collection_name = 'thyroid'
+
+            # documents fetched per round trip, and rows written to the feature store at a time
+            self.batch_size = 10000
+
+            # persistent feature store shared by every run, only documents with a watermark
+            # field above the last ingested one are pulled unless a full refresh is asked for
+            self.persistent_feature_store_dir = os.path.join(os.getcwd(), 'feature_store', self.collection_name)
+            self.watermark_field = '_id'
+            # seconds before the watermark read again for documents committed late
+            self.watermark_overlap_seconds = 300
+            self.full_refresh = full_refresh
+
+            # format of the feature store and train/test artifacts: parquet, arrow or csv
+            self.artifact_format = 'parquet'
         
             # creating data_ingestion directory
             self.data_ingestion_dir = os.path.join(training_pipeline_config.artifact_dir, 'data_ingestion')
 
             # creating feature store file path 
-            self.feature_store_file_path = os.path.join(self.data_ingestion_dir,'feature_store',FILE_NAME)
+            self.feature_store_file_path = os.path.join(self.data_ingestion_dir,'feature_store',artifact_file_name(FILE_NAME, self.artifact_format))
 
             # creating train_file_path 
-            self.train_file_path = os.path.join(self.data_ingestion_dir,'dataset',TRAIN_FILE_NAME)
+            self.train_file_path = os.path.join(self.data_ingestion_dir,'dataset',artifact_file_name(TRAIN_FILE_NAME, self.artifact_format))
 
             # creating test_file_path 
-            self.test_file_path = os.path.join(self.data_ingestion_dir,'dataset',TEST_FILE_NAME)
+            self.test_file_path = os.path.join(self.data_ingestion_dir,'dataset',artifact_file_name(TEST_FILE_NAME, self.artifact_format))
 
             # test_size while splitting the dataset
             self.test_size = 0.2
@@ -49,12 +67,21 @@ class DataIngestionConfig:
             raise ThyroidException(e, sys)    
 
 class DataValidationConfig:
-    def __init__(self,training_pipeline_config:TrainingPipelineConfig):
+    def __init__(self,training_pipeline_config:TrainingPipelineConfig, chunk_size:Optional[int]=None):
         self.data_validation_dir = os.path.join(training_pipeline_config.artifact_dir,'data_validation')
         self.report_file_path = os.path.join(self.data_validation_dir,'report.yaml')
         self.missing_threshold:float = 0.25
         self.base_file_path = os.path.join('hypothyroid_cleaned.csv')
 
+        # sketches of the base dataset, rebuilt only when the base file changes
+        self.reference_profile_path = os.path.join(os.getcwd(), 'artifact', 'reference_profile.json')
+        self.reference_sample_size = 10000
+        self.drift_bins = 10
+        self.drift_pvalue_threshold = 0.05
+
+        # rows read at a time, None validates every dataset as a whole dataframe
+        self.chunk_size = chunk_size
+
 class DataTransformationConfig:
     def __init__(self, training_pipeline_config:TrainingPipelineConfig):
         self.data_transformation_dir = os.path.join(training_pipeline_config.artifact_dir, "data_transformation")
@@ -63,6 +90,14 @@ class DataTransformationConfig:
         self.transformed_test_path = os.path.join(self.data_transformation_dir, "transformed", TEST_FILE_NAME.replace("csv", "npz"))
         self.target_encoder_path = os.path.join(self.data_transformation_dir, "target_encoder", TARGET_ENCODER_OBJECT_FILE_NAME)
 
+        # missing value imputation, one of thyroid.imputation.IMPUTATION_STRATEGIES, knn keeps
+        # KNNImputer's neighbours, knn_indexed scales to more rows with its own neighbours
+        self.imputation_strategy = "knn"
+        self.imputation_neighbors = 3
+        # rows per neighbour query and threads per query of knn_indexed, -1 uses every core
+        self.imputation_chunk_size = 10000
+        self.imputation_n_jobs = -1
+
 class ModelTrainerConfig:
     def __init__(self, training_pipeline_config:TrainingPipelineConfig):
         self.model_trainer_dir = os.path.join(training_pipeline_config.artifact_dir, "model_trainer")
@@ -73,6 +108,12 @@ class ModelTrainerConfig:
 class ModelEvaluationConfig:
     def __init__(self,training_pipeline_config:TrainingPipelineConfig):
         self.change_threshold = 0.01
+        # the candidate is scored against this many of the latest registry versions
+        self.num_previous_versions = 5
+        # models scored at once, each predicts on a single thread
+        self.n_workers = os.cpu_count() or 1
+        self.model_evaluation_dir = os.path.join(training_pipeline_config.artifact_dir, "model_evaluation")
+        self.leaderboard_file_path = os.path.join(self.model_evaluation_dir, "leaderboard.yaml")
 
 class ModelPusherConfig:
     def __init__(self, training_pipeline_config:TrainingPipelineConfig):
@@ -82,4 +123,64 @@ class ModelPusherConfig:
         self.pusher_model_path = os.path.join(self.pusher_model_dir,MODEL_FILE_NAME)
         self.pusher_transformer_path = os.path.join(self.pusher_model_dir, TRANSFORMER_OBJECT_FILE_NAME)
         self.pusher_target_encoder_path = os.path.join(self.pusher_model_dir, TARGET_ENCODER_OBJECT_FILE_NAME)
+        # profile of the training split published with the version, the reference of the online drift monitor
+        self.reference_sample_size = 1000
+        self.drift_bins = 10
         
+
+class PredictionServerConfig:
+    def __init__(self):
+        # maximum number of records accepted by a single /predict/batch request
+        self.max_batch_records = int(os.getenv("PREDICT_MAX_BATCH_RECORDS", 10000))
+
+        # coalesce concurrent /predict calls into micro batches
+        self.micro_batching = os.getenv("PREDICT_MICRO_BATCHING", "0") == "1"
+        self.micro_batch_window_ms = float(os.getenv("PREDICT_BATCH_WINDOW_MS", 5))
+        self.micro_batch_max_size = int(os.getenv("PREDICT_MAX_BATCH_SIZE", 64))
+        self.micro_batch_timeout = float(os.getenv("PREDICT_BATCH_TIMEOUT", 30))
+
+        # seconds between checks of the model registry for a new version, 0 disables reloading
+        self.model_reload_interval = float(os.getenv("MODEL_RELOAD_INTERVAL", 30))
+
+        # cache of single record predictions, a size of 0 disables the cache
+        self.prediction_cache_size = int(os.getenv("PREDICT_CACHE_SIZE", 10000))
+        self.prediction_cache_ttl = float(os.getenv("PREDICT_CACHE_TTL", 300))
+
+        # directory where every worker process writes its metrics, /metrics merges them; unset
+        # exports the metrics of the process alone, gunicorn.conf.py sets it for its workers
+        self.metrics_multiprocess_dir = os.getenv("METRICS_MULTIPROC_DIR") or None
+        self.metrics_sync_interval = float(os.getenv("METRICS_SYNC_INTERVAL", 1))
+
+        # threads used by XGBoost/OpenMP for one prediction in each worker process
+        self.predict_num_threads = int(os.getenv("PREDICT_NUM_THREADS", 1))
+
+        # registry version scored in shadow next to the served one, unset disables shadow scoring
+        self.shadow_model_version = os.getenv("SHADOW_MODEL_VERSION") or None
+        self.shadow_queue_size = int(os.getenv("SHADOW_QUEUE_SIZE", 1000))
+        self.shadow_sample_rate = float(os.getenv("SHADOW_SAMPLE_RATE", 1.0))
+
+        # histograms of the live inputs per tumbling window, compared with the profile of the served version
+        self.drift_monitoring = os.getenv("DRIFT_MONITORING", "1") == "1"
+        self.drift_window_seconds = float(os.getenv("DRIFT_WINDOW_SECONDS", 300))
+        self.drift_windows = int(os.getenv("DRIFT_WINDOWS", 12))
+        self.drift_queue_size = int(os.getenv("DRIFT_QUEUE_SIZE", 1000))
+        self.drift_sample_rate = float(os.getenv("DRIFT_SAMPLE_RATE", 1.0))
+        self.drift_psi_threshold = float(os.getenv("DRIFT_PSI_THRESHOLD", 0.2))
+        self.drift_min_records = int(os.getenv("DRIFT_MIN_RECORDS", 100))
+
+class BatchPredictionConfig:
+    def __init__(self, input_file_path:str, output_file_path:str=None, chunk_size:int=50000, n_workers:int=None):
+        self.input_file_path = input_file_path
+        self.prediction_dir = os.path.join(os.getcwd(), "prediction")
+
+        # default output sits next to the other predictions with the format of the input
+        if output_file_path is None:
+            file_name, extension = os.path.splitext(os.path.basename(input_file_path))
+            output_file_path = os.path.join(self.prediction_dir, f"{file_name}_prediction{extension}")
+        self.output_file_path = output_file_path
+
+        # finished chunks are kept here until every chunk is scored, which makes a run resumable
+        self.parts_dir = f"{self.output_file_path}.parts"
+        self.chunk_size = chunk_size
+        self.n_workers = n_workers or os.cpu_count()
+        self.model_registry = "saved_models"
@@ -0,0 +1,262 @@
+"""
+Persistent feature store of the Mongo collection.
+
+Every ingestion pulls only the documents newer than the last high-water mark and appends
+them as a new part file, the training dataset is rebuilt from all parts:
+
+    feature_store/<collection>/part-00000.parquet    first (full) export
+    feature_store/<collection>/part-00001.parquet    documents added before the next run
+    feature_store/<collection>/state.json            watermark, columns and the committed parts
+
+Parts are written in artifact_format through artifact_io, a row group per chunk, so the
+columns keep their types and an ingestion never holds more than one chunk. Parts of an
+earlier format stay readable, the format is taken from their extension.
+
+The watermark is the largest value of watermark_field ("_id" by default, ObjectIds grow
+with their creation time) seen so far. Values are not committed in that order: a writer
+that created its ObjectIds earlier can insert after a run has read past them. So every
+run reads again from overlap_seconds before the watermark (ObjectId and datetime
+watermarks) and skips the documents whose _id it already ingested; state.json keeps the
+_ids within that window. A document arriving later than the overlap is still missed,
+a full refresh picks it up.
+
+A part file is committed only when state.json, which is replaced atomically, lists it,
+so a crashed run leaves an orphan part that is removed by the next run instead of
+duplicated rows. The row keys of the bulk loader are not features and are left out.
+"""
+from thyroid.exception import ThyroidException
+from thyroid.logger import logging
+from thyroid import utils
+from thyroid.artifact_io import ArtifactWriter, artifact_file_name, read_artifact, write_artifact
+from thyroid.utils import ROW_KEY_FIELD
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+import pandas as pd
+import json
+import os, sys
+
+STATE_FILE_NAME = "state.json"
+PART_FILE_PREFIX = "part-"
+
+
+def encode_watermark(value) -> Optional[dict]:
+    # json representation of a watermark, ObjectIds and datetimes keep their type
+    from bson import ObjectId
+
+    if value is None:
+        return None
+    if isinstance(value, ObjectId):
+        return {"type": "objectid", "value": str(value), "generation_time": value.generation_time.isoformat()}
+    if isinstance(value, datetime):
+        return {"type": "datetime", "value": value.isoformat()}
+    return {"type": "value", "value": value}
+
+
+def decode_watermark(watermark:Optional[dict]):
+    from bson import ObjectId
+
+    if watermark is None:
+        return None
+    if watermark["type"] == "objectid":
+        return ObjectId(watermark["value"])
+    if watermark["type"] == "datetime":
+        return datetime.fromisoformat(watermark["value"])
+    return watermark["value"]
+
+
+def watermark_seconds(value) -> Optional[float]:
+    # time of a watermark, None for values that have no time and get no overlap
+    from bson import ObjectId
+
+    if isinstance(value, ObjectId):
+        return value.generation_time.timestamp()
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return None
+
+
+def overlap_start(watermark, overlap_seconds:float):
+    # lower bound of the next read, the watermark moved back by the overlap
+    from bson import ObjectId
+
+    if isinstance(watermark, ObjectId):
+        return ObjectId.from_datetime(watermark.generation_time - timedelta(seconds=overlap_seconds))
+    if isinstance(watermark, datetime):
+        return watermark - timedelta(seconds=overlap_seconds)
+    return watermark
+
+
+class FeatureStore:
+
+    def __init__(self, store_dir:str, watermark_field:str = "_id", overlap_seconds:float = 300,
+                 artifact_format:str = "parquet"):
+        try:
+            self.store_dir = store_dir
+            self.artifact_format = artifact_format
+            self.watermark_field = watermark_field
+            self.overlap_seconds = overlap_seconds
+            self.state_file_path = os.path.join(store_dir, STATE_FILE_NAME)
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def empty_state(self) -> dict:
+        return {"watermark_field": self.watermark_field, "watermark": None, "columns": None, "parts": [],
+                "overlap_ids": {}}
+
+    def load_state(self) -> dict:
+        try:
+            if not os.path.exists(self.state_file_path):
+                return self.empty_state()
+            with open(self.state_file_path) as file_obj:
+                state = json.load(file_obj)
+            if state["watermark_field"] != self.watermark_field:
+                raise Exception(f"Feature store [{self.store_dir}] is tracked by [{state['watermark_field']}], "
+                                f"not [{self.watermark_field}], run a full refresh to change the watermark field")
+            state.setdefault("overlap_ids", {})
+            return state
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def _write_state(self, state:dict):
+        temp_file_path = f"{self.state_file_path}.{os.getpid()}.tmp"
+        with open(temp_file_path, "w") as file_obj:
+            json.dump(state, file_obj, indent=2)
+            file_obj.flush()
+            os.fsync(file_obj.fileno())
+        os.replace(temp_file_path, self.state_file_path)
+
+    def part_file_paths(self, state:dict = None) -> List[str]:
+        state = state or self.load_state()
+        return [os.path.join(self.store_dir, part["file_name"]) for part in state["parts"]]
+
+    def _remove_orphan_parts(self, state:dict):
+        # parts left behind by a run that failed before committing them
+        committed = {part["file_name"] for part in state["parts"]}
+        for file_name in os.listdir(self.store_dir):
+            if file_name.startswith(PART_FILE_PREFIX) and file_name not in committed:
+                logging.info(f"Removing uncommitted part file: [{file_name}]")
+                os.remove(os.path.join(self.store_dir, file_name))
+
+    def _next_part_file_name(self) -> str:
+        # numbered after every part whatever its format
+        numbers = [int(file_name[len(PART_FILE_PREFIX):].split(".")[0]) for file_name in os.listdir(self.store_dir)
+                   if file_name.startswith(PART_FILE_PREFIX)]
+        return artifact_file_name(f"{PART_FILE_PREFIX}{max(numbers, default=-1) + 1:05d}", self.artifact_format)
+
+    def _overlap_ids(self, ids:Dict[str, float], watermark) -> Dict[str, float]:
+        # only the _ids the next run reads again are kept
+        seconds = watermark_seconds(watermark)
+        if seconds is None:
+            return {}
+        return {_id: time for _id, time in ids.items() if time is not None and time > seconds - self.overlap_seconds}
+
+    def iter_new_chunks(self, collection, watermark, batch_size:int,
+                        seen_ids:Optional[Dict[str, float]] = None) -> Iterator[Tuple[pd.DataFrame, object, Dict[str, float]]]:
+        """
+        Streams the documents after the watermark in watermark order, skipping the _ids in
+        seen_ids. Yields each chunk with the watermark of its last row and the _ids of its
+        rows with the time of their watermark. The _id and watermark field are not features
+        and are left out.
+        """
+        seen_ids = seen_ids or {}
+        query = {} if watermark is None else {self.watermark_field: {"$gt": watermark}}
+        cursor = collection.find(query, projection={ROW_KEY_FIELD: 0}, batch_size=batch_size).sort(self.watermark_field, 1)
+
+        last_seen, chunk_ids = {}, {}
+        def documents():
+            for document in cursor:
+                _id = document.pop("_id")
+                value = _id if self.watermark_field == "_id" else document.pop(self.watermark_field, None)
+                if str(_id) in seen_ids:
+                    continue
+                last_seen["watermark"] = value
+                chunk_ids[str(_id)] = watermark_seconds(value)
+                yield document
+
+        # a chunk is yielded right after its last document was read
+        for chunk in utils.iter_document_chunks(documents(), batch_size=batch_size):
+            yield chunk, last_seen["watermark"], dict(chunk_ids)
+            chunk_ids.clear()
+
+    def ingest(self, collection, batch_size:int = 10000, full_refresh:bool = False) -> int:
+        """
+        Appends the documents added since the last ingestion as a new part file and
+        returns the number of new rows. A full refresh re-exports the whole collection
+        and replaces every part.
+        """
+        try:
+            os.makedirs(self.store_dir, exist_ok=True)
+            state = self.load_state()
+            self._remove_orphan_parts(state)
+            if full_refresh:
+                logging.info(f"Full refresh of feature store [{self.store_dir}]")
+                state = self.empty_state()
+
+            watermark = decode_watermark(state["watermark"])
+            # documents committed late within the overlap are read again, the ones already ingested are skipped
+            seen_ids = state["overlap_ids"]
+            start = overlap_start(watermark, self.overlap_seconds)
+            logging.info(f"Reading documents with [{self.watermark_field}] after [{start}], watermark [{watermark}]")
+            part_file_name = self._next_part_file_name()
+            part_file_path = os.path.join(self.store_dir, part_file_name)
+            columns = state["columns"]
+            new_ids = {}
+            with ArtifactWriter(part_file_path) as writer:
+                for chunk, last_watermark, chunk_ids in self.iter_new_chunks(collection, start, batch_size, seen_ids=seen_ids):
+                    # a chunk of late documents only does not move the watermark back
+                    if watermark is None or last_watermark > watermark:
+                        watermark = last_watermark
+                    new_ids = self._overlap_ids({**new_ids, **chunk_ids}, watermark)
+                    if columns is None:
+                        columns = list(chunk.columns)
+                    elif list(chunk.columns) != columns:
+                        # every part has the columns of the first one
+                        ignored = [column for column in chunk.columns if column not in columns]
+                        if ignored:
+                            logging.info(f"Fields not in the feature store were ignored: {ignored}")
+                        chunk = chunk.reindex(columns=columns)
+                    writer.write(chunk)
+            n_rows = writer.rows
+
+            if n_rows == 0:
+                logging.info(f"No new documents since the last ingestion")
+                return 0
+
+            state["parts"].append({"file_name": part_file_name, "rows": n_rows,
+                                   "watermark": encode_watermark(watermark),
+                                   "created_at": datetime.now().isoformat(timespec="seconds")})
+            state["watermark"] = encode_watermark(watermark)
+            state["columns"] = columns
+            state["overlap_ids"] = self._overlap_ids({**seen_ids, **new_ids}, watermark)
+            self._write_state(state)
+            # parts replaced by a full refresh are no longer committed
+            self._remove_orphan_parts(state)
+            logging.info(f"Committed [{n_rows}] new rows as [{part_file_name}], watermark [{watermark}]")
+            return n_rows
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def read(self) -> pd.DataFrame:
+        """
+        Every committed part as a single dataframe
+        """
+        try:
+            state = self.load_state()
+            if len(state["parts"]) == 0:
+                raise Exception(f"Feature store [{self.store_dir}] is empty")
+            parts = [read_artifact(part_file_path) for part_file_path in self.part_file_paths(state)]
+            return pd.concat(parts, ignore_index=True) if len(parts) > 1 else parts[0]
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def export(self, file_path:str) -> pd.DataFrame:
+        """
+        Writes every committed part into a single artifact in the format of its extension
+        and returns it as a dataframe
+        """
+        try:
+            df = self.read()
+            write_artifact(df, file_path)
+            return df
+        except Exception as e:
+            raise ThyroidException(e, sys)
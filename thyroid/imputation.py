@@ -0,0 +1,162 @@
+"""
+Imputation of the missing values of the transformed feature matrix.
+
+    knn            sklearn's KNNImputer, nan euclidean distance to every row (all pairs)
+    knn_indexed    mean of the n nearest complete rows, found in a KD-tree per missing
+                   value pattern and queried chunk by chunk on every core (opt-in)
+    class_median   median of the column within the row's class
+    iterative      sklearn's IterativeImputer, each column regressed on the others
+
+knn_indexed takes its donors from the complete rows and groups the other rows by which
+columns they miss. For every such pattern it builds one KD-tree of the donors over the
+columns the pattern observes, and fills all the missing columns of a row from the same
+neighbours. On complete rows the nan euclidean distance is the euclidean distance scaled
+by a constant, so the neighbours are the ones KNNImputer finds among them. KNNImputer also
+takes donors that miss some columns, with a distance over the columns both rows have;
+knn_indexed leaves them out.
+"""
+from thyroid.exception import ThyroidException
+from thyroid.logger import logging
+from typing import Optional
+import pandas as pd
+import numpy as np
+import sys
+
+IMPUTATION_STRATEGIES = ("knn", "knn_indexed", "class_median", "iterative")
+
+
+def knn_impute(X:np.ndarray, n_neighbors:int = 3) -> np.ndarray:
+    from sklearn.impute import KNNImputer
+
+    imputer = KNNImputer(n_neighbors=n_neighbors, weights='uniform', missing_values=np.nan)
+    return imputer.fit_transform(X)
+
+
+def nearest_donor_means(points:np.ndarray, values:np.ndarray, queries:np.ndarray, n_neighbors:int = 3,
+                        chunk_size:int = 10000, n_jobs:int = -1) -> np.ndarray:
+    """
+    Mean of the rows of values over the n_neighbors points nearest to every query.
+    When the points hold many duplicates (e.g. only categorical columns are observed) a
+    KD-tree visits every point tied at the same distance, so identical points are grouped
+    and the tree holds one point per group; the neighbours are then taken group by group,
+    the first members of each group first.
+    """
+    from scipy.spatial import cKDTree
+
+    k = min(n_neighbors, len(points))
+    means = np.empty((len(queries), values.shape[1]))
+    sample = points[np.linspace(0, len(points) - 1, min(len(points), 2000)).astype(int)]
+    if len(np.unique(sample, axis=0)) > len(sample) // 2:
+        # an unbalanced tree with uncompacted nodes builds several times faster and queries about as fast
+        tree = cKDTree(points, balanced_tree=False, compact_nodes=False)
+        for start in range(0, len(queries), chunk_size):
+            _, neighbours = tree.query(queries[start:start + chunk_size], k=k, workers=n_jobs)
+            means[start:start + chunk_size] = values[neighbours.reshape(-1, k)].mean(axis=1)
+        return means
+
+    groups = pd.DataFrame(points).groupby(list(range(points.shape[1])), sort=False).ngroup().to_numpy()
+    order = np.argsort(groups, kind="stable")
+    sizes = np.bincount(groups)
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    rank = np.arange(len(order)) - starts[groups[order]]
+    # sums of the values of the first j members of every group, j = 0..k
+    prefix_sums = np.zeros((len(sizes), k + 1, values.shape[1]))
+    first = rank < k
+    prefix_sums[groups[order][first], rank[first] + 1] = values[order][first]
+    prefix_sums = np.cumsum(prefix_sums, axis=1)
+    taken_per_group = np.minimum(sizes, k)
+
+    tree = cKDTree(points[order[starts]], balanced_tree=False, compact_nodes=False)
+    n_groups = min(k, len(sizes))
+    for start in range(0, len(queries), chunk_size):
+        _, neighbours = tree.query(queries[start:start + chunk_size], k=n_groups, workers=n_jobs)
+        neighbours = neighbours.reshape(-1, n_groups)
+        needed = np.full(len(neighbours), k)
+        total = np.zeros((len(neighbours), values.shape[1]))
+        for column in range(n_groups):
+            taken = np.minimum(taken_per_group[neighbours[:, column]], needed)
+            total += prefix_sums[neighbours[:, column], taken]
+            needed -= taken
+        means[start:start + chunk_size] = total / (k - needed)[:, None]
+    return means
+
+
+def indexed_knn_impute(X:np.ndarray, n_neighbors:int = 3, chunk_size:int = 10000, n_jobs:int = -1) -> np.ndarray:
+    """
+    Description: This function imputes every missing value with the mean of its nearest complete rows
+    =========================================================
+    X : feature matrix with nan for missing values
+    n_neighbors : donors averaged per missing value
+    chunk_size : rows queried at a time, bounds the memory of the neighbour indices
+    n_jobs : threads of each query, -1 uses every core
+    ========================================================
+    return imputed copy of X
+    """
+    try:
+        X = np.asarray(X, dtype=np.float64)
+        imputed = X.copy()
+        missing = np.isnan(X)
+        incomplete = missing.any(axis=1)
+        receivers = np.flatnonzero(incomplete)
+        if len(receivers) == 0:
+            return imputed
+        donors = X[~incomplete]
+        # without complete rows every missing value gets the mean of its column
+        column_means = np.nanmean(np.where(missing.all(axis=0), 0.0, X), axis=0)
+
+        patterns, pattern_index = np.unique(missing[receivers], axis=0, return_inverse=True)
+        pattern_index = pattern_index.reshape(-1)
+        for index, pattern in enumerate(patterns):
+            rows = receivers[pattern_index == index]
+            observed, missing_columns = np.flatnonzero(~pattern), np.flatnonzero(pattern)
+            if len(observed) == 0 or len(donors) == 0:
+                imputed[np.ix_(rows, missing_columns)] = column_means[missing_columns]
+                continue
+            imputed[np.ix_(rows, missing_columns)] = nearest_donor_means(
+                donors[:, observed], donors[:, missing_columns], X[np.ix_(rows, observed)],
+                n_neighbors=n_neighbors, chunk_size=chunk_size, n_jobs=n_jobs)
+        return imputed
+    except Exception as e:
+        raise ThyroidException(e, sys)
+
+
+def class_median_impute(X:np.ndarray, y:np.ndarray) -> np.ndarray:
+    # median within the class, the median of the whole column where a class has no value
+    df = pd.DataFrame(X)
+    df = df.fillna(df.groupby(np.asarray(y)).transform("median")).fillna(df.median())
+    return df.to_numpy(dtype=np.float64)
+
+
+def iterative_impute(X:np.ndarray, random_state:int = 42) -> np.ndarray:
+    from sklearn.experimental import enable_iterative_imputer  # noqa: F401
+    from sklearn.impute import IterativeImputer
+
+    imputer = IterativeImputer(max_iter=10, random_state=random_state, skip_complete=True)
+    return imputer.fit_transform(X)
+
+
+def impute(X:np.ndarray, y:Optional[np.ndarray] = None, strategy:str = "knn", n_neighbors:int = 3,
+           chunk_size:int = 10000, n_jobs:int = -1) -> np.ndarray:
+    """
+    Description: This function fills the missing values of X with the selected strategy
+    =========================================================
+    X : feature matrix with nan for missing values
+    y : target of every row, used by class_median
+    strategy : one of IMPUTATION_STRATEGIES
+    ========================================================
+    return imputed feature matrix
+    """
+    try:
+        X = np.asarray(X, dtype=np.float64)
+        logging.info(f"Imputing {int(np.isnan(X).sum())} missing values with the {strategy} strategy")
+        if strategy == "knn":
+            return knn_impute(X, n_neighbors=n_neighbors)
+        if strategy == "knn_indexed":
+            return indexed_knn_impute(X, n_neighbors=n_neighbors, chunk_size=chunk_size, n_jobs=n_jobs)
+        if strategy == "class_median":
+            return class_median_impute(X, y)
+        if strategy == "iterative":
+            return iterative_impute(X)
+        raise Exception(f"Unknown imputation strategy [{strategy}], expected one of {IMPUTATION_STRATEGIES}")
+    except Exception as e:
+        raise ThyroidException(e, sys)
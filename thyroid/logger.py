@@ -8,15 +8,24 @@ LOG_FILE_NAME = f"{datetime.now().strftime('%m_%d_%Y__%I_%M_%S')}.log"
 # directory name 
 LOG_FILE_DIR = os.path.join(os.getcwd(),"logs")
 
-# create folder if not exists
-os.makedirs(LOG_FILE_DIR, exist_ok=True)
-
 # Log file path 
 LOG_FILE_PATH = os.path.join(LOG_FILE_DIR, LOG_FILE_NAME)
 
+
+class LazyFileHandler(logging.FileHandler):
+    """
+    Creates the log folder and file with the first record instead of at import time
+    """
+    def __init__(self, filename:str):
+        super().__init__(filename, delay=True)
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.baseFilename), exist_ok=True)
+        return super()._open()
+
+
 logging.basicConfig(
-    filename=LOG_FILE_PATH, 
+    handlers=[LazyFileHandler(LOG_FILE_PATH)],
     format="[ %(asctime)s ] %(filename)s: %(lineno)d %(name)s - %(levelname)s - %(message)s", 
     level=logging.INFO
 )
-
@@ -0,0 +1,219 @@
+"""
+Bulk scoring of patient records with the latest model in saved_models.
+
+The input CSV or Parquet file is streamed in chunks and every chunk is scored by a pool
+of worker processes, each holding one copy of the model. Only a bounded number of chunks
+is in flight, so memory does not grow with the size of the input. Every scored chunk is
+written as its own part file and the parts are merged into the output at the end, an
+interrupted run picks up from the finished parts with --resume.
+
+    python -m thyroid.pipeline.batch_prediction --input records.csv --workers 8 --resume
+"""
+from thyroid.predictor import ModelResolver, ThyroidPredictor
+from thyroid.entity.config_entity import BatchPredictionConfig
+from thyroid.config import NUMERICAL_COLUMN
+from thyroid.exception import ThyroidException
+from thyroid.logger import logging
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Iterator, Optional, Tuple
+import pandas as pd
+import numpy as np
+import argparse
+import shutil
+import json
+import time
+import os, sys
+
+PREDICTION_COLUMN = "prediction"
+PROBABILITY_COLUMN_PREFIX = "probability_"
+MANIFEST_FILE_NAME = "_manifest.json"
+
+# predictor of a worker process, loaded once by the pool initializer
+_predictor:Optional[ThyroidPredictor] = None
+
+
+def _is_parquet(file_path:str) -> bool:
+    return os.path.splitext(file_path)[1].lower() in (".parquet", ".pq")
+
+
+def iter_input_chunks(file_path:str, chunk_size:int) -> Iterator[pd.DataFrame]:
+    if _is_parquet(file_path):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(file_path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas().replace("?", np.nan)
+    else:
+        yield from pd.read_csv(file_path, chunksize=chunk_size, na_values=["?"])
+
+
+def write_frame(df:pd.DataFrame, file_path:str):
+    # write next to the destination and rename, a part file either exists completely or not at all
+    temp_file_path = f"{file_path}.tmp"
+    if _is_parquet(file_path):
+        df.to_parquet(temp_file_path, index=False)
+    else:
+        df.to_csv(temp_file_path, index=False, header=True)
+    os.replace(temp_file_path, file_path)
+
+
+def _init_worker(model_dir:str, model_registry:str):
+    global _predictor
+    _predictor = ThyroidPredictor.from_model_dir(model_dir=model_dir, model_resolver=ModelResolver(model_registery=model_registry))
+    # the pool already uses every core, one thread per worker avoids oversubscription
+    _predictor.set_num_threads(1)
+
+
+def _score(df:pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    input_df = df.reindex(columns=_predictor.feature_names)
+    for column in NUMERICAL_COLUMN:
+        if column in input_df.columns:
+            input_df[column] = pd.to_numeric(input_df[column], errors="coerce")
+    return _predictor.predict_proba(input_df)
+
+
+def _score_chunk(chunk:pd.DataFrame, part_file_path:str) -> int:
+    classes = list(_predictor.target_encoder.classes_)
+    try:
+        labels, probabilities = _score(chunk)
+    except Exception:
+        # a record the model can not score fails the whole chunk, those records are left
+        # without a prediction and the rest of the chunk is scored in one go
+        labels = np.full(len(chunk), None, dtype=object)
+        probabilities = np.full((len(chunk), len(classes)), np.nan)
+        compiled_transformer = _predictor.compiled_transformer
+        if compiled_transformer is not None:
+            valid_rows = np.flatnonzero(~compiled_transformer.unknown_mask(chunk.reindex(columns=_predictor.feature_names)))
+            logging.info(f"{len(chunk) - len(valid_rows)} records with unknown categories can not be scored")
+            if len(valid_rows) > 0:
+                labels[valid_rows], probabilities[valid_rows] = _score(chunk.iloc[valid_rows])
+        else:
+            for row in range(len(chunk)):
+                try:
+                    row_labels, row_probabilities = _score(chunk.iloc[[row]])
+                    labels[row], probabilities[row] = row_labels[0], row_probabilities[0]
+                except Exception as e:
+                    logging.info(f"Record {chunk.index[row]} could not be scored: {e}")
+
+    output_df = chunk.copy()
+    output_df[PREDICTION_COLUMN] = labels
+    for index, class_name in enumerate(classes):
+        output_df[f"{PROBABILITY_COLUMN_PREFIX}{class_name}"] = probabilities[:, index]
+    write_frame(output_df, part_file_path)
+    return len(output_df)
+
+
+class BatchPrediction:
+    def __init__(self, batch_prediction_config:BatchPredictionConfig):
+        try:
+            logging.info(f"{'>'*30} Batch Prediction Initiated {'<'*30}")
+            self.batch_prediction_config = batch_prediction_config
+            self.model_resolver = ModelResolver(model_registery=batch_prediction_config.model_registry)
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def part_file_path(self, index:int) -> str:
+        extension = os.path.splitext(self.batch_prediction_config.output_file_path)[1] or ".csv"
+        return os.path.join(self.batch_prediction_config.parts_dir, f"part-{index:06d}{extension}")
+
+    def prepare_parts_dir(self, model_dir:str, resume:bool) -> dict:
+        """
+        Creates the parts directory, or checks that an existing one belongs to the same input and model
+        """
+        config = self.batch_prediction_config
+        stat = os.stat(config.input_file_path)
+        manifest = {
+            "input_file_path": os.path.abspath(config.input_file_path),
+            "input_size": stat.st_size,
+            "input_mtime": stat.st_mtime,
+            "chunk_size": config.chunk_size,
+            "model_dir": os.path.abspath(model_dir),
+        }
+        manifest_file_path = os.path.join(config.parts_dir, MANIFEST_FILE_NAME)
+        if os.path.exists(manifest_file_path):
+            if not resume:
+                raise Exception(f"Unfinished run found in [{config.parts_dir}], pass --resume or remove the directory")
+            with open(manifest_file_path) as file_obj:
+                previous = json.load(file_obj)
+            if previous != manifest:
+                raise Exception(f"Can not resume, input file, chunk size or model changed since the run in [{config.parts_dir}]")
+            return manifest
+
+        os.makedirs(config.parts_dir, exist_ok=True)
+        with open(manifest_file_path, "w") as file_obj:
+            json.dump(manifest, file_obj, indent=2)
+        return manifest
+
+    def merge_parts(self, n_parts:int):
+        output_file_path = self.batch_prediction_config.output_file_path
+        temp_file_path = f"{output_file_path}.tmp"
+        if _is_parquet(output_file_path):
+            import pyarrow.parquet as pq
+            writer = None
+            for index in range(n_parts):
+                table = pq.read_table(self.part_file_path(index))
+                if writer is None:
+                    writer = pq.ParquetWriter(temp_file_path, table.schema)
+                writer.write_table(table.cast(writer.schema))
+            if writer is not None:
+                writer.close()
+        else:
+            with open(temp_file_path, "wb") as output_obj:
+                for index in range(n_parts):
+                    with open(self.part_file_path(index), "rb") as part_obj:
+                        # keep the header of the first part only
+                        if index > 0:
+                            part_obj.readline()
+                        shutil.copyfileobj(part_obj, output_obj)
+        os.replace(temp_file_path, output_file_path)
+        shutil.rmtree(self.batch_prediction_config.parts_dir)
+
+    def initiate_batch_prediction(self, resume:bool = False) -> str:
+        try:
+            config = self.batch_prediction_config
+            model_dir = self.model_resolver.get_latest_dir_path()
+            if model_dir is None:
+                raise Exception(f"Model is not available")
+            logging.info(f"Scoring [{config.input_file_path}] with model [{model_dir}] "
+                         f"in chunks of {config.chunk_size} rows on {config.n_workers} workers")
+            self.prepare_parts_dir(model_dir=model_dir, resume=resume)
+
+            start = time.perf_counter()
+            n_parts, n_rows, n_skipped = 0, 0, 0
+            # at most two chunks per worker are held in memory at any time
+            max_pending = 2 * config.n_workers
+            pending = set()
+            with ProcessPoolExecutor(max_workers=config.n_workers, initializer=_init_worker,
+                                     initargs=(model_dir, config.model_registry)) as executor:
+                for index, chunk in enumerate(iter_input_chunks(config.input_file_path, config.chunk_size)):
+                    n_parts += 1
+                    part_file_path = self.part_file_path(index)
+                    if os.path.exists(part_file_path):
+                        n_skipped += 1
+                        continue
+                    pending.add(executor.submit(_score_chunk, chunk, part_file_path))
+                    if len(pending) >= max_pending:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        n_rows += sum(future.result() for future in done)
+                n_rows += sum(future.result() for future in pending)
+
+            self.merge_parts(n_parts=n_parts)
+            elapsed = time.perf_counter() - start
+            logging.info(f"Scored {n_rows} rows in {elapsed:.1f}s ({n_rows / max(elapsed, 1e-9):.0f} rows/s), "
+                         f"{n_skipped} chunks resumed, output: [{config.output_file_path}]")
+            return config.output_file_path
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--input", required=True, help="csv or parquet file with patient records")
+    parser.add_argument("--output", default=None, help="csv or parquet output file, default prediction/<input>_prediction")
+    parser.add_argument("--chunk-size", type=int, default=50000)
+    parser.add_argument("--workers", type=int, default=None, help="worker processes, default number of cores")
+    parser.add_argument("--resume", action="store_true", help="continue an interrupted run")
+    args = parser.parse_args()
+
+    batch_prediction_config = BatchPredictionConfig(input_file_path=args.input, output_file_path=args.output,
+                                                    chunk_size=args.chunk_size, n_workers=args.workers)
+    output_file_path = BatchPrediction(batch_prediction_config).initiate_batch_prediction(resume=args.resume)
+    print(f"Predictions written to: {output_file_path}")
@@ -0,0 +1,323 @@
+"""
+Training pipeline executor.
+
+The stages of main.py form a graph, every stage starts as soon as the stages it depends on
+finished, so validation and transformation run side by side:
+
+    ingestion -> validation ------------------------------------> pushing
+              -> transformation -> training -> evaluation --------^
+
+A cacheable stage is fingerprinted from the sha256 of the files it reads, its config (the
+paths into the run's artifact directory left out) and the source of its component and of
+every thyroid module it imports, directly or through other modules. When
+artifact/stage_cache.json has an artifact for that fingerprint whose files still exist,
+the stage is not run and the cached artifact, pointing into the earlier run's directory,
+is handed on. Ingestion reads the collection and pushing publishes, both always run; an
+unchanged collection gives byte identical splits, so everything in between is a cache hit.
+
+    python main.py              run, skipping stages with a cached artifact
+    python main.py --no-cache   run every stage
+
+artifact/<run>/run_summary.yaml lists every stage with its status (ran, cached, failed or
+skipped because a stage it depends on failed), its fingerprint and how long it took.
+"""
+from thyroid.artifact_store import ArtifactStore
+from thyroid.entity import config_entity, artifact_entity
+from thyroid.exception import ThyroidException
+from thyroid.logger import logging
+from thyroid.registry import MANIFEST_FILE_NAME, file_sha256
+from thyroid.utils import write_yaml_file
+from concurrent.futures import ThreadPoolExecutor, Future, FIRST_COMPLETED, wait
+from dataclasses import dataclass, field, asdict
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+import importlib.util
+import threading
+import hashlib
+import ast
+import json
+import time
+import os, sys
+
+STAGE_CACHE_FILE_NAME = "stage_cache.json"
+RUN_SUMMARY_FILE_NAME = "run_summary.yaml"
+
+
+@dataclass
+class Stage:
+    name:str
+    # run(artifacts of the finished stages) -> artifact of this stage
+    run:Callable[[Dict[str, object]], object]
+    depends_on:List[str] = field(default_factory=list)
+    config:object = None
+    component:type = None
+    # files read by the stage, from the artifacts of the finished stages
+    input_paths:Callable[[Dict[str, object]], List[str]] = None
+    cacheable:bool = True
+
+
+class StageCache:
+    """
+    artifact/stage_cache.json: stage name -> fingerprint -> artifact
+    """
+    def __init__(self, cache_file_path:str):
+        self.cache_file_path = cache_file_path
+        self._lock = threading.Lock()
+
+    def _load(self) -> dict:
+        if not os.path.exists(self.cache_file_path):
+            return {}
+        with open(self.cache_file_path) as file_obj:
+            return json.load(file_obj)
+
+    def get(self, stage_name:str, fingerprint:str) -> Optional[object]:
+        with self._lock:
+            entry = self._load().get(stage_name, {}).get(fingerprint)
+        if entry is None:
+            return None
+        # an artifact whose files were deleted is recomputed
+        for value in entry["artifact"].values():
+            if isinstance(value, str) and os.path.isabs(value) and not os.path.exists(value):
+                return None
+        return getattr(artifact_entity, entry["artifact_type"])(**entry["artifact"])
+
+    def put(self, stage_name:str, fingerprint:str, artifact:object, run_dir:str):
+        with self._lock:
+            cache = self._load()
+            cache.setdefault(stage_name, {})[fingerprint] = {
+                "artifact_type": type(artifact).__name__,
+                "artifact": asdict(artifact),
+                "run_dir": run_dir,
+                "created_at": datetime.now().isoformat(timespec="seconds"),
+            }
+            os.makedirs(os.path.dirname(self.cache_file_path), exist_ok=True)
+            temp_file_path = f"{self.cache_file_path}.{os.getpid()}.tmp"
+            with open(temp_file_path, "w") as file_obj:
+                json.dump(cache, file_obj, indent=2, default=str)
+            os.replace(temp_file_path, self.cache_file_path)
+
+
+def imported_package_modules(module_name:str, package:str = "thyroid") -> List[str]:
+    """
+    The module and every module of the package it imports, followed through the imports of
+    those modules. Imports inside functions count, the components import lazily.
+    """
+    modules, pending = set(), [module_name]
+    while pending:
+        name = pending.pop()
+        if name in modules:
+            continue
+        try:
+            spec = importlib.util.find_spec(name)
+        except ImportError:
+            # a name imported from a module, not a module
+            continue
+        if spec is None or spec.origin is None or not spec.origin.endswith(".py"):
+            continue
+        modules.add(name)
+        # the packages on the way are imported too
+        parent = name.rpartition(".")[0]
+        if parent:
+            pending.append(parent)
+        with open(spec.origin) as file_obj:
+            tree = ast.parse(file_obj.read(), filename=spec.origin)
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                names = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+                # from thyroid import utils imports the module thyroid.utils
+                names = [node.module] + [f"{node.module}.{alias.name}" for alias in node.names]
+            else:
+                continue
+            pending.extend(imported for imported in names if imported == package or imported.startswith(f"{package}."))
+    return sorted(modules)
+
+
+class TrainingPipeline:
+
+    def __init__(self, full_refresh:bool = False, use_cache:bool = True, collection=None, max_workers:int = 2,
+                validation_chunk_size:Optional[int] = None):
+        try:
+            self.training_pipeline_config = config_entity.TrainingPipelineConfig()
+            self.full_refresh = full_refresh
+            self.use_cache = use_cache
+            # collection to ingest instead of the configured mongo client, e.g. a mongomock collection
+            self.collection = collection
+            self.max_workers = max_workers
+            self.validation_chunk_size = validation_chunk_size
+            self.artifact_store = ArtifactStore()
+            self.stage_cache = StageCache(os.path.join(os.path.dirname(self.training_pipeline_config.artifact_dir),
+                                                       STAGE_CACHE_FILE_NAME))
+            self.run_summary_file_path = os.path.join(self.training_pipeline_config.artifact_dir, RUN_SUMMARY_FILE_NAME)
+            self._file_hashes:Dict[str, str] = {}
+            # artifact of every stage after a successful run
+            self.artifacts:Dict[str, object] = {}
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def get_stages(self) -> List[Stage]:
+        from thyroid.components.data_ingestion import DataIngestion
+        from thyroid.components.data_validation import DataValidation
+        from thyroid.components.data_transformation import DataTransformation
+        from thyroid.components.model_trainer import ModelTrainer
+        from thyroid.components.model_evaluation import ModelEvaluation
+        from thyroid.components.model_pusher import ModelPusher
+
+        pipeline_config = self.training_pipeline_config
+        store = self.artifact_store
+        data_ingestion_config = config_entity.DataIngestionConfig(training_pipeline_config=pipeline_config,
+                                                                  full_refresh=self.full_refresh)
+        data_validation_config = config_entity.DataValidationConfig(training_pipeline_config=pipeline_config,
+                                                                    chunk_size=self.validation_chunk_size)
+        data_transformation_config = config_entity.DataTransformationConfig(training_pipeline_config=pipeline_config)
+        model_trainer_config = config_entity.ModelTrainerConfig(training_pipeline_config=pipeline_config)
+        model_eval_config = config_entity.ModelEvaluationConfig(training_pipeline_config=pipeline_config)
+        model_pusher_config = config_entity.ModelPusherConfig(pipeline_config)
+
+        return [
+            Stage(name="data_ingestion", cacheable=False,
+                  run=lambda a: DataIngestion(data_ingestion_config=data_ingestion_config, collection=self.collection,
+                                              artifact_store=store).initiate_data_ingestion()),
+            Stage(name="data_validation", depends_on=["data_ingestion"],
+                  config=data_validation_config, component=DataValidation,
+                  input_paths=lambda a: [a["data_ingestion"].train_file_path, a["data_ingestion"].test_file_path,
+                                         data_validation_config.base_file_path],
+                  run=lambda a: DataValidation(data_validation_config=data_validation_config,
+                                               data_ingestion_artifact=a["data_ingestion"],
+                                               artifact_store=store).initiate_data_validation()),
+            Stage(name="data_transformation", depends_on=["data_ingestion"],
+                  config=data_transformation_config, component=DataTransformation,
+                  input_paths=lambda a: [a["data_ingestion"].train_file_path, a["data_ingestion"].test_file_path],
+                  run=lambda a: DataTransformation(data_transformation_config=data_transformation_config,
+                                                   data_ingestion_artifact=a["data_ingestion"],
+                                                   artifact_store=store).initiate_data_transformation()),
+            Stage(name="model_trainer", depends_on=["data_transformation"],
+                  config=model_trainer_config, component=ModelTrainer,
+                  input_paths=lambda a: [a["data_transformation"].transformed_train_path,
+                                         a["data_transformation"].transformed_test_path],
+                  run=lambda a: ModelTrainer(model_trainer_config=model_trainer_config,
+                                             data_transformation_artifact=a["data_transformation"],
+                                             artifact_store=store).initiate_model_trainer()),
+            # the registry manifest changes with every push, a new version is evaluated again
+            Stage(name="model_evaluation", depends_on=["data_ingestion", "data_transformation", "model_trainer"],
+                  config=model_eval_config, component=ModelEvaluation,
+                  input_paths=lambda a: [a["data_ingestion"].test_file_path, a["data_transformation"].transform_object_path,
+                                         a["data_transformation"].target_encoder_path, a["model_trainer"].model_path,
+                                         os.path.join(model_pusher_config.saved_model_dir, MANIFEST_FILE_NAME)],
+                  run=lambda a: ModelEvaluation(model_eval_config=model_eval_config,
+                                                data_ingestion_artifact=a["data_ingestion"],
+                                                data_transformation_artifact=a["data_transformation"],
+                                                model_trainer_artifact=a["model_trainer"],
+                                                artifact_store=store).initiate_model_evaluation()),
+            # a model is not published when the validation of its data failed
+            Stage(name="model_pusher", cacheable=False,
+                  depends_on=["data_ingestion", "data_validation", "data_transformation", "model_trainer", "model_evaluation"],
+                  run=lambda a: ModelPusher(model_pusher_config=model_pusher_config,
+                                            data_transformation_artifact=a["data_transformation"],
+                                            model_trainer_artifact=a["model_trainer"],
+                                            artifact_store=store,
+                                            data_ingestion_artifact=a["data_ingestion"]).initiate_model_pusher()),
+        ]
+
+    def _file_hash(self, file_path:str) -> Optional[str]:
+        if not os.path.exists(file_path):
+            return None
+        key = os.path.abspath(file_path)
+        if key not in self._file_hashes:
+            self._file_hashes[key] = file_sha256(file_path)
+        return self._file_hashes[key]
+
+    def fingerprint(self, stage:Stage, artifacts:Dict[str, object]) -> str:
+        """
+        sha256 of what the stage reads: its input files, its config and the source it runs
+        """
+        artifact_dir = self.training_pipeline_config.artifact_dir
+        # paths into the run's artifact directory change with every run, not the stage
+        config = {key: value for key, value in sorted(vars(stage.config).items())
+                  if not (isinstance(value, str) and value.startswith(artifact_dir))}
+        modules = imported_package_modules(stage.component.__module__)
+        description = {
+            "stage": stage.name,
+            "inputs": [self._file_hash(file_path) for file_path in stage.input_paths(artifacts)],
+            "config": config,
+            "source": {module: self._file_hash(importlib.util.find_spec(module).origin) for module in modules},
+        }
+        return hashlib.sha256(json.dumps(description, sort_keys=True, default=str).encode()).hexdigest()
+
+    def _run_stage(self, stage:Stage, artifacts:Dict[str, object]) -> dict:
+        start = time.perf_counter()
+        result = {"stage": stage.name, "status": "ran", "fingerprint": None}
+        if stage.cacheable:
+            result["fingerprint"] = self.fingerprint(stage, artifacts)
+            if self.use_cache:
+                artifact = self.stage_cache.get(stage.name, result["fingerprint"])
+                if artifact is not None:
+                    logging.info(f"Stage [{stage.name}] cache hit: {artifact}")
+                    result.update(status="cached", artifact=artifact, seconds=time.perf_counter() - start)
+                    return result
+
+        artifact = stage.run(artifacts)
+        if stage.cacheable:
+            self.stage_cache.put(stage.name, result["fingerprint"], artifact, run_dir=self.training_pipeline_config.artifact_dir)
+        result.update(artifact=artifact, seconds=time.perf_counter() - start)
+        return result
+
+    def run(self) -> dict:
+        """
+        Runs the stages, writes the run summary and returns it, raises the first stage failure
+        """
+        try:
+            stages = {stage.name: stage for stage in self.get_stages()}
+            artifacts:Dict[str, object] = {}
+            results:Dict[str, dict] = {}
+            running:Dict[Future, str] = {}
+            started:Dict[str, float] = {}
+            errors:List[BaseException] = []
+            start = time.perf_counter()
+
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                while len(results) < len(stages):
+                    # start every stage whose dependencies finished, skip those behind a failure,
+                    # get_stages lists the stages in dependency order
+                    for name, stage in stages.items():
+                        if name in results or name in running.values():
+                            continue
+                        if any(results.get(dependency, {}).get("status") in ("failed", "skipped") for dependency in stage.depends_on):
+                            results[name] = {"stage": name, "status": "skipped", "fingerprint": None, "seconds": 0.0}
+                        elif all(dependency in artifacts for dependency in stage.depends_on):
+                            started[name] = time.perf_counter()
+                            running[executor.submit(self._run_stage, stage, dict(artifacts))] = name
+                    if not running:
+                        if len(results) < len(stages):
+                            raise Exception(f"Stages depend on unknown stages: {sorted(set(stages) - set(results))}")
+                        break
+
+                    done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                    for future in done:
+                        name = running.pop(future)
+                        try:
+                            result = future.result()
+                            artifacts[name] = result.pop("artifact")
+                            results[name] = result
+                        except Exception as e:
+                            logging.info(f"Stage [{name}] failed: {e}")
+                            errors.append(e)
+                            results[name] = {"stage": name, "status": "failed", "fingerprint": None,
+                                             "seconds": time.perf_counter() - started[name], "error": str(e)}
+
+            summary = {
+                "run_dir": self.training_pipeline_config.artifact_dir,
+                "seconds": round(time.perf_counter() - start, 3),
+                "stages": [dict(results[name], seconds=round(results[name]["seconds"], 3)) for name in stages],
+                "artifact_store": self.artifact_store.stats(),
+            }
+            write_yaml_file(file_path=self.run_summary_file_path, data=summary)
+            for stage_summary in summary["stages"]:
+                logging.info(f"Stage [{stage_summary['stage']}] {stage_summary['status']} in {stage_summary['seconds']}s")
+
+            if errors:
+                raise errors[0]
+            self.artifacts = artifacts
+            return summary
+        except Exception as e:
+            raise ThyroidException(e, sys)
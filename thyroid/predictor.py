@@ -1,9 +1,16 @@
 import os, sys
-from thyroid.entity.config_entity import TRANSFORMER_OBJECT_FILE_NAME, FILE_NAME, MODEL_FILE_NAME, TARGET_ENCODER_OBJECT_FILE_NAME
+from thyroid.entity.config_entity import TRANSFORMER_OBJECT_FILE_NAME, FILE_NAME, MODEL_FILE_NAME, TARGET_ENCODER_OBJECT_FILE_NAME, MODEL_BUNDLE_FILE_NAME
 from glob import glob
-from typing import Optional
+from typing import Callable, Optional, List, Tuple
 from thyroid.exception import ThyroidException
 from thyroid.logger import logging
+from thyroid.config import NUMERICAL_COLUMN, CATEGORICAL_COLUMN
+from thyroid.utils import load_object
+from thyroid.serving.compiled_transformer import CompiledTransformer, try_compile_transformer
+from thyroid.registry import RegistryManifest, scan_versions
+import pandas as pd
+import numpy as np
+import time
 
 class ModelResolver:
     def __init__(self, model_registery:str = "saved_models",
@@ -16,26 +23,46 @@ class ModelResolver:
         self.transformer_dir_name = transformer_dir_name 
         self.target_encoder_dir_name = target_encoder_dir_name
         self.model_dir_name = model_dir_name
+        self.registry_manifest = RegistryManifest(registry_dir=self.model_registery)
 
     def get_latest_dir_path(self)->Optional[str]:
         try:
-            # get a list of all directories in the model registry
-            dir_names = os.listdir(self.model_registery)
-            
+            # the manifest answers with a single stat while it is unchanged
+            latest_version = self.registry_manifest.latest_version()
+            if latest_version is not None:
+                latest_dir = os.path.join(self.model_registery, f"{latest_version}")
+                if os.path.isdir(latest_dir):
+                    return latest_dir
+                logging.info(f"Latest version [{latest_dir}] of the manifest is missing, scanning the registry")
+
+            # registry without manifest, get the highest numbered directory
+            versions = scan_versions(self.model_registery)
+
             # if the model registry is empty, return None
-            if len(dir_names)==0:
+            if len(versions)==0:
                 return None
 
-            # map directory names to integers and get the maximum directory name
-            dir_names = list(map(int,dir_names))
-            latest_dir_name = max(dir_names)
-
             # return the path to the latest directory in the model registry
-            return os.path.join(self.model_registery, f"{latest_dir_name}")
+            return os.path.join(self.model_registery, f"{versions[-1]}")
         
         except Exception as e:
             raise ThyroidException(e, sys)
 
+    def get_latest_dir_paths(self, limit:int)->List[str]:
+        """
+        return the directories of the last `limit` versions, oldest first
+        """
+        try:
+            manifest = self.registry_manifest.load()
+            if manifest is not None:
+                versions = sorted(int(version) for version in manifest["versions"])
+            else:
+                versions = scan_versions(self.model_registery)
+            dir_paths = [os.path.join(self.model_registery, f"{version}") for version in versions[-limit:]]
+            return [dir_path for dir_path in dir_paths if os.path.isdir(dir_path)]
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
     def get_latest_model_path(self):
         try:
             latest_dir = self.get_latest_dir_path()
@@ -63,13 +90,30 @@ class ModelResolver:
         except Exception as e:
             raise ThyroidException(e, sys)
     
-    def get_latest_save_dir_path(self)->str:
+    def get_latest_bundle_path(self)->Optional[str]:
+        """
+        return the model bundle of the latest version, None if that version has only pickles
+        """
         try:
             latest_dir = self.get_latest_dir_path()
             if latest_dir is None:
+                raise Exception(f"Model is not available")
+            bundle_path = os.path.join(latest_dir, MODEL_BUNDLE_FILE_NAME)
+            return bundle_path if os.path.exists(bundle_path) else None
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def get_latest_save_dir_path(self)->str:
+        try:
+            # a new version is pushed rarely, scan as well so a directory missing from
+            # the manifest is never overwritten
+            versions = scan_versions(self.model_registery)
+            latest_version = self.registry_manifest.latest_version()
+            if latest_version is not None:
+                versions.append(latest_version)
+            if len(versions)==0:
                 return os.path.join(self.model_registery,f"{0}")
-            latest_dir_num = int(os.path.basename(self.get_latest_dir_path()))
-            return os.path.join(self.model_registery,f"{latest_dir_num+1}")
+            return os.path.join(self.model_registery,f"{max(versions)+1}")
         except Exception as e:
             raise ThyroidException(e, sys)
     
@@ -92,4 +136,198 @@ class ModelResolver:
             latest_dir = self.get_latest_save_dir_path()
             return os.path.join(latest_dir, self.target_encoder_dir_name, TARGET_ENCODER_OBJECT_FILE_NAME)
         except Exception as e:
-            raise ThyroidException(e, sys)
\ No newline at end of file
+            raise ThyroidException(e, sys)
+
+
+class ThyroidPredictor:
+    """
+    Scores patient records with one set of transformer, model and target encoder.
+    Every call runs the transformer -> model -> target encoder chain once over the
+    whole input frame, so a batch of records costs a single pass through each object.
+    The transformer is compiled into a numpy only encoder when possible.
+    """
+    def __init__(self, transformer, model, target_encoder, model_version:Optional[str]=None, compile_transformer:bool=True):
+        try:
+            self.transformer = transformer
+            if isinstance(transformer, CompiledTransformer):
+                self.compiled_transformer = transformer
+            else:
+                self.compiled_transformer = try_compile_transformer(transformer) if compile_transformer else None
+            self.model = model
+            self.target_encoder = target_encoder
+            self.model_version = model_version
+
+            # column order the transformer was fitted with
+            if self.compiled_transformer is not None:
+                self.feature_names = list(self.compiled_transformer.feature_names)
+            else:
+                self.feature_names = list(getattr(transformer, "feature_names_in_", CATEGORICAL_COLUMN + NUMERICAL_COLUMN))
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    @classmethod
+    def from_bundle(cls, bundle_path:str, model_version:Optional[str]=None) -> "ThyroidPredictor":
+        try:
+            from thyroid.serving.model_bundle import load_model_bundle
+            transformer, model, target_encoder, header = load_model_bundle(file_path=bundle_path)
+            logging.info(f"Loaded model bundle: [{bundle_path}]")
+            return cls(transformer=transformer, model=model, target_encoder=target_encoder,
+                        model_version=model_version or header["model_version"])
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    @classmethod
+    def from_model_dir(cls, model_dir:str, model_resolver:ModelResolver) -> "ThyroidPredictor":
+        try:
+            # a version with a bundle is loaded without unpickling
+            bundle_path = os.path.join(model_dir, MODEL_BUNDLE_FILE_NAME)
+            if os.path.exists(bundle_path):
+                try:
+                    return cls.from_bundle(bundle_path=bundle_path, model_version=os.path.basename(model_dir))
+                except Exception as e:
+                    logging.info(f"Model bundle [{bundle_path}] could not be loaded, loading the pickles: {e}")
+
+            # every path is derived from the same directory, so a version pushed
+            # while we are loading can not give us a mix of two versions
+            transformer = load_object(file_path=os.path.join(model_dir, model_resolver.transformer_dir_name, TRANSFORMER_OBJECT_FILE_NAME))
+            model = load_object(file_path=os.path.join(model_dir, model_resolver.model_dir_name, MODEL_FILE_NAME))
+            target_encoder = load_object(file_path=os.path.join(model_dir, model_resolver.target_encoder_dir_name, TARGET_ENCODER_OBJECT_FILE_NAME))
+            logging.info(f"Loaded transformer, model and target encoder from: [{model_dir}]")
+            return cls(transformer=transformer, model=model, target_encoder=target_encoder,
+                        model_version=os.path.basename(model_dir))
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    @classmethod
+    def from_model_resolver(cls, model_resolver:ModelResolver) -> "ThyroidPredictor":
+        try:
+            latest_dir = model_resolver.get_latest_dir_path()
+            if latest_dir is None:
+                raise Exception(f"Model is not available")
+            return cls.from_model_dir(model_dir=latest_dir, model_resolver=model_resolver)
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def validate_records(self, records, max_records:Optional[int]=None, max_errors:int=100) -> Tuple[Optional[pd.DataFrame], List[dict]]:
+        """
+        Validates a list of patient records against NUMERICAL_COLUMN and CATEGORICAL_COLUMN,
+        and the categories against the ones the transformer was fitted with
+        
+        records : list of dictonaries, one per patient
+        max_records : maximum number of records accepted in one call
+        max_errors : maximum number of errors reported back
+        ===========================================================================================
+        return (dataframe in transformer column order, []) if every record is valid else (None, errors)
+        """
+        try:
+            if not isinstance(records, list) or len(records) == 0:
+                return None, [{"error": "expected a non empty list of records"}]
+            if max_records is not None and len(records) > max_records:
+                return None, [{"error": f"batch contains {len(records)} records, maximum allowed is {max_records}"}]
+
+            errors = [{"index": index, "error": "record must be an object"}
+                        for index, record in enumerate(records) if not isinstance(record, dict)]
+            if len(errors) > 0:
+                return None, errors[:max_errors]
+
+            df = pd.DataFrame.from_records(records)
+
+            # a column which is absent from every record is reported once
+            missing_columns = [column for column in self.feature_names if column not in df.columns]
+            if len(missing_columns) > 0:
+                return None, [{"column": column, "error": "missing column"} for column in missing_columns]
+            df = df[self.feature_names]
+
+            for column in self.feature_names:
+                if column in NUMERICAL_COLUMN:
+                    # null values are allowed as the model handles missing numerical values
+                    values = pd.to_numeric(df[column], errors="coerce")
+                    # to_numeric reads true and false as 1 and 0
+                    invalid = (values.isna() & df[column].notna()) | df[column].map(lambda value: isinstance(value, (bool, np.bool_)))
+                    df[column] = values.astype(np.float64)
+                    message = "expected a number"
+                else:
+                    invalid = ~df[column].map(lambda value: isinstance(value, str))
+                    message = "expected a string"
+
+                for index in np.flatnonzero(invalid.to_numpy()):
+                    errors.append({"index": int(index), "column": column, "error": message})
+                    if len(errors) >= max_errors:
+                        return None, errors
+
+            if len(errors) > 0:
+                return None, errors
+
+            # a category unseen during fit would fail the transform of the whole batch
+            if self.compiled_transformer is not None:
+                for column, unknown in self.compiled_transformer.unknown_columns(df).items():
+                    for index in np.flatnonzero(unknown):
+                        errors.append({"index": int(index), "column": column,
+                                       "error": f"unknown category [{df[column].iat[index]}]"})
+                        if len(errors) >= max_errors:
+                            return None, errors
+            if len(errors) > 0:
+                return None, errors
+            return df, errors
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def predict(self, input_df:pd.DataFrame, observe:Optional[Callable[[str, float], None]]=None) -> np.ndarray:
+        """
+        input_df : dataframe with the transformer input columns
+        observe : optional callback receiving (stage name, seconds) for transform, predict and inverse_transform
+        """
+        try:
+            transformer = self.compiled_transformer or self.transformer
+            start = time.perf_counter()
+            input_arr = transformer.transform(input_df[self.feature_names])
+            transformed = time.perf_counter()
+            y_pred = self.model.predict(input_arr)
+            predicted = time.perf_counter()
+            prediction = self.target_encoder.inverse_transform(y_pred)
+
+            if observe is not None:
+                observe("transform", transformed - start)
+                observe("predict", predicted - transformed)
+                observe("inverse_transform", time.perf_counter() - predicted)
+            return prediction
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def predict_proba(self, input_df:pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        input_df : dataframe with the transformer input columns
+        ===========================================================================================
+        return (predicted class names, probability per class in the order of target_encoder.classes_)
+        """
+        try:
+            transformer = self.compiled_transformer or self.transformer
+            input_arr = transformer.transform(input_df[self.feature_names])
+            probabilities = self.model.predict_proba(input_arr)
+            # the most probable class, the model is not run a second time for its labels
+            y_pred = probabilities.argmax(axis=1)
+            if hasattr(self.model, "classes_"):
+                y_pred = np.asarray(self.model.classes_)[y_pred]
+            return self.target_encoder.inverse_transform(y_pred), probabilities
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def set_num_threads(self, num_threads:int):
+        """
+        Limits the threads the model uses for a prediction
+        """
+        try:
+            if hasattr(self.model, "set_params") and "n_jobs" in self.model.get_params():
+                self.model.set_params(n_jobs=num_threads)
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def warm_up(self):
+        """
+        Runs one prediction so lazy initialisation inside the model happens before live traffic
+        """
+        try:
+            if self.compiled_transformer is not None:
+                self.predict(self.compiled_transformer.sample_frame())
+        except Exception as e:
+            raise ThyroidException(e, sys)
@@ -0,0 +1,342 @@
+"""
+Manifest of the model registry (saved_models).
+
+saved_models/manifest.json indexes every pushed version with its creation time, metrics
+and the sha256 of each artifact, and records the latest version so the resolver does not
+have to list and parse the registry directory on every call. The file is replaced
+atomically and re-read only when it changed on disk.
+
+New versions are written into a staging directory and published with a single rename,
+so a version directory is never visible half written. Artifact files are kept once in
+saved_models/objects/<sha256> and hard linked into every version that uses them.
+
+    python -m thyroid.registry rebuild --registry saved_models
+    python -m thyroid.registry show
+    python -m thyroid.registry dedupe
+"""
+from thyroid.exception import ThyroidException
+from thyroid.logger import logging
+from datetime import datetime
+from typing import Dict, List, Optional
+import argparse
+import hashlib
+import threading
+import shutil
+import stat
+import uuid
+import json
+import os, sys
+
+MANIFEST_FILE_NAME = "manifest.json"
+MANIFEST_SCHEMA_VERSION = 1
+OBJECTS_DIR_NAME = "objects"
+STAGING_DIR_PREFIX = ".staging-"
+
+
+def file_sha256(file_path:str, block_size:int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file_obj:
+        for block in iter(lambda: file_obj.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def scan_versions(registry_dir:str) -> List[int]:
+    """
+    Version numbers of the registry directory, entries which are not a numbered directory are ignored
+    """
+    versions = []
+    for entry in os.scandir(registry_dir):
+        if entry.is_dir() and entry.name.isdigit():
+            versions.append(int(entry.name))
+    return sorted(versions)
+
+
+def link_or_copy(source:str, destination:str):
+    """
+    Hard links source to destination, copies when the file system does not support links
+    """
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+
+
+class ObjectStore:
+    """
+    Content addressed store of artifact files, saved_models/objects/<sha256>.
+    Stored files are read only, they are shared by every version linking to them.
+    """
+    def __init__(self, registry_dir:str):
+        self.objects_dir = os.path.join(registry_dir, OBJECTS_DIR_NAME)
+
+    def object_path(self, sha256:str) -> str:
+        return os.path.join(self.objects_dir, sha256)
+
+    def add(self, file_path:str, move:bool = False) -> str:
+        """
+        file_path : file to store, copied unless move is True
+        ===========================================================================================
+        return the sha256 of the file
+        """
+        try:
+            sha256 = file_sha256(file_path)
+            object_path = self.object_path(sha256)
+            if os.path.exists(object_path):
+                if move:
+                    os.remove(file_path)
+                return sha256
+
+            os.makedirs(self.objects_dir, exist_ok=True)
+            temp_file_path = os.path.join(self.objects_dir, f".tmp-{uuid.uuid4().hex}")
+            if move:
+                os.replace(file_path, temp_file_path)
+            else:
+                shutil.copyfile(file_path, temp_file_path)
+            os.chmod(temp_file_path, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+            # a concurrent add of the same content replaces it with identical bytes
+            os.replace(temp_file_path, object_path)
+            return sha256
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def link(self, file_path:str, destination:str, move:bool = False) -> dict:
+        """
+        Stores file_path and links the stored object to destination
+        ===========================================================================================
+        return manifest entry of the artifact, {"sha256": ..., "size": ...}
+        """
+        try:
+            sha256 = self.add(file_path, move=move)
+            if os.path.abspath(file_path) == os.path.abspath(destination) and os.path.exists(destination):
+                os.remove(destination)
+            link_or_copy(self.object_path(sha256), destination)
+            return {"sha256": sha256, "size": os.path.getsize(destination)}
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+
+def create_staging_dir(registry_dir:str) -> str:
+    staging_dir = os.path.join(registry_dir, f"{STAGING_DIR_PREFIX}{uuid.uuid4().hex}")
+    os.makedirs(staging_dir)
+    return staging_dir
+
+
+def publish_staging_dir(registry_dir:str, staging_dir:str, version:int, max_attempts:int = 100) -> int:
+    """
+    Renames a completely written staging directory to saved_models/<version>, the next free
+    number is taken when another pusher published the same version first
+    ===========================================================================================
+    return the published version
+    """
+    try:
+        for _ in range(max_attempts):
+            version_dir = os.path.join(registry_dir, str(version))
+            if not os.path.exists(version_dir):
+                try:
+                    os.rename(staging_dir, version_dir)
+                    return version
+                except OSError:
+                    # the directory was created between the check and the rename
+                    if not os.path.exists(version_dir):
+                        raise
+            version += 1
+        raise Exception(f"No free version number found in [{registry_dir}] after {max_attempts} attempts")
+    except Exception as e:
+        raise ThyroidException(e, sys)
+
+
+class RegistryManifest:
+
+    def __init__(self, registry_dir:str):
+        self.registry_dir = registry_dir
+        self.manifest_file_path = os.path.join(registry_dir, MANIFEST_FILE_NAME)
+        self._lock = threading.Lock()
+        self._cache:Optional[dict] = None
+        self._cache_key = None
+
+    def exists(self) -> bool:
+        return os.path.exists(self.manifest_file_path)
+
+    def load(self) -> Optional[dict]:
+        """
+        return the manifest, None if the registry has no manifest yet
+        """
+        try:
+            try:
+                file_stat = os.stat(self.manifest_file_path)
+            except FileNotFoundError:
+                return None
+            # the file is only ever replaced, so size and mtime identify its content
+            key = (file_stat.st_mtime_ns, file_stat.st_size, file_stat.st_ino)
+            with self._lock:
+                if self._cache_key != key:
+                    with open(self.manifest_file_path) as file_obj:
+                        self._cache = json.load(file_obj)
+                    self._cache_key = key
+                return self._cache
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def _write(self, manifest:dict):
+        temp_file_path = f"{self.manifest_file_path}.{os.getpid()}.tmp"
+        with open(temp_file_path, "w") as file_obj:
+            json.dump(manifest, file_obj, indent=2, sort_keys=True)
+            file_obj.flush()
+            os.fsync(file_obj.fileno())
+        os.replace(temp_file_path, self.manifest_file_path)
+
+    def latest_version(self) -> Optional[int]:
+        manifest = self.load()
+        if manifest is None:
+            return None
+        return manifest.get("latest")
+
+    def get_version(self, version:int) -> Optional[dict]:
+        manifest = self.load()
+        if manifest is None:
+            return None
+        return manifest["versions"].get(str(version))
+
+    def describe_version(self, version:int, metrics:Optional[Dict[str, float]] = None, created_at:Optional[str] = None) -> dict:
+        """
+        Entry of one version directory, with the sha256 of every file below it
+        """
+        try:
+            version_dir = os.path.join(self.registry_dir, str(version))
+            artifacts = {}
+            for dir_path, _, file_names in os.walk(version_dir):
+                for file_name in sorted(file_names):
+                    file_path = os.path.join(dir_path, file_name)
+                    artifacts[os.path.relpath(file_path, version_dir)] = {
+                        "sha256": file_sha256(file_path),
+                        "size": os.path.getsize(file_path),
+                    }
+            if created_at is None:
+                created_at = datetime.fromtimestamp(os.path.getmtime(version_dir)).isoformat()
+            return {"created_at": created_at, "metrics": metrics or {}, "artifacts": artifacts}
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def register(self, version:int, metrics:Optional[Dict[str, float]] = None, artifacts:Optional[Dict[str, dict]] = None) -> dict:
+        """
+        Adds a version directory which was just written to the manifest
+
+        version : number of the directory in the registry
+        metrics : e.g. f1 scores of the model
+        artifacts : {relative path: {"sha256", "size"}} when already known, hashed from disk otherwise
+        ===========================================================================================
+        return the manifest entry of the version
+        """
+        try:
+            if artifacts is None:
+                entry = self.describe_version(version, metrics=metrics, created_at=datetime.now().isoformat())
+            else:
+                entry = {"created_at": datetime.now().isoformat(), "metrics": metrics or {}, "artifacts": artifacts}
+            with self._lock:
+                manifest = self._read_or_new()
+                manifest["versions"][str(version)] = entry
+                manifest["latest"] = max(int(name) for name in manifest["versions"])
+                self._write(manifest)
+            logging.info(f"Registered model version [{version}] in [{self.manifest_file_path}]")
+            return entry
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def _read_or_new(self) -> dict:
+        if os.path.exists(self.manifest_file_path):
+            with open(self.manifest_file_path) as file_obj:
+                return json.load(file_obj)
+        return {"schema_version": MANIFEST_SCHEMA_VERSION, "latest": None, "versions": {}}
+
+    def rebuild(self) -> dict:
+        """
+        Recreates the manifest from the version directories on disk.
+        Creation time and metrics of versions already in the manifest are kept.
+        """
+        try:
+            with self._lock:
+                previous = self._read_or_new()["versions"]
+                versions = {}
+                for version in scan_versions(self.registry_dir):
+                    old = previous.get(str(version), {})
+                    versions[str(version)] = self.describe_version(version, metrics=old.get("metrics"),
+                                                                   created_at=old.get("created_at"))
+                manifest = {
+                    "schema_version": MANIFEST_SCHEMA_VERSION,
+                    "latest": max(map(int, versions)) if versions else None,
+                    "versions": versions,
+                }
+                self._write(manifest)
+            logging.info(f"Rebuilt [{self.manifest_file_path}] with {len(versions)} versions")
+            return manifest
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def verify(self) -> List[str]:
+        """
+        return the artifacts whose content no longer matches the manifest
+        """
+        try:
+            manifest = self.load() or {"versions": {}}
+            mismatches = []
+            for version, entry in manifest["versions"].items():
+                for relative_path, artifact in entry["artifacts"].items():
+                    file_path = os.path.join(self.registry_dir, version, relative_path)
+                    if not os.path.exists(file_path) or file_sha256(file_path) != artifact["sha256"]:
+                        mismatches.append(file_path)
+            return mismatches
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+
+def dedupe_registry(registry_dir:str) -> int:
+    """
+    Moves the artifact files of existing versions into the object store and links them back
+    ===========================================================================================
+    return bytes saved
+    """
+    try:
+        object_store = ObjectStore(registry_dir)
+        saved = 0
+        for version in scan_versions(registry_dir):
+            version_dir = os.path.join(registry_dir, str(version))
+            for dir_path, _, file_names in os.walk(version_dir):
+                for file_name in file_names:
+                    file_path = os.path.join(dir_path, file_name)
+                    if os.stat(file_path).st_nlink > 1:
+                        continue
+                    size = os.path.getsize(file_path)
+                    sha256 = file_sha256(file_path)
+                    if os.path.exists(object_store.object_path(sha256)):
+                        saved += size
+                    # link to a temporary name first, the artifact path never disappears
+                    object_store.add(file_path)
+                    temp_file_path = f"{file_path}.tmp"
+                    link_or_copy(object_store.object_path(sha256), temp_file_path)
+                    os.replace(temp_file_path, file_path)
+        return saved
+    except Exception as e:
+        raise ThyroidException(e, sys)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["rebuild", "show", "verify", "dedupe"])
+    parser.add_argument("--registry", default="saved_models", help="model registry directory")
+    args = parser.parse_args()
+
+    registry_manifest = RegistryManifest(registry_dir=args.registry)
+    if args.command == "rebuild":
+        manifest = registry_manifest.rebuild()
+        print(f"Indexed {len(manifest['versions'])} versions, latest: {manifest['latest']}")
+    elif args.command == "dedupe":
+        print(f"Saved {dedupe_registry(args.registry) / 1e6:.1f} MB")
+    elif args.command == "show":
+        print(json.dumps(registry_manifest.load(), indent=2))
+    else:
+        mismatches = registry_manifest.verify()
+        for file_path in mismatches:
+            print(f"Changed or missing: {file_path}")
+        sys.exit(1 if mismatches else 0)
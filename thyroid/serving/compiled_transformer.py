@@ -0,0 +1,278 @@
+from thyroid.exception import ThyroidException
+from thyroid.logger import logging
+from thyroid.utils import load_object
+from typing import Dict, List, Optional
+import pandas as pd
+import numpy as np
+import os, sys
+
+ORDINAL = "ordinal"
+ONEHOT = "onehot"
+PASSTHROUGH = "passthrough"
+
+
+def _is_missing(value) -> bool:
+    return value is None or value != value
+
+
+class CompiledTransformer:
+    """
+    Numpy only replacement of the fitted transformer pipeline.
+    The ordinal category maps and one hot vocabularies are held in plain dictonaries
+    and the output is laid out exactly like the ColumnTransformer output, so
+    transform() returns the same float64 matrix without the sklearn dispatch overhead.
+    """
+    def __init__(self, feature_names:List[str], blocks:List[dict]):
+        self.feature_names = list(feature_names)
+        self.blocks = blocks
+        self.n_features_out = sum(block["width"] for block in blocks)
+
+    def _encode(self, values:np.ndarray, column:str, table:dict, missing_code, unknown_code) -> np.ndarray:
+        # fast path, every value is a known category
+        codes = np.fromiter((table.get(value, -1) for value in values), dtype=np.float64, count=len(values))
+        for index in np.flatnonzero(codes < 0):
+            value = values[index]
+            if _is_missing(value) and missing_code is not None:
+                codes[index] = missing_code
+            elif unknown_code is not None:
+                codes[index] = unknown_code
+            else:
+                raise ValueError(f"Found unknown categories [{value}] in column [{column}] during transform")
+        return codes
+
+    def transform(self, X:pd.DataFrame) -> np.ndarray:
+        try:
+            if not isinstance(X, pd.DataFrame):
+                X = pd.DataFrame(X, columns=self.feature_names)
+
+            # one conversion up front, indexing a pandas frame per column costs more than the encoding
+            values = X.to_numpy(dtype=object)
+            position = {column: index for index, column in enumerate(X.columns)}
+
+            output = np.zeros((len(X), self.n_features_out), dtype=np.float64)
+            start = 0
+            for block in self.blocks:
+                if block["kind"] == PASSTHROUGH:
+                    output[:, start:start + block["width"]] = values[:, [position[column] for column in block["columns"]]]
+                elif block["kind"] == ORDINAL:
+                    for offset, column in enumerate(block["columns"]):
+                        output[:, start + offset] = self._encode(values[:, position[column]], column,
+                                                                 table=block["tables"][offset],
+                                                                 missing_code=block["missing_codes"][offset],
+                                                                 unknown_code=block["unknown_value"])
+                else:
+                    column_start = start
+                    for offset, column in enumerate(block["columns"]):
+                        # unknown categories are encoded as -1 and left as an all zero row
+                        codes = self._encode(values[:, position[column]], column,
+                                            table=block["tables"][offset],
+                                            missing_code=block["missing_codes"][offset],
+                                            unknown_code=-1 if block["ignore_unknown"] else None)
+                        rows = np.flatnonzero(codes >= 0)
+                        output[rows, column_start + codes[rows].astype(np.intp)] = 1.0
+                        column_start += len(block["tables"][offset])
+                start += block["width"]
+            return output
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def unknown_columns(self, X:pd.DataFrame) -> Dict[str, np.ndarray]:
+        """
+        Marks per column the rows with a category or missing value unseen during fit, for the
+        columns whose encoder does not accept unknown values
+        """
+        try:
+            masks = {}
+            for block in self.blocks:
+                if block["kind"] == PASSTHROUGH or block.get("unknown_value") is not None or block.get("ignore_unknown"):
+                    continue
+                for column, table, missing_code in zip(block["columns"], block["tables"], block["missing_codes"]):
+                    values = X[column].to_numpy(dtype=object)
+                    known = np.fromiter((value in table or (missing_code is not None and _is_missing(value)) for value in values),
+                                        dtype=bool, count=len(values))
+                    masks[column] = ~known
+            return masks
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def unknown_mask(self, X:pd.DataFrame) -> np.ndarray:
+        """
+        Marks the rows transform() would reject, i.e. with a category or missing value
+        unseen during fit in a column whose encoder does not accept unknown values
+        """
+        try:
+            mask = np.zeros(len(X), dtype=bool)
+            for column_mask in self.unknown_columns(X).values():
+                mask |= column_mask
+            return mask
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def sample_frame(self) -> pd.DataFrame:
+        """
+        Frame with every known category and a few numerical edge cases, including missing values
+        """
+        categories = {}
+        for block in self.blocks:
+            if block["kind"] == PASSTHROUGH:
+                continue
+            for column, table, missing_code in zip(block["columns"], block["tables"], block["missing_codes"]):
+                values = list(table.keys()) + ([np.nan] if missing_code is not None else [])
+                categories.setdefault(column, values)
+        numbers = [0.0, 1.5, np.nan, -2.25, 1e6, 37.0]
+        n_rows = max([len(numbers)] + [len(values) for values in categories.values()])
+        data = {}
+        for column in self.feature_names:
+            values = categories.get(column, numbers)
+            data[column] = [values[row % len(values)] for row in range(n_rows)]
+        return pd.DataFrame(data, columns=self.feature_names)
+
+
+    def to_dict(self) -> dict:
+        """
+        Plain, json serialisable description, every category table is stored as the list of
+        categories in code order
+        """
+        blocks = []
+        for block in self.blocks:
+            block = dict(block)
+            if "tables" in block:
+                block["tables"] = [[_to_builtin(category) for category in sorted(table, key=table.get)] for table in block.pop("tables")]
+            if block.get("unknown_value") is not None:
+                block["unknown_value"] = float(block["unknown_value"])
+            blocks.append(block)
+        return {"feature_names": [str(column) for column in self.feature_names], "blocks": blocks}
+
+    @classmethod
+    def from_dict(cls, description:dict) -> "CompiledTransformer":
+        blocks = []
+        for block in description["blocks"]:
+            block = dict(block)
+            if "tables" in block:
+                block["tables"] = [{category: float(code) for code, category in enumerate(categories)} for categories in block["tables"]]
+            blocks.append(block)
+        return cls(feature_names=description["feature_names"], blocks=blocks)
+
+
+def _to_builtin(value):
+    # numpy scalars -> python scalars
+    return value.item() if hasattr(value, "item") else value
+
+
+def _unwrap_pipeline(estimator):
+    # Pipeline(Pipeline(x)) -> x, only single step pipelines can be compiled
+    from sklearn.pipeline import Pipeline
+    while isinstance(estimator, Pipeline):
+        steps = [step for _, step in estimator.steps if step not in (None, "passthrough")]
+        if len(steps) != 1:
+            raise Exception(f"Can not compile a pipeline with {len(steps)} steps")
+        estimator = steps[0]
+    return estimator
+
+
+def _category_table(categories:np.ndarray) -> Dict:
+    return {category: float(code) for code, category in enumerate(categories) if not _is_missing(category)}
+
+
+def _missing_code(categories:np.ndarray, encoded_missing_value) -> Optional[float]:
+    # sklearn keeps nan as the last category when it was seen during fit
+    if len(categories) > 0 and _is_missing(categories[-1]):
+        return encoded_missing_value
+    return None
+
+
+def _compile_blocks(transformer) -> List[dict]:
+    from sklearn.compose import ColumnTransformer
+    from sklearn.preprocessing import OrdinalEncoder, OneHotEncoder
+
+    column_transformer = _unwrap_pipeline(transformer)
+    if not isinstance(column_transformer, ColumnTransformer):
+        raise Exception(f"Expected a ColumnTransformer, got {type(column_transformer).__name__}")
+    if column_transformer.sparse_output_:
+        raise Exception(f"Can not compile a ColumnTransformer with sparse output")
+
+    feature_names = list(column_transformer.feature_names_in_)
+    blocks = []
+    for name, estimator, columns in column_transformer.transformers_:
+        # remainder columns are stored as positions in the fitted frame
+        columns = [feature_names[column] if isinstance(column, (int, np.integer)) else column for column in columns]
+        if len(columns) == 0 or estimator == "drop":
+            continue
+        if estimator == "passthrough":
+            blocks.append({"kind": PASSTHROUGH, "columns": columns, "width": len(columns)})
+            continue
+
+        encoder = _unwrap_pipeline(estimator)
+        if getattr(encoder, "dtype", None) is not np.float64:
+            raise Exception(f"Can not compile [{name}] with dtype {getattr(encoder, 'dtype', None)}")
+
+        if isinstance(encoder, OrdinalEncoder):
+            if encoder.handle_unknown not in ("error", "use_encoded_value"):
+                raise Exception(f"Can not compile [{name}] with handle_unknown={encoder.handle_unknown}")
+            blocks.append({
+                "kind": ORDINAL,
+                "columns": columns,
+                "width": len(columns),
+                "tables": [_category_table(categories) for categories in encoder.categories_],
+                "missing_codes": [_missing_code(categories, encoder.encoded_missing_value) for categories in encoder.categories_],
+                "unknown_value": encoder.unknown_value if encoder.handle_unknown == "use_encoded_value" else None,
+            })
+        elif isinstance(encoder, OneHotEncoder):
+            if encoder.drop_idx_ is not None or getattr(encoder, "_infrequent_enabled", False):
+                raise Exception(f"Can not compile [{name}] with dropped or infrequent categories")
+            blocks.append({
+                "kind": ONEHOT,
+                "columns": columns,
+                "width": sum(len(categories) for categories in encoder.categories_),
+                "tables": [_category_table(categories) for categories in encoder.categories_],
+                # one hot encodes a missing value seen during fit as its own category
+                "missing_codes": [float(len(categories) - 1) if _missing_code(categories, 0.0) is not None else None
+                                  for categories in encoder.categories_],
+                "ignore_unknown": encoder.handle_unknown == "ignore",
+            })
+        else:
+            raise Exception(f"Can not compile [{name}] of type {type(encoder).__name__}")
+    return blocks
+
+
+def compile_transformer(transformer) -> CompiledTransformer:
+    """
+    Compiles a fitted transformer pipeline into a CompiledTransformer
+
+    transformer : fitted Pipeline(Pipeline(ColumnTransformer(...))) from DataTransformation
+    ===========================================================================================
+    return CompiledTransformer, raises if the pipeline uses anything which can not be compiled
+    or if the compiled output is not bit identical to the original on a probe frame
+    """
+    try:
+        compiled = CompiledTransformer(feature_names=transformer.feature_names_in_, blocks=_compile_blocks(transformer))
+
+        probe = compiled.sample_frame()
+        expected = transformer.transform(probe)
+        actual = compiled.transform(probe)
+        if not isinstance(expected, np.ndarray) or expected.dtype != actual.dtype \
+                or not np.array_equal(expected, actual, equal_nan=True):
+            raise Exception(f"Compiled transformer output differs from the fitted transformer")
+        return compiled
+    except Exception as e:
+        raise ThyroidException(e, sys)
+
+
+def compile_transformer_file(file_path:str) -> CompiledTransformer:
+    """
+    Compiles a fitted transformer.pkl, e.g. saved_models/<n>/transformer/transformer.pkl
+    """
+    try:
+        return compile_transformer(load_object(file_path=file_path))
+    except Exception as e:
+        raise ThyroidException(e, sys)
+
+
+def try_compile_transformer(transformer) -> Optional[CompiledTransformer]:
+    try:
+        compiled = compile_transformer(transformer)
+        logging.info(f"Using compiled transformer with {compiled.n_features_out} output features")
+        return compiled
+    except Exception as e:
+        logging.info(f"Transformer could not be compiled, using the fitted transformer: {e}")
+        return None
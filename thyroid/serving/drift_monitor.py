@@ -0,0 +1,331 @@
+from thyroid.entity.config_entity import REFERENCE_PROFILE_FILE_NAME
+from thyroid.exception import ThyroidException
+from thyroid.logger import logging
+from thyroid import drift
+from thyroid.config import CATEGORICAL_COLUMN, NUMERICAL_COLUMN
+from thyroid.utils import MISSING_VALUE_MARKER
+from typing import Deque, Dict, List, Optional, Tuple, Union
+from collections import deque
+from bisect import bisect_right
+import argparse
+import math
+import pandas as pd
+import numpy as np
+import threading
+import random
+import queue
+import time
+import os, sys
+
+
+class FeatureReference:
+    """
+    Fixed bins of one registry version, taken from the reference profile of its training split.
+    Numerical columns use the decile edges of the profile, the outer bins are open ended.
+    Categorical columns have one bin per category of the training split and a last bin for
+    categories it never saw.
+    """
+    def __init__(self, profile:dict, model_version:str):
+        self.model_version = model_version
+        # column -> inner bin edges, reference share per bin
+        self.numerical:Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        # column -> category -> bin, reference share per bin
+        self.categorical:Dict[str, Tuple[Dict[str, int], np.ndarray]] = {}
+        # the inner edges as lists for single records, a bisect is cheaper than a numpy call
+        self._edge_lists:Dict[str, List[float]] = {}
+        for column, sketch in profile["numerical"].items():
+            if len(sketch["bin_edges"]) > 1:
+                self.numerical[column] = (np.asarray(sketch["bin_edges"][1:-1], dtype=np.float64),
+                                          np.asarray(sketch["bin_shares"], dtype=np.float64))
+                self._edge_lists[column] = self.numerical[column][0].tolist()
+        for column, sketch in profile["categorical"].items():
+            frequencies = sketch["frequencies"]
+            total = max(sum(frequencies.values()), 1)
+            self.categorical[column] = ({category: index for index, category in enumerate(frequencies)},
+                                        np.array([count / total for count in frequencies.values()] + [0.0]))
+
+    @classmethod
+    def from_model_dir(cls, model_dir:str) -> Optional["FeatureReference"]:
+        profile = drift.load_reference_profile(os.path.join(model_dir, REFERENCE_PROFILE_FILE_NAME))
+        return cls(profile, model_version=os.path.basename(model_dir)) if profile is not None else None
+
+    def empty_counts(self) -> Dict[str, np.ndarray]:
+        counts = {column: np.zeros(len(shares), dtype=np.int64) for column, (_, shares) in self.numerical.items()}
+        counts.update({column: np.zeros(len(shares), dtype=np.int64) for column, (_, shares) in self.categorical.items()})
+        return counts
+
+    def add(self, input_df:pd.DataFrame, counts:Dict[str, np.ndarray], missing:Dict[str, int]):
+        """
+        Adds the records of input_df to the bin counts, a column missing from input_df counts as missing
+        """
+        for column, (inner_edges, _) in self.numerical.items():
+            if column not in input_df.columns:
+                missing[column] = missing.get(column, 0) + len(input_df)
+                continue
+            values = pd.to_numeric(input_df[column], errors="coerce").to_numpy(dtype=np.float64)
+            present = values[~np.isnan(values)]
+            counts[column] += np.bincount(np.searchsorted(inner_edges, present, side="right"), minlength=len(counts[column]))
+            missing[column] = missing.get(column, 0) + len(values) - len(present)
+        for column, (index, _) in self.categorical.items():
+            if column not in input_df.columns:
+                missing[column] = missing.get(column, 0) + len(input_df)
+                continue
+            values = input_df[column].dropna().astype(str)
+            bins = values.map(index).fillna(len(index)).to_numpy(dtype=np.int64)
+            counts[column] += np.bincount(bins, minlength=len(counts[column]))
+            missing[column] = missing.get(column, 0) + len(input_df) - len(values)
+
+    def add_records(self, records:List[dict], counts:Dict[str, np.ndarray], missing:Dict[str, int]):
+        """
+        Same as add for a few records as dictionaries, without building a dataframe
+        """
+        for record in records:
+            for column, inner_edges in self._edge_lists.items():
+                try:
+                    value = float(record.get(column))
+                except (TypeError, ValueError):
+                    value = math.nan
+                if math.isnan(value):
+                    missing[column] = missing.get(column, 0) + 1
+                else:
+                    counts[column][bisect_right(inner_edges, value)] += 1
+            for column, (index, _) in self.categorical.items():
+                value = record.get(column)
+                if value is None or (isinstance(value, float) and math.isnan(value)):
+                    missing[column] = missing.get(column, 0) + 1
+                else:
+                    counts[column][index.get(str(value), len(index))] += 1
+
+    def scores(self, counts:Dict[str, np.ndarray], missing:Dict[str, int]) -> Dict[str, dict]:
+        # PSI of every column with at least one value in the window
+        references = dict(self.numerical, **self.categorical)
+        result = {}
+        for column, column_counts in counts.items():
+            total = int(column_counts.sum())
+            result[column] = {"records": total, "missing": int(missing.get(column, 0)),
+                              "psi": drift.psi(references[column][1], column_counts / total) if total else None}
+        return result
+
+
+class DriftMonitor:
+    """
+    Population drift of the inputs arriving at the prediction endpoints.
+    The request thread only puts the input on a bounded queue, a background thread adds it to
+    fixed bin histograms of the current tumbling window. The bins come from the reference
+    profile published with the served version, so the work per record and the memory are
+    fixed: one count per bin and feature for the open window and the scores of the last
+    n_windows closed windows. A window is scored with the PSI of every feature against the
+    training split when it closes; the open window is scored on every read. When the queue is
+    full the input is dropped, a swap to a new version closes the window.
+    """
+    def __init__(self, model_registry:str, window_seconds:float = 300.0, n_windows:int = 12,
+                max_queue_size:int = 1000, sample_rate:float = 1.0, psi_threshold:float = 0.2, min_records:int = 100):
+        try:
+            self.model_registry = model_registry
+            self.window_seconds = window_seconds
+            self.n_windows = n_windows
+            self.max_queue_size = max_queue_size
+            self.sample_rate = sample_rate
+            self.psi_threshold = psi_threshold
+            # windows with fewer records are scored but never reported as drifted
+            self.min_records = min_records
+            self._queue:queue.Queue = queue.Queue(maxsize=max_queue_size)
+            self._lock = threading.Lock()
+            self._stats_lock = threading.Lock()
+            self._thread:Optional[threading.Thread] = None
+            self._pid:Optional[int] = None
+            self._reset()
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def _reset(self):
+        self.submitted = 0
+        self.dropped = 0
+        self.skipped = 0
+        self.errors = 0
+        self.records = 0
+        # records of versions published without a reference profile
+        self.unmonitored = 0
+        self._reference:Optional[FeatureReference] = None
+        self._reference_version:Optional[str] = None
+        self._windows:Deque[dict] = deque(maxlen=self.n_windows)
+        self._open_window(start=None)
+
+    def _open_window(self, start:Optional[float]):
+        self._window_start = start
+        self._window_records = 0
+        self._counts = self._reference.empty_counts() if self._reference is not None else {}
+        self._missing:Dict[str, int] = {}
+
+    def _window_summary(self, end:float) -> dict:
+        features = self._reference.scores(self._counts, self._missing)
+        scored = {column: result["psi"] for column, result in features.items() if result["psi"] is not None}
+        enough_records = self._window_records >= self.min_records
+        return {
+            "model_version": self._reference.model_version,
+            "start": self._window_start,
+            "end": end,
+            "records": self._window_records,
+            "max_psi": max(scored.values()) if scored else None,
+            "drifted_features": sorted(column for column, value in scored.items()
+                                       if enough_records and value > self.psi_threshold),
+            "features": features,
+        }
+
+    def _roll(self, now:float):
+        # closes the open window once its period is over, empty windows are not kept
+        start = now - now % self.window_seconds
+        if self._window_start == start:
+            return
+        if self._reference is not None and self._window_records > 0:
+            self._windows.appendleft(self._window_summary(end=min(now, self._window_start + self.window_seconds)))
+        self._open_window(start=start)
+
+    def _set_version(self, model_version:str, now:float):
+        reference = None
+        try:
+            reference = FeatureReference.from_model_dir(os.path.join(self.model_registry, model_version))
+        except Exception as e:
+            logging.info(f"Reference profile of model version [{model_version}] could not be read: {e}")
+        with self._lock:
+            self._roll(now)
+            if self._reference is not None and self._window_records > 0:
+                self._windows.appendleft(self._window_summary(end=now))
+            self._reference = reference
+            self._reference_version = model_version
+            self._open_window(start=now - now % self.window_seconds)
+        logging.info(f"Drift monitoring of model version [{model_version}]: "
+                     f"{'enabled' if reference is not None else 'no reference profile'}")
+
+    def _ensure_started(self):
+        # started on first use and again in a forked worker, threads do not survive a fork
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._queue = queue.Queue(maxsize=self.max_queue_size)
+                self._pid = os.getpid()
+                with self._stats_lock:
+                    self._reset()
+                self._thread = threading.Thread(target=self._run, name="drift-monitor", daemon=True)
+                self._thread.start()
+
+    def submit(self, records:Union[pd.DataFrame, List[dict]], model_version:Optional[str]):
+        """
+        Queues the inputs of a request, never blocks
+        """
+        try:
+            if model_version is None:
+                return
+            if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+                with self._stats_lock:
+                    self.skipped += 1
+                return
+            self._ensure_started()
+            try:
+                self._queue.put_nowait((records, model_version, time.time()))
+                with self._stats_lock:
+                    self.submitted += 1
+            except queue.Full:
+                with self._stats_lock:
+                    self.dropped += 1
+        except Exception as e:
+            # drift monitoring must never fail a live request
+            logging.info(f"Drift monitor submit failed: {e}")
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                self.observe(*item)
+            except Exception as e:
+                with self._stats_lock:
+                    self.errors += 1
+                logging.info(f"Drift monitoring failed: {e}")
+
+    def observe(self, records:Union[pd.DataFrame, List[dict]], model_version:str, now:Optional[float] = None):
+        """
+        Adds the inputs of one request to the histograms of the window they arrived in
+        """
+        now = time.time() if now is None else now
+        if model_version != self._reference_version:
+            self._set_version(model_version, now)
+        with self._lock:
+            self._roll(now)
+            monitored = self._reference is not None
+            if monitored:
+                if isinstance(records, pd.DataFrame):
+                    self._reference.add(records, self._counts, self._missing)
+                else:
+                    self._reference.add_records(records, self._counts, self._missing)
+                self._window_records += len(records)
+        with self._stats_lock:
+            if monitored:
+                self.records += len(records)
+            else:
+                self.unmonitored += len(records)
+
+    def stats(self) -> dict:
+        now = time.time()
+        with self._lock:
+            self._roll(now)
+            current = self._window_summary(end=now) if self._reference is not None else None
+            windows = list(self._windows)
+        with self._stats_lock:
+            return {
+                "model_version": self._reference_version,
+                "reference_profile": self._reference is not None,
+                "window_seconds": self.window_seconds,
+                "psi_threshold": self.psi_threshold,
+                "min_records": self.min_records,
+                "submitted": self.submitted,
+                "dropped": self.dropped,
+                "skipped": self.skipped,
+                "errors": self.errors,
+                "queued": self._queue.qsize(),
+                "records": self.records,
+                "unmonitored": self.unmonitored,
+                # open window first, then the closed windows from the most recent one
+                "current_window": current,
+                "windows": windows,
+            }
+
+
+def backfill_reference_profile(model_dir:str, data_file_path:str, sample_size:int = 1000, n_bins:int = 10) -> Optional[str]:
+    """
+    Writes reference_profile.json for a registry version pushed without one, from a dataset
+    standing in for its training split (e.g. the dataset it was trained on). Returns the path
+    of the written profile, None when the version already has one.
+    """
+    try:
+        profile_path = os.path.join(model_dir, REFERENCE_PROFILE_FILE_NAME)
+        if os.path.exists(profile_path):
+            return None
+        df = pd.read_csv(data_file_path, na_values=[MISSING_VALUE_MARKER], low_memory=False)
+        profile = drift.build_reference_profile(df, numerical_columns=[column for column in NUMERICAL_COLUMN if column in df.columns],
+                                                categorical_columns=[column for column in CATEGORICAL_COLUMN if column in df.columns],
+                                                sample_size=sample_size, n_bins=n_bins)
+        drift.save_reference_profile(profile, profile_path)
+        return profile_path
+    except Exception as e:
+        raise ThyroidException(e, sys)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Writes the reference profile of every registry version pushed without one, "
+                                                 "the server monitors drift only for versions with a profile")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    backfill_parser = subparsers.add_parser("backfill", help="profile every version without one from a dataset")
+    backfill_parser.add_argument("--registry", default="saved_models")
+    backfill_parser.add_argument("--data", default="hypothyroid.csv", help="dataset standing in for the training splits")
+    backfill_parser.add_argument("--sample-size", type=int, default=1000)
+    backfill_parser.add_argument("--bins", type=int, default=10)
+    args = parser.parse_args()
+
+    from thyroid.registry import RegistryManifest, scan_versions
+    for version in scan_versions(args.registry):
+        model_dir = os.path.join(args.registry, str(version))
+        profile_path = backfill_reference_profile(model_dir, args.data, sample_size=args.sample_size, n_bins=args.bins)
+        print(f"{model_dir}: {profile_path or 'profile exists'}")
+    # the profiles are new artifacts of their versions
+    RegistryManifest(registry_dir=args.registry).rebuild()
@@ -0,0 +1,295 @@
+from thyroid.exception import ThyroidException
+from thyroid.logger import logging
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from bisect import bisect_left
+import threading
+import uuid
+import json
+import time
+import os, sys
+
+# seconds, from half a millisecond to ten seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# number of records scored together
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 4096, 16384)
+
+
+def _escape_label_value(value) -> str:
+    # backslash, double quote and line feed are escaped in the text format
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(label_names:Sequence[str], label_values:Sequence[str], extra:str = "") -> str:
+    labels = [f'{name}="{_escape_label_value(value)}"' for name, value in zip(label_names, label_values)]
+    if extra:
+        labels.append(extra)
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+
+def _format_value(value:float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name:str, documentation:str, label_names:Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values:Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount:float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            series = [[list(label_values), value] for label_values, value in self._values.items()]
+        return {"type": "counter", "documentation": self.documentation, "label_names": list(self.label_names), "series": series}
+
+    def merge(self, snapshot:dict):
+        for label_values, value in snapshot["series"]:
+            self.inc(*label_values, amount=value)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label_values, value in self._values.items():
+                lines.append(f"{self.name}{_format_labels(self.label_names, label_values)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """
+    Fixed bucket histogram, an observation is one bisect and three additions under a lock
+    """
+    def __init__(self, name:str, documentation:str, label_names:Sequence[str] = (), buckets:Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        # label values -> [count per bucket (last one is +Inf), sum, count]
+        self._series:Dict[Tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value:float, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            series = [[list(label_values), list(bucket_counts), total, count]
+                      for label_values, (bucket_counts, total, count) in self._series.items()]
+        return {"type": "histogram", "documentation": self.documentation, "label_names": list(self.label_names),
+                "buckets": list(self.buckets), "series": series}
+
+    def merge(self, snapshot:dict):
+        with self._lock:
+            for label_values, bucket_counts, total, count in snapshot["series"]:
+                series = self._series.setdefault(tuple(label_values), [[0] * (len(self.buckets) + 1), 0.0, 0])
+                series[0] = [a + b for a, b in zip(series[0], bucket_counts)]
+                series[1] += total
+                series[2] += count
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_values, (bucket_counts, total, count) in self._series.items():
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float("inf"),), bucket_counts):
+                    cumulative += bucket_count
+                    le = "+Inf" if bound == float("inf") else _format_value(bound)
+                    labels = _format_labels(self.label_names, label_values, 'le="' + le + '"')
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(self.label_names, label_values)} {_format_value(total)}")
+                lines.append(f"{self.name}_count{_format_labels(self.label_names, label_values)} {count}")
+        return lines
+
+
+def remove_process_snapshots(multiprocess_dir:str, pid:int) -> int:
+    """
+    Removes the snapshot files of an exited process, called by the gunicorn master for
+    every worker that exits. Returns the number of files removed.
+    """
+    removed = 0
+    for file_name in os.listdir(multiprocess_dir):
+        if file_name.startswith(f"{pid}-"):
+            try:
+                os.remove(os.path.join(multiprocess_dir, file_name))
+                removed += 1
+            except OSError:
+                # removed meanwhile
+                continue
+    return removed
+
+
+def _is_alive(pid:int) -> bool:
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+
+class MetricsRegistry:
+    """
+    Holds the metrics of one process and renders them in the Prometheus text format.
+    Collectors are callables returning (name, type, documentation, [(labels, value)]) for
+    values owned by other objects, e.g. the prediction cache counters.
+
+    With a multiprocess_dir every process (gunicorn worker) writes a snapshot of its metrics
+    there every sync_interval seconds and render() merges the snapshots of all of them, so
+    whichever worker serves the scrape exports the same series: counters and histograms
+    summed over the workers, and the collector samples of the live workers with a worker
+    label. The snapshots of a worker are removed when it exits (remove_process_snapshots),
+    so the totals drop by its counts, which Prometheus treats as a counter reset.
+    """
+    def __init__(self, multiprocess_dir:Optional[str] = None, sync_interval:float = 1.0):
+        self._metrics:list = []
+        self._collectors:List[Callable[[], List[tuple]]] = []
+        self.multiprocess_dir = multiprocess_dir
+        self.sync_interval = sync_interval
+        self._snapshot_file_path:Optional[str] = None
+        self._sync_pid:Optional[int] = None
+        self._sync_lock = threading.Lock()
+
+    def counter(self, name:str, documentation:str, label_names:Sequence[str] = ()) -> Counter:
+        metric = Counter(name, documentation, label_names)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name:str, documentation:str, label_names:Sequence[str] = (), buckets:Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, label_names, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector:Callable[[], List[tuple]]):
+        self._collectors.append(collector)
+
+    def _collect(self) -> List[tuple]:
+        samples = []
+        for collector in self._collectors:
+            samples.extend(collector())
+        return samples
+
+    def snapshot(self) -> dict:
+        return {"pid": os.getpid(),
+                "metrics": {metric.name: metric.snapshot() for metric in self._metrics},
+                "collected": [[name, metric_type, documentation, [[dict(labels), value] for labels, value in samples]]
+                              for name, metric_type, documentation, samples in self._collect()]}
+
+    def write_snapshot(self):
+        """
+        Replaces the snapshot file of this process in multiprocess_dir
+        """
+        if self.multiprocess_dir is None:
+            return
+        with self._sync_lock:
+            if self._snapshot_file_path is None or self._sync_pid != os.getpid():
+                # a fresh name per process, a recycled pid must not overwrite the counts of an exited worker
+                self._sync_pid = os.getpid()
+                self._snapshot_file_path = os.path.join(self.multiprocess_dir, f"{self._sync_pid}-{uuid.uuid4().hex[:8]}.json")
+            temp_file_path = f"{self._snapshot_file_path}.tmp"
+            with open(temp_file_path, "w") as file_obj:
+                json.dump(self.snapshot(), file_obj, default=str)
+            os.replace(temp_file_path, self._snapshot_file_path)
+
+    def start_sync(self):
+        """
+        Writes the snapshot of this process every sync_interval seconds, called in every
+        forked worker, threads do not survive a fork
+        """
+        if self.multiprocess_dir is None:
+            return
+        os.makedirs(self.multiprocess_dir, exist_ok=True)
+
+        def sync():
+            while True:
+                try:
+                    self.write_snapshot()
+                except Exception as e:
+                    logging.info(f"Metrics snapshot could not be written: {e}")
+                time.sleep(self.sync_interval)
+
+        threading.Thread(target=sync, name="metrics-sync", daemon=True).start()
+
+    def _read_snapshots(self) -> List[dict]:
+        snapshots = []
+        for file_name in sorted(os.listdir(self.multiprocess_dir)):
+            if not file_name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.multiprocess_dir, file_name)) as file_obj:
+                    snapshots.append(json.load(file_obj))
+            except (OSError, ValueError):
+                # replaced or removed while listing
+                continue
+        return snapshots
+
+    def _render_samples(self, samples:List[tuple], lines:List[str]):
+        for name, metric_type, documentation, samples_of_metric in samples:
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for labels, value in samples_of_metric:
+                lines.append(f"{name}{_format_labels(list(labels.keys()), list(labels.values()))} {_format_value(value)}")
+
+    def _render_merged(self) -> List[str]:
+        self.write_snapshot()
+        merged = {}
+        collected:Dict[str, list] = {}
+        for snapshot in self._read_snapshots():
+            for name, metric_snapshot in snapshot["metrics"].items():
+                metric = merged.get(name)
+                if metric is None:
+                    if metric_snapshot["type"] == "counter":
+                        metric = Counter(name, metric_snapshot["documentation"], metric_snapshot["label_names"])
+                    else:
+                        metric = Histogram(name, metric_snapshot["documentation"], metric_snapshot["label_names"],
+                                           metric_snapshot["buckets"])
+                    merged[name] = metric
+                metric.merge(metric_snapshot)
+            if snapshot["pid"] == os.getpid() or _is_alive(snapshot["pid"]):
+                for name, metric_type, documentation, samples in snapshot["collected"]:
+                    entry = collected.setdefault(name, [name, metric_type, documentation, []])
+                    entry[3].extend((dict(labels, worker=snapshot["pid"]), value) for labels, value in samples)
+
+        lines = []
+        for metric in merged.values():
+            lines.extend(metric.render())
+        self._render_samples(list(collected.values()), lines)
+        return lines
+
+    def render(self) -> str:
+        try:
+            if self.multiprocess_dir is not None:
+                return "\n".join(self._render_merged()) + "\n"
+            lines = []
+            for metric in self._metrics:
+                lines.extend(metric.render())
+            self._render_samples(self._collect(), lines)
+            return "\n".join(lines) + "\n"
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+
+class StageTimer:
+    """
+    Records the time since the previous lap under the given stage name
+    """
+    def __init__(self, observe:Callable[[str, float], None]):
+        self.observe = observe
+        self._last = time.perf_counter()
+
+    def lap(self, stage:str):
+        now = time.perf_counter()
+        self.observe(stage, now - self._last)
+        self._last = now
@@ -0,0 +1,97 @@
+from thyroid.exception import ThyroidException
+from thyroid.logger import logging
+from concurrent.futures import Future
+from typing import Callable, List, Optional, Tuple
+import pandas as pd
+import numpy as np
+import threading
+import queue
+import time
+import os, sys
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent single record predictions into one matrix.
+    Requests are queued and flushed together when either max_batch_size rows
+    are waiting or max_wait_ms has passed since the first queued request,
+    every caller then receives only the rows it submitted, with the version of
+    the model that scored them, as predict_fn returns (model version, predictions).
+    """
+    def __init__(self, predict_fn:Callable[[pd.DataFrame], Tuple[str, np.ndarray]],
+                max_batch_size:int = 64,
+                max_wait_ms:float = 5.0):
+        try:
+            self.predict_fn = predict_fn
+            self.max_batch_size = max_batch_size
+            self.max_wait = max_wait_ms / 1000
+            self._queue:queue.Queue = queue.Queue()
+            self._lock = threading.Lock()
+            self._thread:Optional[threading.Thread] = None
+            self._pid:Optional[int] = None
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def _ensure_started(self):
+        # the flush thread is started on first use, and again in a forked child
+        # process as threads do not survive a fork
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+                self._thread.start()
+                logging.info(f"Micro batcher started with max batch size: [{self.max_batch_size}] "
+                            f"and window: [{self.max_wait * 1000}ms]")
+
+    def submit(self, input_df:pd.DataFrame) -> Future:
+        try:
+            self._ensure_started()
+            future:Future = Future()
+            self._queue.put((input_df, future))
+            return future
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def predict(self, input_df:pd.DataFrame, timeout:Optional[float]=None) -> Tuple[str, np.ndarray]:
+        return self.submit(input_df).result(timeout=timeout)
+
+    def _run(self):
+        while True:
+            # block until the first request of the next batch arrives
+            batch = [self._queue.get()]
+            rows = len(batch[0][0])
+            deadline = time.perf_counter() + self.max_wait
+
+            while rows < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                batch.append(item)
+                rows += len(item[0])
+
+            self._flush(batch)
+
+    def _flush(self, batch:List[Tuple[pd.DataFrame, Future]]):
+        try:
+            input_df = batch[0][0] if len(batch) == 1 else pd.concat([df for df, _ in batch], ignore_index=True)
+            model_version, predictions = self.predict_fn(input_df)
+        except Exception:
+            # score requests one by one so a single bad record does not fail the others
+            for df, future in batch:
+                try:
+                    future.set_result(self.predict_fn(df))
+                except Exception as e:
+                    future.set_exception(e)
+            return
+
+        offset = 0
+        for df, future in batch:
+            future.set_result((model_version, predictions[offset:offset + len(df)]))
+            offset += len(df)
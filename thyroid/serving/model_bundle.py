@@ -0,0 +1,271 @@
+"""
+Single file model bundle, loaded without unpickling.
+
+Layout of model.bundle:
+
+    8 bytes   magic b"THYBNDL1"
+    4 bytes   header length, little endian
+    n bytes   json header: format version, model version, input schema, compiled encoder
+              tables, target classes and the offset, length and sha256 of every section
+    padding   to 64 bytes
+    sections  the booster in XGBoost's native UBJSON format
+
+The file is memory mapped and the booster is read straight from the mapping, the
+encoders are rebuilt from the header as plain dictonaries.
+
+    python -m thyroid.serving.model_bundle convert --registry saved_models
+    python -m thyroid.serving.model_bundle inspect saved_models/2/model.bundle
+"""
+from thyroid.serving.compiled_transformer import CompiledTransformer, compile_transformer
+from thyroid.entity.config_entity import MODEL_BUNDLE_FILE_NAME, TRANSFORMER_OBJECT_FILE_NAME, MODEL_FILE_NAME, TARGET_ENCODER_OBJECT_FILE_NAME
+from thyroid.config import NUMERICAL_COLUMN, CATEGORICAL_COLUMN
+from thyroid.exception import ThyroidException
+from thyroid.logger import logging
+from datetime import datetime
+from typing import Optional, Tuple
+import numpy as np
+import argparse
+import hashlib
+import struct
+import json
+import mmap
+import os, sys
+
+BUNDLE_MAGIC = b"THYBNDL1"
+BUNDLE_FORMAT_VERSION = 1
+SECTION_ALIGNMENT = 64
+
+
+class BoosterModel:
+    """
+    XGBoost booster with the predict, predict_proba and n_jobs interface of the XGBClassifier it was saved from
+    """
+    def __init__(self, booster, objective:str, n_classes:int, iteration_range:Tuple[int, int] = (0, 0)):
+        self.booster = booster
+        self.objective = objective
+        self.n_classes_ = n_classes
+        self.iteration_range = tuple(iteration_range)
+        self.n_jobs = None
+
+    def get_params(self) -> dict:
+        return {"n_jobs": self.n_jobs}
+
+    def set_params(self, n_jobs:Optional[int] = None):
+        self.n_jobs = n_jobs
+        self.booster.set_param("nthread", n_jobs if n_jobs is not None else 0)
+        return self
+
+    def _predict(self, X:np.ndarray, output_margin:bool = False) -> np.ndarray:
+        return self.booster.inplace_predict(X, iteration_range=self.iteration_range,
+                                            predict_type="margin" if output_margin else "value")
+
+    def predict(self, X:np.ndarray) -> np.ndarray:
+        class_probs = self._predict(X)
+        if class_probs.ndim > 1 and self.n_classes_ != 2:
+            return np.argmax(class_probs, axis=1)
+        if self.objective == "multi:softmax":
+            return class_probs.astype(np.int32)
+        # binary:logistic
+        return (class_probs > 0.5).astype(np.int64)
+
+    def predict_proba(self, X:np.ndarray) -> np.ndarray:
+        if self.objective == "multi:softmax":
+            # same as scipy.special.softmax, which XGBClassifier uses
+            margin = self._predict(X, output_margin=True)
+            exp_margin = np.exp(margin - np.amax(margin, axis=1, keepdims=True))
+            return exp_margin / np.sum(exp_margin, axis=1, keepdims=True)
+        class_probs = self._predict(X)
+        if class_probs.ndim == 1:
+            return np.vstack((1 - class_probs, class_probs)).transpose()
+        return class_probs
+
+
+class LabelDecoder:
+    """
+    Inverse of the fitted LabelEncoder, only needs the class names
+    """
+    def __init__(self, classes):
+        self.classes_ = np.asarray(classes)
+
+    def inverse_transform(self, y) -> np.ndarray:
+        return self.classes_[np.asarray(y).astype(np.intp)]
+
+    def transform(self, y) -> np.ndarray:
+        position = {label: index for index, label in enumerate(self.classes_.tolist())}
+        return np.array([position[label] for label in y], dtype=np.int64)
+
+
+def _align(offset:int) -> int:
+    return (offset + SECTION_ALIGNMENT - 1) // SECTION_ALIGNMENT * SECTION_ALIGNMENT
+
+
+def _iteration_range(model) -> Tuple[int, int]:
+    # a model trained with early stopping predicts with the trees up to the best iteration
+    try:
+        return tuple(model._get_iteration_range(None))
+    except Exception:
+        return (0, 0)
+
+
+def write_model_bundle(file_path:str, transformer, model, target_encoder, model_version:Optional[str] = None) -> str:
+    """
+    Writes a fitted transformer, XGBClassifier and LabelEncoder into one bundle file
+
+    file_path : destination, written next to it first and renamed
+    ===========================================================================================
+    return file_path, raises if the transformer can not be compiled
+    """
+    try:
+        compiled = transformer if isinstance(transformer, CompiledTransformer) else compile_transformer(transformer)
+        booster_bytes = bytes(model.get_booster().save_raw("ubj"))
+
+        header = {
+            "format_version": BUNDLE_FORMAT_VERSION,
+            "model_version": model_version,
+            "created_at": datetime.now().isoformat(),
+            "schema": {
+                "feature_names": compiled.feature_names,
+                "numerical_columns": [column for column in compiled.feature_names if column in NUMERICAL_COLUMN],
+                "categorical_columns": [column for column in compiled.feature_names if column in CATEGORICAL_COLUMN],
+            },
+            "transformer": compiled.to_dict(),
+            "target_encoder": {"classes": [str(label) for label in target_encoder.classes_]},
+            "model": {
+                "format": "ubj",
+                "objective": model.objective,
+                "n_classes": int(model.n_classes_),
+                "iteration_range": list(_iteration_range(model)),
+            },
+        }
+
+        # the section offsets are part of the header, so size it with a placeholder first
+        sections = {"booster": booster_bytes}
+        header["sections"] = {name: {"offset": 0, "length": len(data), "sha256": hashlib.sha256(data).hexdigest()}
+                              for name, data in sections.items()}
+        header_size = len(json.dumps(header).encode()) + 64
+        offset = _align(len(BUNDLE_MAGIC) + 4 + header_size)
+        for name, data in sections.items():
+            header["sections"][name]["offset"] = offset
+            offset = _align(offset + len(data))
+        header_bytes = json.dumps(header).encode().ljust(header_size)
+
+        os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+        temp_file_path = f"{file_path}.tmp"
+        with open(temp_file_path, "wb") as file_obj:
+            file_obj.write(BUNDLE_MAGIC + struct.pack("<I", len(header_bytes)) + header_bytes)
+            for name, data in sections.items():
+                file_obj.write(b"\0" * (header["sections"][name]["offset"] - file_obj.tell()))
+                file_obj.write(data)
+        os.replace(temp_file_path, file_path)
+        logging.info(f"Model bundle written to: [{file_path}]")
+        return file_path
+    except Exception as e:
+        raise ThyroidException(e, sys)
+
+
+def read_bundle_header(file_path:str) -> dict:
+    try:
+        with open(file_path, "rb") as file_obj:
+            if file_obj.read(len(BUNDLE_MAGIC)) != BUNDLE_MAGIC:
+                raise Exception(f"[{file_path}] is not a model bundle")
+            header_length, = struct.unpack("<I", file_obj.read(4))
+            header = json.loads(file_obj.read(header_length))
+        if header["format_version"] > BUNDLE_FORMAT_VERSION:
+            raise Exception(f"Bundle format version {header['format_version']} is newer than the supported {BUNDLE_FORMAT_VERSION}")
+        return header
+    except Exception as e:
+        raise ThyroidException(e, sys)
+
+
+def load_model_bundle(file_path:str, verify:bool = False) -> Tuple[CompiledTransformer, BoosterModel, LabelDecoder, dict]:
+    """
+    file_path : model.bundle
+    verify : check the sha256 of every section
+    ===========================================================================================
+    return (transformer, model, target encoder, header)
+    """
+    try:
+        import xgboost
+
+        header = read_bundle_header(file_path)
+        with open(file_path, "rb") as file_obj:
+            with mmap.mmap(file_obj.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                section = header["sections"]["booster"]
+                # one copy out of the mapping, straight into the buffer xgboost parses
+                view = memoryview(mapped)[section["offset"]:section["offset"] + section["length"]]
+                try:
+                    booster_bytes = bytearray(view)
+                finally:
+                    view.release()
+        if verify and hashlib.sha256(booster_bytes).hexdigest() != section["sha256"]:
+            raise Exception(f"Booster section of [{file_path}] is corrupted")
+
+        booster = xgboost.Booster()
+        booster.load_model(booster_bytes)
+        model_header = header["model"]
+        model = BoosterModel(booster=booster, objective=model_header["objective"],
+                             n_classes=model_header["n_classes"], iteration_range=model_header["iteration_range"])
+        transformer = CompiledTransformer.from_dict(header["transformer"])
+        target_encoder = LabelDecoder(header["target_encoder"]["classes"])
+        return transformer, model, target_encoder, header
+    except Exception as e:
+        raise ThyroidException(e, sys)
+
+
+def convert_model_dir(model_dir:str, transformer_dir_name:str = "transformer", target_encoder_dir_name:str = "target_encoder",
+                      model_dir_name:str = "model") -> str:
+    """
+    Writes model.bundle for a registry version holding the three pickles and checks that
+    the bundle predicts exactly like them
+    """
+    try:
+        from thyroid.utils import load_object
+
+        transformer = load_object(file_path=os.path.join(model_dir, transformer_dir_name, TRANSFORMER_OBJECT_FILE_NAME))
+        model = load_object(file_path=os.path.join(model_dir, model_dir_name, MODEL_FILE_NAME))
+        target_encoder = load_object(file_path=os.path.join(model_dir, target_encoder_dir_name, TARGET_ENCODER_OBJECT_FILE_NAME))
+
+        bundle_file_path = os.path.join(model_dir, MODEL_BUNDLE_FILE_NAME)
+        write_model_bundle(bundle_file_path, transformer=transformer, model=model, target_encoder=target_encoder,
+                           model_version=os.path.basename(os.path.normpath(model_dir)))
+
+        bundle_transformer, bundle_model, bundle_target_encoder, _ = load_model_bundle(bundle_file_path, verify=True)
+        probe = bundle_transformer.sample_frame()
+        expected_input = transformer.transform(probe)
+        actual_input = bundle_transformer.transform(probe)
+        expected = target_encoder.inverse_transform(model.predict(expected_input))
+        actual = bundle_target_encoder.inverse_transform(bundle_model.predict(actual_input))
+        if not np.array_equal(expected, actual) or \
+                not np.allclose(model.predict_proba(expected_input), bundle_model.predict_proba(actual_input)):
+            os.remove(bundle_file_path)
+            raise Exception(f"Bundle of [{model_dir}] predicts differently from its pickles")
+        return bundle_file_path
+    except Exception as e:
+        raise ThyroidException(e, sys)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    convert_parser = subparsers.add_parser("convert", help="write model.bundle for every version of a registry")
+    convert_parser.add_argument("--registry", default="saved_models")
+    convert_parser.add_argument("--force", action="store_true", help="rewrite existing bundles")
+    inspect_parser = subparsers.add_parser("inspect", help="print the header of a bundle")
+    inspect_parser.add_argument("file_path")
+    args = parser.parse_args()
+
+    if args.command == "inspect":
+        header = read_bundle_header(args.file_path)
+        header["transformer"] = f"{len(header['transformer']['blocks'])} blocks"
+        print(json.dumps(header, indent=2))
+    else:
+        from thyroid.registry import RegistryManifest, scan_versions
+        registry_manifest = RegistryManifest(registry_dir=args.registry)
+        for version in scan_versions(args.registry):
+            model_dir = os.path.join(args.registry, str(version))
+            if os.path.exists(os.path.join(model_dir, MODEL_BUNDLE_FILE_NAME)) and not args.force:
+                print(f"{model_dir}: bundle exists")
+                continue
+            print(f"{model_dir}: {convert_model_dir(model_dir)}")
+        # the bundles are new artifacts of their versions
+        registry_manifest.rebuild()
@@ -0,0 +1,117 @@
+from thyroid.predictor import ModelResolver, ThyroidPredictor
+from thyroid.exception import ThyroidException
+from thyroid.logger import logging
+from datetime import datetime
+from typing import Optional
+import threading
+import time
+import os, sys
+
+
+class ModelManager:
+    """
+    Owns the predictor being served and swaps in newer registry versions without a restart.
+    A background thread polls the model registry, loads and warms a new version next to the
+    current one and then replaces the reference in a single assignment. Requests read the
+    predictor once, so in-flight requests finish on the version they started with.
+    Models are loaded single threaded until set_num_threads() is called, OpenMP hangs in a
+    forked worker when the parent process already ran a multi threaded prediction.
+    """
+    def __init__(self, model_resolver:ModelResolver, poll_interval:float = 30.0):
+        try:
+            self.model_resolver = model_resolver
+            self.poll_interval = poll_interval
+            self.num_threads = 1
+            self._predictor:Optional[ThyroidPredictor] = None
+            self._load_lock = threading.Lock()
+            self._thread_lock = threading.Lock()
+            self._thread:Optional[threading.Thread] = None
+            self._pid:Optional[int] = None
+            self.loaded_at:Optional[str] = None
+            self.last_checked_at:Optional[str] = None
+            self.last_error:Optional[str] = None
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    @property
+    def predictor(self) -> ThyroidPredictor:
+        predictor = self._predictor
+        if predictor is None:
+            raise Exception(f"Model is not available")
+        return predictor
+
+    @property
+    def model_version(self) -> Optional[str]:
+        predictor = self._predictor
+        return predictor.model_version if predictor is not None else None
+
+    @property
+    def is_ready(self) -> bool:
+        return self._predictor is not None
+
+    def load_latest(self) -> bool:
+        """
+        Loads the latest registry version if it differs from the one being served
+        ===========================================================================================
+        return True if a new version was swapped in
+        """
+        with self._load_lock:
+            self.last_checked_at = datetime.now().isoformat()
+            try:
+                latest_dir = self.model_resolver.get_latest_dir_path()
+                if latest_dir is None:
+                    return False
+                current = self._predictor
+                if current is not None and current.model_version == os.path.basename(latest_dir):
+                    return False
+
+                logging.info(f"Loading model version from: [{latest_dir}]")
+                predictor = ThyroidPredictor.from_model_dir(model_dir=latest_dir, model_resolver=self.model_resolver)
+                predictor.set_num_threads(self.num_threads)
+                predictor.warm_up()
+
+                # swap the reference, requests holding the previous predictor keep using it
+                self._predictor = predictor
+                self.loaded_at = datetime.now().isoformat()
+                self.last_error = None
+                logging.info(f"Serving model version: [{predictor.model_version}] "
+                            f"previous version: [{current.model_version if current else None}]")
+                return True
+            except Exception as e:
+                # a version which is still being written or is broken is retried on the next poll
+                self.last_error = str(e)
+                logging.info(f"Failed to load the latest model version, keep serving the current one: {e}")
+                return False
+
+    def set_num_threads(self, num_threads:int):
+        # applies to the served predictor and to every version loaded afterwards
+        with self._load_lock:
+            self.num_threads = num_threads
+            if self._predictor is not None:
+                self._predictor.set_num_threads(num_threads)
+
+    def start(self):
+        # the poll thread is started once per process, a forked worker starts its own
+        if self.poll_interval <= 0 or (self._thread is not None and self._pid == os.getpid()):
+            return
+        with self._thread_lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name="model-reloader", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.poll_interval)
+            self.load_latest()
+
+    def status(self) -> dict:
+        predictor = self._predictor
+        return {
+            "ready": predictor is not None,
+            "model_version": predictor.model_version if predictor else None,
+            "loaded_at": self.loaded_at,
+            "last_checked_at": self.last_checked_at,
+            "last_error": self.last_error,
+            "pid": os.getpid(),
+        }
@@ -0,0 +1,101 @@
+from thyroid.exception import ThyroidException
+from thyroid.config import NUMERICAL_COLUMN, CATEGORICAL_COLUMN
+from collections import OrderedDict
+from typing import Hashable, Mapping, Optional
+import threading
+import math
+import time
+import sys
+
+CACHE_KEY_COLUMNS = sorted(NUMERICAL_COLUMN + CATEGORICAL_COLUMN)
+
+
+class PredictionCache:
+    """
+    Bounded LRU cache with a time to live for predictions of single patient records.
+    Entries are scoped to a model version, the first lookup with a different version
+    drops every entry so a model swap invalidates the cache automatically.
+    """
+    def __init__(self, max_size:int = 10000, ttl_seconds:float = 300.0):
+        try:
+            self.max_size = max_size
+            self.ttl_seconds = ttl_seconds
+            self._entries:OrderedDict = OrderedDict()
+            self._lock = threading.Lock()
+            self._model_version:Optional[str] = None
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+            self.expirations = 0
+            self.invalidations = 0
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    @staticmethod
+    def make_key(record:Mapping) -> tuple:
+        """
+        Canonical encoding of the 21 input fields, numbers are compared as floats
+        so 41, 41.0 and "41" share an entry and every missing value maps to None
+        """
+        key = []
+        for column in CACHE_KEY_COLUMNS:
+            value = record.get(column)
+            if column in NUMERICAL_COLUMN:
+                value = None if value is None or value == "" else float(value)
+                if value is not None and math.isnan(value):
+                    value = None
+                elif value == 0:
+                    value = 0.0
+            elif value is not None:
+                value = str(value)
+            key.append(value)
+        return tuple(key)
+
+    def _check_version(self, model_version:str):
+        if model_version != self._model_version:
+            if len(self._entries) > 0:
+                self.invalidations += len(self._entries)
+                self._entries.clear()
+            self._model_version = model_version
+
+    def get(self, model_version:str, key:Hashable):
+        with self._lock:
+            self._check_version(model_version)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, model_version:str, key:Hashable, value):
+        with self._lock:
+            self._check_version(model_version)
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "model_version": self._model_version,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups > 0 else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,142 @@
+from thyroid.predictor import ThyroidPredictor
+from thyroid.exception import ThyroidException
+from thyroid.logger import logging
+from typing import Callable, Dict, Optional, Tuple
+import pandas as pd
+import numpy as np
+import threading
+import random
+import queue
+import time
+import os, sys
+
+
+class ShadowScorer:
+    """
+    Scores live traffic with a candidate model next to the served one.
+    The request thread only puts the input frame and the primary predictions on a bounded
+    queue, a background thread scores them with the shadow predictor and records how often
+    and where the two models disagree and how long each took. When the queue is full the
+    item is dropped, so a slow shadow model never delays a response.
+    """
+    def __init__(self, predictor:ThyroidPredictor, max_queue_size:int = 1000, sample_rate:float = 1.0,
+                observe:Optional[Callable[[str, str, float], None]] = None):
+        try:
+            self.predictor = predictor
+            self.max_queue_size = max_queue_size
+            self.sample_rate = sample_rate
+            # observe(model role, model version, seconds per record) for the latency histograms
+            self.observe = observe
+            self._queue:queue.Queue = queue.Queue(maxsize=max_queue_size)
+            self._lock = threading.Lock()
+            self._stats_lock = threading.Lock()
+            self._thread:Optional[threading.Thread] = None
+            self._pid:Optional[int] = None
+            self._reset_stats()
+        except Exception as e:
+            raise ThyroidException(e, sys)
+
+    def _reset_stats(self):
+        self.submitted = 0
+        self.dropped = 0
+        self.skipped = 0
+        self.errors = 0
+        self.batches = 0
+        self.records = 0
+        self.disagreements = 0
+        self.primary_seconds = 0.0
+        self.shadow_seconds = 0.0
+        # (primary prediction, shadow prediction) -> records
+        self.disagreement_pairs:Dict[Tuple[str, str], int] = {}
+
+    @property
+    def model_version(self) -> Optional[str]:
+        return self.predictor.model_version
+
+    def _ensure_started(self):
+        # started on first use and again in a forked worker, threads do not survive a fork
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._queue = queue.Queue(maxsize=self.max_queue_size)
+                self._pid = os.getpid()
+                with self._stats_lock:
+                    self._reset_stats()
+                self._thread = threading.Thread(target=self._run, name="shadow-scorer", daemon=True)
+                self._thread.start()
+                logging.info(f"Shadow scoring with model version: [{self.model_version}]")
+
+    def submit(self, input_df:pd.DataFrame, primary_predictions:np.ndarray, primary_seconds:float, primary_version:Optional[str]):
+        """
+        Queues a scored request for the shadow model, never blocks
+        """
+        try:
+            # the candidate became the served version, there is nothing to compare
+            if primary_version == self.model_version:
+                return
+            if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+                return
+            self._ensure_started()
+            try:
+                self._queue.put_nowait((input_df, primary_predictions, primary_seconds, primary_version))
+                with self._stats_lock:
+                    self.submitted += 1
+            except queue.Full:
+                with self._stats_lock:
+                    self.dropped += 1
+        except Exception as e:
+            # shadow scoring must never fail a live request
+            logging.info(f"Shadow scoring submit failed: {e}")
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                self._score(*item)
+            except Exception as e:
+                with self._stats_lock:
+                    self.errors += 1
+                logging.info(f"Shadow scoring failed: {e}")
+
+    def _score(self, input_df:pd.DataFrame, primary_predictions:np.ndarray, primary_seconds:float, primary_version:Optional[str]):
+        start = time.perf_counter()
+        shadow_predictions = self.predictor.predict(input_df)
+        shadow_seconds = time.perf_counter() - start
+
+        primary_predictions = np.asarray(primary_predictions)
+        disagree = primary_predictions != shadow_predictions
+        with self._stats_lock:
+            self.batches += 1
+            self.records += len(input_df)
+            self.disagreements += int(disagree.sum())
+            self.primary_seconds += primary_seconds
+            self.shadow_seconds += shadow_seconds
+            for primary, shadow in zip(primary_predictions[disagree], shadow_predictions[disagree]):
+                pair = (str(primary), str(shadow))
+                self.disagreement_pairs[pair] = self.disagreement_pairs.get(pair, 0) + 1
+
+        if self.observe is not None:
+            self.observe("primary", str(primary_version), primary_seconds / len(input_df))
+            self.observe("shadow", str(self.model_version), shadow_seconds / len(input_df))
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            batches = max(self.batches, 1)
+            return {
+                "shadow_model_version": self.model_version,
+                "submitted": self.submitted,
+                "dropped": self.dropped,
+                "errors": self.errors,
+                "queued": self._queue.qsize(),
+                "batches": self.batches,
+                "records": self.records,
+                "disagreements": self.disagreements,
+                "disagreement_rate": self.disagreements / self.records if self.records else 0.0,
+                "primary_mean_ms": self.primary_seconds / batches * 1000,
+                "shadow_mean_ms": self.shadow_seconds / batches * 1000,
+                # positive when the shadow model is slower
+                "latency_difference_ms": (self.shadow_seconds - self.primary_seconds) / batches * 1000,
+                "disagreement_pairs": [{"primary": primary, "shadow": shadow, "records": count}
+                                       for (primary, shadow), count in sorted(self.disagreement_pairs.items())],
+            }
@@ -3,12 +3,94 @@ from thyroid.logger import logging
 from thyroid.exception import ThyroidException
 import pandas as pd 
 import numpy as np 
-from thyroid.config import mongo_client
+from thyroid.config import get_mongo_client
+from typing import Iterable, Iterator
 import yaml
-import dill
 
 
-def get_collection_as_dataframe(database_name:str, collection_name:str)->pd.DataFrame:
+# value used for a missing measurement in the source data
+MISSING_VALUE_MARKER = "?"
+
+# deterministic key the bulk loader gives every row, not a feature
+ROW_KEY_FIELD = "_row_key"
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float, np.number)) and not isinstance(value, (bool, np.bool_))
+
+
+def iter_document_chunks(documents:Iterable[dict], batch_size:int=10000) -> Iterator[pd.DataFrame]:
+    """ 
+    Description: This function decodes documents into dataframes of at most batch_size rows
+    =========================================================
+    documents : iterable of documents, e.g. a cursor
+    batch_size : rows per dataframe
+    ========================================================
+    yield Pandas dataframe per batch, with "?" decoded as nan
+    """
+    try:
+        # columns and their type are taken from the first document, every row is decoded
+        # straight into a column buffer which is reused for the next batch
+        columns, buffers = None, {}
+        ignored_columns = set()
+        row = 0
+        for document in documents:
+            if columns is None:
+                columns = list(document.keys())
+                for column in columns:
+                    dtype = np.float64 if _is_number(document[column]) else object
+                    buffers[column] = np.empty(batch_size, dtype=dtype)
+
+            for column in columns:
+                value = document.get(column)
+                buffer = buffers[column]
+                if value is None or (isinstance(value, str) and value == MISSING_VALUE_MARKER):
+                    buffer[row] = np.nan
+                elif buffer.dtype == np.float64 and not _is_number(value):
+                    # a text value in a numerical column, the column is kept as text from now on
+                    buffer = buffers[column] = buffer.astype(object)
+                    buffer[row] = value
+                else:
+                    buffer[row] = value
+            if len(document) > len(columns):
+                ignored_columns.update(key for key in document.keys() if key not in buffers)
+
+            row += 1
+            if row == batch_size:
+                yield pd.DataFrame({column: buffers[column][:row] for column in columns}, columns=columns, copy=True)
+                row = 0
+
+        if row > 0:
+            yield pd.DataFrame({column: buffers[column][:row] for column in columns}, columns=columns, copy=True)
+        if ignored_columns:
+            logging.info(f"Fields missing from the first document were ignored: {sorted(ignored_columns)}")
+
+    except Exception as e: 
+        raise ThyroidException(e, sys)
+
+
+def iter_collection_chunks(database_name:str=None, collection_name:str=None, batch_size:int=10000, collection=None) -> Iterator[pd.DataFrame]:
+    """ 
+    Description: This function streams a collection as dataframes of at most batch_size rows
+    =========================================================
+    database_name : database name 
+    collection_name : collection name
+    batch_size : documents fetched per round trip and rows per dataframe
+    collection : collection object to read instead of the configured client, e.g. a mongomock collection
+    ========================================================
+    yield Pandas dataframe per batch, without "_id" and the row key, with "?" decoded as nan
+    """
+    try:
+        if collection is None:
+            collection = get_mongo_client()[database_name][collection_name]
+        cursor = collection.find({}, projection={"_id": 0, ROW_KEY_FIELD: 0}, batch_size=batch_size)
+        yield from iter_document_chunks(cursor, batch_size=batch_size)
+
+    except Exception as e: 
+        raise ThyroidException(e, sys)
+
+
+def get_collection_as_dataframe(database_name:str, collection_name:str, batch_size:int=10000, collection=None)->pd.DataFrame:
     """ 
     Description: This function return collection as dataframe
     =========================================================
@@ -21,15 +103,11 @@ def get_collection_as_dataframe(database_name:str, collection_name:str)->pd.Data
     try:
         logging.info(f"Reading data from database :[{database_name}] and collection : [{collection_name}]")
 
-        # creating dataframe from mongodb data
-        df:pd.DataFrame = pd.DataFrame(list(mongo_client[database_name][collection_name].find()))
+        # creating dataframe from mongodb data, "_id" is not fetched
+        chunks = list(iter_collection_chunks(database_name=database_name, collection_name=collection_name,
+                                             batch_size=batch_size, collection=collection))
+        df:pd.DataFrame = pd.concat(chunks, ignore_index=True) if len(chunks) > 0 else pd.DataFrame()
         logging.info(f"Data Loaded Successfully to pandas dataframe, size of the data: [{df.shape}]")
-
-        # dropping "_id" columns from dataframe 
-        if "_id" in df.columns:
-            logging.info(f"Removing the '_id' column from database")
-            df.drop("_id", axis=1, inplace=True)
-        
         return df 
 
     except Exception as e: 
@@ -73,6 +151,7 @@ def load_numpy_array_data(file_path: str) -> np.array:
 def save_object(file_path: str, obj: object) -> None:
     try:
         logging.info("Entered the save_object method of utils")
+        import dill
         os.makedirs(os.path.dirname(file_path), exist_ok=True)
         with open(file_path, "wb") as file_obj:
             dill.dump(obj, file_obj)
@@ -84,6 +163,7 @@ def load_object(file_path: str, ) -> object:
     try:
         if not os.path.exists(file_path):
             raise Exception(f"The file: {file_path} is not exists")
+        import dill
         with open(file_path, "rb") as file_obj:
             return dill.load(file_obj)
     except Exception as e: